@@ -0,0 +1,184 @@
+import atexit
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import profiler
+
+# Records every Sheets and Drive request made through a service built by shared_functions.Session: the API method, how
+# long it took, the bytes sent and received, which attempt it was and the phase of the run that made it. Phases are
+# per thread, so the tasks of the publish pipeline are told apart even though they run at the same time. Nothing is
+# recorded or printed unless tracing is enabled, in which case a summary is printed at exit and every request can also
+# be written to a JSONL file as it finishes.
+
+DEFAULT_PHASE = 'other'
+
+calls = []
+calls_lock = threading.Lock()
+phase_local = threading.local()
+trace_file = None
+enabled = False
+request_builder = None
+
+def get_phase():
+    return getattr(phase_local, 'phase', DEFAULT_PHASE)
+
+@contextmanager
+def phase(name):
+    """Tags the requests made by this thread inside the with block with the phase name, also timing it as a span."""
+    previous_phase = get_phase()
+    phase_local.phase = name
+    try:
+        with profiler.span(name):
+            yield
+    finally:
+        phase_local.phase = previous_phase
+
+def traced(name, function):
+    """Wraps a function so the requests it makes are tagged with the phase name, for threads and task schedulers."""
+    def traced_function(*args, **kwargs):
+        with phase(name):
+            return function(*args, **kwargs)
+    return traced_function
+
+def get_quota(uri, method):
+    if 'sheets.googleapis.com' in uri:
+        return 'sheets read' if method == 'GET' else 'sheets write'
+    return 'drive'
+
+def record(request, start_time, status, request_bytes, response_bytes, attempt):
+    if not enabled:
+        return
+    call = OrderedDict([
+        ('time', round(start_time, 3)),
+        ('phase', get_phase()),
+        ('method', request.methodId or request.method),
+        ('status', status),
+        ('latency_ms', round((time.time() - start_time) * 1000, 1)),
+        ('request_bytes', request_bytes),
+        ('response_bytes', response_bytes),
+        ('attempt', attempt),
+        ('quota', get_quota(request.uri, request.method))
+    ])
+    with calls_lock:
+        calls.append(call)
+        if trace_file is not None:
+            trace_file.write(json.dumps(call) + '\n')
+            trace_file.flush()
+
+def get_size(content):
+    return len(content) if content else 0
+
+def get_request_builder():
+    """Returns the HttpRequest subclass that records each request, for discovery's requestBuilder."""
+    global request_builder
+    if request_builder is not None:
+        return request_builder
+    from apiclient import errors
+    from apiclient.http import HttpRequest
+
+    class TracedHttpRequest(HttpRequest):
+        def __init__(self, http, postproc, uri, **kwargs):
+            HttpRequest.__init__(self, http, self.measure_response(postproc), uri, **kwargs)
+            # failed tries since the last one that went through, so chunks of an upload don't count as retries
+            self.failures = 0
+            self.response_bytes = 0
+
+        def measure_response(self, postproc):
+            def measured_postproc(response, content):
+                self.response_bytes = get_size(content)
+                return postproc(response, content)
+            return measured_postproc
+
+        def run(self, send, request_bytes):
+            attempt = self.failures + 1
+            self.response_bytes = 0
+            start_time = time.time()
+            try:
+                result = send()
+            except errors.HttpError as error:
+                self.failures += 1
+                record(self, start_time, error.resp.status, request_bytes, get_size(error.content), attempt)
+                raise
+            except Exception as error:
+                self.failures += 1
+                record(self, start_time, type(error).__name__, request_bytes, 0, attempt)
+                raise
+            self.failures = 0
+            record(self, start_time, 200, request_bytes, self.response_bytes, attempt)
+            return result
+
+        def execute(self, http=None, num_retries=0):
+            if self.resumable:
+                return HttpRequest.execute(self, http=http, num_retries=num_retries)
+            return self.run(lambda: HttpRequest.execute(self, http=http, num_retries=num_retries),
+                            get_size(self.body))
+
+        def next_chunk(self, http=None, num_retries=0):
+            remaining_bytes = max((self.resumable.size() or 0) - self.resumable_progress, 0)
+            if self.resumable.chunksize() != -1:
+                remaining_bytes = min(remaining_bytes, self.resumable.chunksize())
+            return self.run(lambda: HttpRequest.next_chunk(self, http=http, num_retries=num_retries),
+                            remaining_bytes)
+
+    request_builder = TracedHttpRequest
+    return request_builder
+
+def summarize(phase_calls=None):
+    """Totals the recorded requests by phase and API method.
+
+    Returns:
+        list of [phase, method, calls, retries, errors, total ms, slowest ms, bytes sent, bytes received] rows.
+    """
+    with calls_lock:
+        phase_calls = list(calls if phase_calls is None else phase_calls)
+    totals = OrderedDict()
+    for call in phase_calls:
+        total = totals.setdefault((call['phase'], call['method']),
+                                  [call['phase'], call['method'], 0, 0, 0, 0, 0, 0, 0])
+        total[2] += 1
+        total[3] += call['attempt'] > 1
+        total[4] += call['status'] != 200
+        total[5] += call['latency_ms']
+        total[6] = max(total[6], call['latency_ms'])
+        total[7] += call['request_bytes']
+        total[8] += call['response_bytes']
+    return [total[:5] + [int(total[5]), int(total[6])] + total[7:] for total in totals.values()]
+
+def report():
+    from tabulate import tabulate
+    with calls_lock:
+        phase_calls = list(calls)
+    if not phase_calls:
+        return 'No Google API requests were made.'
+    quota_totals = OrderedDict()
+    for call in phase_calls:
+        quota_totals[call['quota']] = quota_totals.get(call['quota'], 0) + 1
+    return '{}\n\n{} requests: {}'.format(
+        tabulate(summarize(phase_calls), headers=['Phase', 'Method', 'Calls', 'Retries', 'Errors', 'Total ms',
+                                                  'Slowest ms', 'Bytes sent', 'Bytes received']),
+        len(phase_calls), ', '.join('{} {}'.format(count, quota) for quota, count in quota_totals.items()))
+
+def print_report():
+    print('\n' + report())
+
+def enable(trace_path=None):
+    """Prints the summary of every request at exit, also writing each request to trace_path as JSON lines if given."""
+    global enabled, trace_file
+    if trace_path is not None and trace_file is None:
+        trace_file = open(trace_path, 'a')
+        atexit.register(trace_file.close)
+    if not enabled:
+        enabled = True
+        atexit.register(print_report)
+
+def add_arguments(parser):
+    parser.add_argument('--api-summary', action='store_true',
+                        help='print the Google API requests made by each phase when the program exits')
+    parser.add_argument('--api-trace', metavar='FILE',
+                        help='also append every Google API request to FILE as JSON lines')
+
+def enable_from_args(args):
+    if args.api_summary or args.api_trace:
+        enable(args.api_trace)
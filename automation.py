@@ -1,7 +1,29 @@
+import argparse
+import api_tracer
+import profiler
+import sys
 import excel_functions
-import google_drive_functions
 
 if __name__ == '__main__':
-    drive_service = google_drive_functions.create_permissive_service()
-    file_name = excel_functions.generate_workbook()
-    google_drive_functions.main(file_name, drive_service)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Input a league night's results and upload the league sheet.")
+    parser.add_argument('--startup-report', action='store_true',
+                        help='report how long it takes to get to the first prompt and exit')
+    parser.add_argument('--no-local-copy', action='store_true',
+                        help="upload the league sheet without saving the .xlsx file in this directory")
+    api_tracer.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args, _ = parser.parse_known_args()
+    api_tracer.enable_from_args(args)
+    profiler.enable_from_args(args)
+
+    if args.startup_report:
+        import startup_report
+        startup_report.main([arg for arg in sys.argv[1:] if arg != '--startup-report'])
+    results = excel_functions.enter_results(save_local_copy=not args.no_local_copy)
+    # Drive isn't contacted until every result has been typed in
+    import publish_pipeline
+    scheduler = publish_pipeline.publish_league(results['file_name'], results['league_data'], results['prize_points'],
+                                                workbook_data=results['workbook_data'],
+                                                drive_permission_check=results['drive_permission_check'])
+    if not scheduler.succeeded():
+        sys.exit(1)
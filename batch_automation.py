@@ -0,0 +1,154 @@
+import argparse
+import api_tracer
+import csv
+import json
+import os
+import profiler
+import sys
+import excel_functions
+import google_sheets_functions
+import publish_pipeline
+
+# Results files can either be JSON:
+#
+#   {"date": "9-10-23",
+#    "groups": [{"players": [{"name": "Jonathan Lian", "rating": 1800}, ...],
+#                "matches": ["3:1", "2:3", ...]}, ...]}
+#
+# or CSV with one record per row:
+#
+#   date,9-10-23
+#   player,1,Jonathan Lian,1800
+#   match,1,3:1
+#
+# Matches are listed in ResultSheet.match_ordering_selection order for the group size. Ratings may be left out for
+# players who are already in the semester's roster.
+
+def read_json_results(path):
+    with open(path) as results_file:
+        results = json.load(results_file)
+    groups = []
+    for group in results['groups']:
+        players = [(player['name'], player.get('rating')) for player in group['players']]
+        groups.append((players, group['matches']))
+    return results['date'], groups
+
+def read_csv_results(path):
+    date = None
+    players = {}
+    matches = {}
+    with open(path) as results_file:
+        for row in csv.reader(results_file):
+            row = [element.strip() for element in row]
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            record_type = row[0].lower()
+            if record_type == 'date':
+                date = row[1]
+            elif record_type == 'player':
+                rating = row[3] if len(row) > 3 and row[3] else None
+                players.setdefault(int(row[1]), []).append((row[2], rating))
+            elif record_type == 'match':
+                matches.setdefault(int(row[1]), []).append(row[2])
+            else:
+                raise ValueError('Unknown record type "{}" in {}.'.format(row[0], path))
+    if date is None:
+        raise ValueError('No date found in {}.'.format(path))
+    if sorted(players.keys()) != list(range(1, len(players) + 1)):
+        raise ValueError('Groups in {} must be numbered 1 to {}.'.format(path, len(players)))
+    groups = [(players[group_num], matches.get(group_num, [])) for group_num in sorted(players.keys())]
+    return date, groups
+
+def read_results(path):
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return read_csv_results(path)
+    return read_json_results(path)
+
+def construct_group_matches(groups, league_roster_dict):
+    group_matches = []
+    for index, (players, matches) in enumerate(groups):
+        group = excel_functions.Group(group_num=index + 1, num_players=len(players))
+        if not 3 <= group.num_players <= 7:
+            raise ValueError('{} has {} people; groups must have three to seven people.'
+                             .format(group.group_name, group.num_players))
+        for player_name, player_rating in players:
+            player_name = player_name.strip().title()
+            if player_rating is None or player_rating == '':
+                player_rating = league_roster_dict.get(player_name)
+                if player_rating is None:
+                    raise ValueError('No rating given for {} in {} and they are not in the roster.'
+                                     .format(player_name, group.group_name))
+            group.players.append(excel_functions.Player(player_name=player_name,
+                                                        player_rating=abs(int(player_rating))))
+        group.sort_ratings(0)
+
+        match_ordering = excel_functions.ResultSheet.match_ordering_selection[group.num_players]
+        if len(matches) != len(match_ordering):
+            raise ValueError('{} needs {} match scores but {} were given.'
+                             .format(group.group_name, len(match_ordering), len(matches)))
+        group_matches.append((group, [excel_functions.format_match_input(str(match)) for match in matches]))
+    return group_matches
+
+def build_workbook(results_path, load_league_data=True, save_local_copy=True):
+    """Builds the workbook for a results file, loading the semester's roster first unless load_league_data is False.
+
+    Returns:
+        dict with the workbook's file_name and workbook_data (the .xlsx file's contents), the league_data it was built
+        from (None when it wasn't loaded), its prize_points and the Sheets service. The workbook is only saved to
+        file_name if save_local_copy is set.
+    """
+    date, groups = read_results(results_path)
+    name = excel_functions.format_date_input(date)
+    all_info, workbook, file_name = excel_functions.set_up_workbook(name)
+    summary_sheet = excel_functions.set_up_summary_sheet(workbook, all_info['summary_info'])
+
+    service = None
+    league_data = None
+    league_roster_dict = {}
+    if load_league_data:
+        # read from the mirror on this computer, which is synced with Sheets in the background
+        ratings_sheet_name = excel_functions.get_ratings_sheet_name(file_name)
+        prefetch = google_sheets_functions.LeagueDataPrefetch(
+            ratings_sheet_name, excel_functions.get_prize_points_sheet_name(ratings_sheet_name))
+        prefetch.start()
+        service, ratings_values, prize_points_values = prefetch.get()
+        league_data = excel_functions.load_league_data(service, file_name, ratings_values, prize_points_values)
+        league_roster_dict = league_data['league_roster_dict']
+
+    group_matches = construct_group_matches(groups, league_roster_dict)
+    prize_points = excel_functions.write_results(workbook, summary_sheet, all_info['results_info'], group_matches,
+                                                 league_roster_dict)
+    workbook_data = excel_functions.close_workbook(workbook, file_name if save_local_copy else None)
+    return {'file_name': file_name, 'workbook_data': workbook_data, 'league_data': league_data,
+            'prize_points': prize_points, 'service': service}
+
+def generate_workbook(results_path, update_sheets=True):
+    results = build_workbook(results_path, load_league_data=update_sheets)
+    if update_sheets:
+        excel_functions.update_sheets(results['service'], results['file_name'], results['league_data'],
+                                      results['prize_points'])
+    return results['file_name']
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a league workbook from a JSON or CSV results file.')
+    parser.add_argument('results_file', help='JSON or CSV file with the date, groups, ratings and match scores')
+    parser.add_argument('--offline', action='store_true',
+                        help='only generate the .xlsx file without touching Google Sheets or Google Drive')
+    parser.add_argument('--no-local-copy', action='store_true',
+                        help='upload the league sheet without saving the .xlsx file in this directory')
+    api_tracer.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args, _ = parser.parse_known_args()
+    api_tracer.enable_from_args(args)
+    profiler.enable_from_args(args)
+
+    if args.offline:
+        file_name = generate_workbook(args.results_file, update_sheets=False)
+    else:
+        results = build_workbook(args.results_file, save_local_copy=not args.no_local_copy)
+        file_name = results['file_name']
+        scheduler = publish_pipeline.publish_league(file_name, results['league_data'], results['prize_points'],
+                                                    workbook_data=results['workbook_data'])
+        if not scheduler.succeeded():
+            sys.exit(1)
+    print('Generated {}'.format(file_name))
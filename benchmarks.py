@@ -0,0 +1,412 @@
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from timeit import default_timer
+
+import config
+
+# Every Sheets and Drive request made while benchmarking goes to the in-process fake backend, never to Google, so this
+# has to happen before anything reads config.CURRENT_ENV.
+config.CURRENT_ENV = config.FAKE_ENV
+
+import batch_automation
+import excel_functions
+import fake_google_backend
+import google_sheets_functions
+import publish_pipeline
+import rating_engine
+import shared_functions
+import sheets_mirror
+
+# Times the parts of a league night on synthetic leagues, from a single group with a 50 player roster up to 200
+# groups, a 20,000 player roster and a 30 night season, and prints the results as JSON so that runs of different
+# versions can be compared with --compare. Each league night of the end to end benchmark is run the way
+# batch_automation.py runs it, against the fake backend, with the caches that only last for one run of the program
+# cleared in between.
+
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 1
+DEFAULT_REGRESSION_THRESHOLD = 1.25 # slower than this many times the old median counts as a regression
+NEWCOMER_RATE = 0.05 # fraction of a league night's players who aren't in the roster yet
+UNPLAYED_MATCH_RATE = 0.02
+FIRST_LEAGUE_DATE = datetime.date(2023, 8, 21)
+DAYS_BETWEEN_LEAGUES = 4 # keeps a 30 night season inside the fall semester
+
+SCALES = OrderedDict([
+    ('small', {'groups': 1, 'roster': 50, 'nights': 1}),
+    ('typical', {'groups': 8, 'roster': 300, 'nights': 12}),
+    ('large', {'groups': 50, 'roster': 2000, 'nights': 20}),
+    ('huge', {'groups': 200, 'roster': 20000, 'nights': 30})
+])
+
+BENCHMARKS = ['rating_calc', 'get_match_winner', 'construct_sheet', 'result_sheet', 'summary_sheet', 'workbook_close',
+              'get_league_roster', 'get_prize_points', 'end_to_end']
+
+def make_roster(size, rng):
+    return [('Player {:05d}'.format(index), rng.randint(800, 2400)) for index in range(1, size + 1)]
+
+def make_matches(num_players, rng):
+    matches = []
+    for _ in rating_engine.match_ordering_selection[num_players]:
+        if rng.random() < UNPLAYED_MATCH_RATE:
+            matches.append('0:0')
+        else:
+            score = [3, rng.randint(0, 2)]
+            rng.shuffle(score)
+            matches.append('{}:{}'.format(*score))
+    return matches
+
+def make_league_night(roster, num_groups, rng, night=1):
+    """Makes up the results of a league night in the format batch_automation reads.
+
+    Groups have three to seven players, mostly drawn from the roster with a few newcomers, and are seeded by rating
+    so the strongest players are at the first table. Only the newcomers' ratings are given.
+
+    Returns:
+        list of (players, matches) tuples, players being (name, rating) tuples.
+    """
+    group_sizes = [rng.randint(3, 7) for _ in range(num_groups)]
+    num_newcomers = int(sum(group_sizes) * NEWCOMER_RATE)
+    if sum(group_sizes) - num_newcomers > len(roster):
+        raise ValueError('A roster of {} players is too small for {} groups.'.format(len(roster), num_groups))
+    players = [(name, rating, False) for name, rating in rng.sample(roster, sum(group_sizes) - num_newcomers)]
+    players.extend(('Newcomer {:02d}-{:04d}'.format(night, index), rng.randint(800, 2400), True)
+                   for index in range(1, num_newcomers + 1))
+    players.sort(key=lambda player: player[1], reverse=True)
+
+    groups = []
+    start = 0
+    for group_size in group_sizes:
+        group_players = [(name, rating if is_newcomer else None)
+                         for name, rating, is_newcomer in players[start:start + group_size]]
+        groups.append((group_players, make_matches(group_size, rng)))
+        start += group_size
+    return groups
+
+def get_league_date(night):
+    date = FIRST_LEAGUE_DATE + datetime.timedelta(days=DAYS_BETWEEN_LEAGUES * (night - 1))
+    return '{}-{}-{}'.format(date.month, date.day, str(date.year)[2:])
+
+def get_ratings_values(roster):
+    """Returns the ratings sheet's rank, name and rating columns as values().batchGet returns them."""
+    ranked_roster = sorted(roster, key=lambda player: player[1], reverse=True)
+    return [[str(rank) for rank in range(1, len(roster) + 1)], [name for name, _ in ranked_roster],
+            [str(rating) for _, rating in ranked_roster]]
+
+def get_prize_points_values(roster, num_leagues, rng):
+    """Returns a prize points sheet's rows with num_leagues leagues on it, as values().batchGet returns them."""
+    values = [['Name', 'Total earned', 'Total used', 'Total remaining'] +
+              [get_league_date(night) for night in range(1, num_leagues + 1)]]
+    for name, _ in sorted(roster):
+        points = [rng.choice([0, 0, 1, 2, 3, 5, 8]) for _ in range(num_leagues)]
+        used = rng.choice([0, 0, 0, 5])
+        values.append([name, str(sum(points)), str(used), str(sum(points) - used)] + [str(point) for point in points])
+    return values
+
+def get_group_matches(groups, league_roster_dict):
+    return batch_automation.construct_group_matches(groups, dict(league_roster_dict))
+
+def compute_groups(group_matches):
+    return [rating_engine.compute_group(group, matches) for group, matches in group_matches]
+
+def set_up_workbook():
+    all_info, workbook, _ = excel_functions.set_up_workbook(get_league_date(1))
+    return all_info, workbook
+
+def measure(run, setup=None, teardown=None, repeat=DEFAULT_REPEAT):
+    """Times run, called with what setup returns if there is a setup, which isn't timed, and neither is teardown.
+
+    Returns:
+        list of seconds, one per repeat.
+    """
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start_time = default_timer()
+        if setup is not None:
+            run(state)
+        else:
+            run()
+        timings.append(default_timer() - start_time)
+        if teardown is not None:
+            teardown(state)
+    return timings
+
+def benchmark_rating_calc(league, repeat):
+    matches = []
+    for group_result in compute_groups(get_group_matches(league['groups'], league['roster_dict'])):
+        for match_result in group_result.match_results:
+            outcome = 'tied' if match_result.score[0] == match_result.score[1] else \
+                match_result.score[0] > match_result.score[1]
+            matches.append((match_result.player_one.player_rating[1], match_result.player_two.player_rating[1],
+                            outcome))
+
+    def run():
+        for higher_rating, lower_rating, outcome in matches:
+            rating_engine.rating_calc(higher_rating, lower_rating, outcome)
+    return measure(run, repeat=repeat), len(matches)
+
+def benchmark_get_match_winner(league, repeat):
+    group_matches = get_group_matches(league['groups'], league['roster_dict'])
+    compute_groups(group_matches)
+
+    def run():
+        for group, matches in group_matches:
+            rating_engine.get_match_winner(group, matches)
+    return measure(run, repeat=repeat), len(group_matches)
+
+def benchmark_construct_sheet(league, repeat):
+    def setup():
+        all_info, workbook = set_up_workbook()
+        result_sheets = [(excel_functions.ResultSheet(workbook.add_worksheet(group.group_name), group,
+                                                      *all_info['results_info']), matches)
+                         for group, matches in get_group_matches(league['groups'], league['roster_dict'])]
+        return workbook, result_sheets, dict(league['roster_dict'])
+
+    def run(state):
+        workbook, result_sheets, league_roster_dict = state
+        for result_sheet, matches in result_sheets:
+            result_sheet.construct_sheet(league_roster_dict, matches)
+    return measure(run, setup, lambda state: state[0].close(), repeat), len(league['groups'])
+
+def benchmark_result_sheet(league, repeat):
+    group_matches = get_group_matches(league['groups'], league['roster_dict'])
+    group_results = compute_groups(group_matches)
+
+    def setup():
+        all_info, workbook = set_up_workbook()
+        return workbook, [excel_functions.ResultSheet(workbook.add_worksheet(group.group_name), group,
+                                                      *all_info['results_info']) for group, _ in group_matches]
+
+    def run(state):
+        for result_sheet, group_result in zip(state[1], group_results):
+            result_sheet.sheet_merger()
+            result_sheet.header_writer()
+            result_sheet.write_match_results(group_result.match_results)
+    return measure(run, setup, lambda state: state[0].close(), repeat), len(group_matches)
+
+def benchmark_summary_sheet(league, repeat):
+    group_matches = get_group_matches(league['groups'], league['roster_dict'])
+    group_results = compute_groups(group_matches)
+
+    def setup():
+        all_info, workbook = set_up_workbook()
+        return workbook, excel_functions.set_up_summary_sheet(workbook, all_info['summary_info'])
+
+    def run(state):
+        summary_sheet = state[1]
+        summary_sheet.create_title_info()
+        title_row_num = 4
+        for (group, _), group_result in zip(group_matches, group_results):
+            summary_sheet.make_table(title_row_num=title_row_num, header_row_num=title_row_num + 1,
+                                     group_num=group.group_num)
+            summary_sheet.write_to_table(group_size=group.num_players, group=group,
+                                         first_data_row_num=title_row_num + 2, match_winner=group_result.match_winner)
+            title_row_num += group.num_players + 3
+    return measure(run, setup, lambda state: state[0].close(), repeat), len(group_matches)
+
+def benchmark_workbook_close(league, repeat):
+    def setup():
+        all_info, workbook = set_up_workbook()
+        summary_sheet = excel_functions.set_up_summary_sheet(workbook, all_info['summary_info'])
+        excel_functions.write_results(workbook, summary_sheet, all_info['results_info'],
+                                      get_group_matches(league['groups'], league['roster_dict']),
+                                      dict(league['roster_dict']))
+        return workbook
+    return measure(excel_functions.close_workbook, setup, repeat=repeat), len(league['groups'])
+
+def benchmark_get_league_roster(league, repeat):
+    values = get_ratings_values(league['roster'])
+
+    def run():
+        with shared_functions.HiddenPrints():
+            google_sheets_functions.get_league_roster(None, 'Fall 2023', values)
+    return measure(run, repeat=repeat), len(league['roster'])
+
+def benchmark_get_prize_points(league, repeat):
+    values = get_prize_points_values(league['roster'], league['scale']['nights'], random.Random(league['seed']))
+
+    def run():
+        with shared_functions.HiddenPrints():
+            google_sheets_functions.get_prize_points(None, '2023-2024', values)
+    return measure(run, repeat=repeat), len(league['roster']) * league['scale']['nights']
+
+def start_run():
+    """Forgets what a run of the program would only remember until it exits."""
+    google_sheets_functions.sheet_metadata_cache.invalidate(google_sheets_functions.RATINGS_SPREADSHEET_ID)
+    google_sheets_functions.sheet_metadata_cache.invalidate(google_sheets_functions.PRIZE_POINTS_SPREADSHEET_ID)
+    shared_functions.sheets_write_bucket = shared_functions.TokenBucket(
+        shared_functions.SHEETS_WRITE_REQUESTS_PER_MINUTE)
+
+def benchmark_end_to_end(league, repeat):
+    """Runs a season of league nights against the fake backend, starting from a roster and an empty prize sheet.
+
+    Returns:
+        list of seconds, one per league night.
+    """
+    backend = fake_google_backend.get_backend()
+    fake_google_backend.reset()
+    sheets_mirror.get_mirror().clear()
+    backend.latency = league['latency']
+    backend.error_rate = league['error_rate']
+    ratings_sheet_name = excel_functions.get_ratings_sheet_name(get_league_date(1))
+    backend.set_values(google_sheets_functions.RATINGS_SPREADSHEET_ID, '{}!A1'.format(ratings_sheet_name),
+                       [['Rank', 'Name', 'Current Rating']] + list(zip(*get_ratings_values(league['roster']))))
+    backend.set_values(google_sheets_functions.PRIZE_POINTS_SPREADSHEET_ID,
+                       '{}!A1'.format(excel_functions.get_prize_points_sheet_name(ratings_sheet_name)),
+                       get_prize_points_values(league['roster'], 0, random.Random(league['seed'])))
+
+    rng = random.Random(league['seed'])
+    results_dir = tempfile.mkdtemp()
+    timings = []
+    try:
+        for night in range(1, league['scale']['nights'] + 1):
+            groups = make_league_night(league['roster'], league['scale']['groups'], rng, night)
+            results_path = os.path.join(results_dir, 'night{}.json'.format(night))
+            with open(results_path, 'w') as results_file:
+                json.dump({'date': get_league_date(night),
+                           'groups': [{'players': [{'name': name, 'rating': rating} for name, rating in players],
+                                       'matches': matches} for players, matches in groups]}, results_file)
+            start_run()
+            start_time = default_timer()
+            with shared_functions.HiddenPrints():
+                results = batch_automation.build_workbook(results_path, save_local_copy=False)
+                scheduler = publish_pipeline.publish_league(results['file_name'], results['league_data'],
+                                                            results['prize_points'],
+                                                            workbook_data=results['workbook_data'],
+                                                            open_league_file=False)
+            timings.append(default_timer() - start_time)
+            if not scheduler.succeeded():
+                raise RuntimeError('League night {} failed:\n{}'.format(night, scheduler.report()))
+    finally:
+        shutil.rmtree(results_dir)
+    return timings, backend.request_count
+
+def get_stats(timings):
+    ordered_timings = sorted(timings)
+    return OrderedDict([
+        ('repeat', len(timings)),
+        ('min_s', round(ordered_timings[0], 6)),
+        ('median_s', round(ordered_timings[len(timings) // 2], 6)),
+        ('mean_s', round(sum(timings) / len(timings), 6)),
+        ('max_s', round(ordered_timings[-1], 6))
+    ])
+
+def run_benchmarks(scales, names, repeat=DEFAULT_REPEAT, seed=DEFAULT_SEED, latency=None, error_rate=None):
+    """Runs the named benchmarks at every scale.
+
+    Returns:
+        list of result dicts with the benchmark, its scale, the scale's parameters, how many items (matches, groups,
+        players or API requests) one run handled and the timing stats.
+    """
+    fake_backend_options = config.FAKE_ENV['fake_backend']
+    latency = fake_backend_options['latency'] if latency is None else latency
+    error_rate = fake_backend_options['error_rate'] if error_rate is None else error_rate
+    results = []
+    for scale_name, scale in scales.items():
+        rng = random.Random(seed)
+        roster = make_roster(scale['roster'], rng)
+        league = {'scale': scale, 'seed': seed, 'roster': roster, 'roster_dict': dict(roster),
+                  'groups': make_league_night(roster, scale['groups'], rng), 'latency': latency,
+                  'error_rate': error_rate}
+        for name in names:
+            timings, items = globals()['benchmark_' + name](league, repeat)
+            result = OrderedDict([('benchmark', name), ('scale', scale_name), ('params', scale), ('items', items)])
+            if name == 'end_to_end':
+                result['params'] = dict(scale, latency=latency, error_rate=error_rate)
+                result['season_s'] = round(sum(timings), 6)
+            result.update(get_stats(timings))
+            results.append(result)
+            print('{:<18} {:<8} {:>10.2f} ms median'.format(name, scale_name, result['median_s'] * 1000),
+                  file=sys.stderr)
+    return results
+
+def get_version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_results, new_results, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """Prints each benchmark's median against the one in old_results.
+
+    Returns:
+        list of (benchmark, scale) pairs that got more than threshold times slower.
+    """
+    from tabulate import tabulate
+    old_medians = {(result['benchmark'], result['scale']): result['median_s'] for result in old_results['results']}
+    rows = []
+    regressions = []
+    for result in new_results['results']:
+        key = (result['benchmark'], result['scale'])
+        if key not in old_medians:
+            continue
+        ratio = result['median_s'] / old_medians[key] if old_medians[key] else float('inf')
+        if ratio > threshold:
+            regressions.append(key)
+        rows.append([key[0], key[1], old_medians[key], result['median_s'], '{:.2f}x'.format(ratio),
+                     'REGRESSION' if ratio > threshold else ''])
+    print(tabulate(rows, headers=['Benchmark', 'Scale', 'Old median s', 'New median s', 'Ratio', '']),
+          file=sys.stderr)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the rating engine, workbook rendering, roster parsing and a '
+                                                 'whole season against the fake Sheets and Drive backend.')
+    parser.add_argument('--scale', nargs='+', choices=list(SCALES), default=list(SCALES),
+                        help='league sizes to run (default: all)')
+    parser.add_argument('--groups', type=int, help='run a single custom scale with this many groups')
+    parser.add_argument('--roster', type=int, help='roster size of the custom scale')
+    parser.add_argument('--nights', type=int, help='league nights in the custom scale')
+    parser.add_argument('--benchmark', nargs='+', choices=BENCHMARKS, default=BENCHMARKS,
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='timed runs of each benchmark')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='seed for the synthetic leagues')
+    parser.add_argument('--latency', type=float, help='seconds the fake backend adds to each request (default: '
+                                                      'the one in config.FAKE_ENV)')
+    parser.add_argument('--error-rate', type=float, help='fraction of fake backend requests that fail')
+    parser.add_argument('--output', metavar='FILE', help='write the JSON results to FILE instead of stdout')
+    parser.add_argument('--compare', metavar='FILE', help='compare against the JSON results of an earlier run and '
+                                                          'exit with 1 if anything regressed')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='how many times slower than before counts as a regression')
+    args = parser.parse_args(argv)
+
+    scales = OrderedDict((name, SCALES[name]) for name in args.scale)
+    if args.groups or args.roster or args.nights:
+        scales = OrderedDict([('custom', {'groups': args.groups or 1, 'roster': args.roster or 50,
+                                          'nights': args.nights or 1})])
+
+    output = OrderedDict([
+        ('version', get_version()),
+        ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('seed', args.seed),
+        ('results', run_benchmarks(scales, args.benchmark, args.repeat, args.seed, args.latency, args.error_rate))
+    ])
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.compare:
+        with open(args.compare) as compare_file:
+            if compare(json.load(compare_file), output, args.threshold):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import os
+
 TEST_ENV = {
 	'ratings_spreadsheet_id': '1vE4qVg1_FP_vAknI2pr8-Z97aV9ZTYqDHqq2Hy6Ydi0',
 	'prize_points_spreadsheet_id': '1lt96GC-ld7PwGhus0MZ8E9Vr_EVWgch3jFIfnF7tUyg',
@@ -10,4 +12,20 @@ LIVE_ENV = {
 	'results_folder_id': '0B9Mt_sNXCmNzbTVici1WYk1tcmc'
 }
 
-CURRENT_ENV = TEST_ENV
\ No newline at end of file
+# Talks to fake_google_backend instead of Google, so nothing needs credentials or a network
+FAKE_ENV = {
+	'ratings_spreadsheet_id': 'fake-ratings-spreadsheet',
+	'prize_points_spreadsheet_id': 'fake-prize-points-spreadsheet',
+	'results_folder_id': 'fake-results-folder',
+	'fake_backend': {
+		'latency': 0.1, # seconds added to every request
+		'error_rate': 0.0, # fraction of requests that fail with a 429, 500 or 503
+		'seed': None # set to fail the same requests every run
+	},
+	'sheets_mirror_path': ':memory:' # the fake sheets start out empty every run, so their mirror isn't kept either
+}
+
+ENVS = {'test': TEST_ENV, 'live': LIVE_ENV, 'fake': FAKE_ENV}
+
+# TT_AUTOMATION_ENV=live (or fake) picks another environment for a single run
+CURRENT_ENV = ENVS[os.environ.get('TT_AUTOMATION_ENV', 'test')]
@@ -1,18 +1,20 @@
 # Author: David Gong
 # Contributor: Jonathan Lian
 
-import xlsxwriter
 import shared_functions
+import api_tracer
+import profiler
 import google_sheets_functions
-import operator
-import readline
+import rating_engine
 import logging
 import datetime
 import copy
 import sys
-import os
-from collections import defaultdict
-import math
+import io
+
+# xlsxwriter and readline are imported when they're first needed so the date prompt comes up right away. The workbook
+# is only created once every result has been typed in, and is built in memory so that nothing is left on disk if the
+# program quits or crashes; the .xlsx file is written in one go after the workbook is closed.
 
 LOG_FILENAME = 'completer.log'
 logging.basicConfig(
@@ -113,6 +115,7 @@ class Group:
             if i < 0:
                 return 'backtrack'
         else:
+            import readline
             players_in_roster = []
             in_roster = False
             go_back = False
@@ -233,14 +236,8 @@ class Groups:
             index += 1
 
 class ResultSheet:
-    match_ordering_selection = {3: ['A:C', 'B:C', 'A:B'],
-                                4: ['B:D', 'A:C', 'B:C', 'A:D', 'C:D', 'A:B'],
-                                5: ['A:D', 'B:C', 'B:E', 'C:D', 'A:E', 'B:D', 'A:C', 'D:E', 'C:E', 'A:B'],
-                                6: ['A:D', 'B:C', 'E:F', 'A:E', 'B:D', 'C:F', 'B:F', 'D:E', 'A:C', 'A:F',
-                                    'B:E', 'C:D', 'C:E', 'D:F', 'A:B'],
-                                7: ['A:F', 'B:E', 'C:D', 'B:G', 'C:F', 'D:E', 'A:E', 'B:D', 'C:G', 'A:C', 'D:F',
-                                    'E:G', 'F:G', 'A:D', 'B:C', 'A:B', 'E:F', 'D:G', 'A:G', 'B:F', 'C:E']}
-    letter_dict = {'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6}
+    match_ordering_selection = rating_engine.match_ordering_selection
+    letter_dict = rating_engine.letter_dict
     last_row_selection = {3: 11, 4: 20, 5: 33, 6: 48, 7: 66}
 
     def __init__(self, sheet, group, results_regular_format, results_group_title_format, results_merge_format,
@@ -258,124 +255,19 @@ class ResultSheet:
         self.match_ordering = ResultSheet.match_ordering_selection[self.num_players]
         self.match_winner = None
         self.match_list = []
+        self.group_result = None
 
     def get_match_winner(self, matches):
-        #Sort by matches won, ties broken with games won
-        match_winner_groups = []
-        sort_match_winner = sorted(self.group.sorted_players, key=lambda player: player.games_won, reverse=True)
-        sort_match_winner = sorted(sort_match_winner, key=lambda player: player.matches_won, reverse=True)
-        #Check for further ties
-        start = 0
-        end = 1
-        while(start != len(sort_match_winner)-1):
-            if (sort_match_winner[start].matches_won == sort_match_winner[end].matches_won) and (sort_match_winner[start].games_won == sort_match_winner[end].games_won):
-                if end+1 < len(sort_match_winner):
-                    end+=1
-                else:
-                    match_winner_groups.append(sort_match_winner[start:])
-                    break
-            else:
-                #if two-way tie get h2h
-                if end-start == 2:
-                    player1_index = self.group.sorted_players.index(sort_match_winner[start])
-                    player2_index = self.group.sorted_players.index(sort_match_winner[start+1])
-                    if player2_index < player1_index:
-                        sort_match_winner[start], sort_match_winner[start+1] = sort_match_winner[start+1], sort_match_winner[start]
-                        tempIndex = player2_index
-                        player2_index = player1_index
-                        player1_index = tempIndex
-                    for key, val in ResultSheet.letter_dict.items():
-                        if val == player1_index:
-                            player1_letter = key
-                        if val == player2_index:
-                            player2_letter = key
-                    index = self.match_ordering.index(player1_letter+':'+player2_letter)
-                    if int(matches[index][0]) < int(matches[index][2]):
-                        sort_match_winner[start], sort_match_winner[start+1] = sort_match_winner[start+1], sort_match_winner[start]
-                    match_winner_groups.append([sort_match_winner[start]])
-                    match_winner_groups.append([sort_match_winner[start+1]])
-                #if more than two-way tie accept tie
-                elif end-start > 2:
-                    match_winner_groups.append(sort_match_winner[start:end])
-                #if no tie
-                elif end-start == 1:
-                    match_winner_groups.append([sort_match_winner[start]])
-
-                start = end
-                if start+1 < len(sort_match_winner):
-                    end = start + 1
-                else:
-                    match_winner_groups.append([sort_match_winner[start]])
-                    break
-        return match_winner_groups
+        return rating_engine.get_match_winner(self.group, matches)
 
     def get_group_prize_points(self):
-        prize_points_amounts = {1: [10,8,6,4,2,2,2],
-                                2: [8,6,4,2,2,2,2],
-                                3: [8,6,4,2,2,2,2],
-                                4: [7,5,3,1,1,1,1],
-                                5: [7,5,3,1,1,1,1],
-                                6: [7,5,3,1,1,1,1],
-                                7: [7,5,3,1,1,1,1],
-                                8: [7,5,3,1,1,1,1]}
-        group_prize_points = {}
-        rank = 0
-        for i in self.match_winner:
-            if len(i) == 1:
-                group_prize_points[i[0].player_name] = prize_points_amounts[self.group.group_num][rank]
-            elif len(i) > 1:
-                point_value = math.ceil(sum(prize_points_amounts[self.group.group_num][rank:rank+len(i)])/len(i))
-                for j in i:
-                    group_prize_points[j.player_name] = point_value
-            rank += len(i)
-        return group_prize_points
+        return rating_engine.get_group_prize_points(self.group, self.match_winner)
 
     def higher_rating_is_winner(self, match):
-        games_won = match[0]
-        games_lost = match[2]
-        if games_won == games_lost:
-            return 'tied'
-        return int(games_won) > int(games_lost)
+        return rating_engine.higher_rating_is_winner(match)
 
     def rating_calc(self, higher_rating, lower_rating, higher_rating_is_winner):
-        difference = higher_rating - lower_rating
-        rating_increment = 25
-        min_rating_threshold = 13
-        max_rating_threshold = min_rating_threshold + rating_increment * 9 + 1
-
-        if higher_rating_is_winner == 'tied':
-            return 0
-        # expected
-        elif higher_rating_is_winner:
-            point_change = 8
-            if 138 <= difference < 188:
-                return 2
-            elif 188 <= difference < 238:
-                return 1
-            elif difference >= 238:
-                return 0
-            for difference_threshold in range(min_rating_threshold, 139, rating_increment):
-                if difference < difference_threshold:
-                    return point_change
-                else:
-                    point_change -= 1
-        # upset
-        else:
-            point_change = -20
-            if difference < 13:
-                return -8
-            elif 13 <= difference < 38:
-                return -10
-            elif 38 <= difference < 63:
-                return -13
-            elif 63 <= difference < 88:
-                return -16
-            for difference_threshold in range(113, max_rating_threshold, rating_increment):
-                if difference < difference_threshold:
-                    return point_change
-                else:
-                    point_change -= 5
-        return point_change
+        return rating_engine.rating_calc(higher_rating, lower_rating, higher_rating_is_winner)
 
     def sheet_merger(self):
         self.sheet.merge_range('A1:E1', '{} - Match Record'.format(self.group.group_name),
@@ -404,64 +296,35 @@ class ResultSheet:
         self.sheet.write('D2', 'Rating Before', self.results_header_format)
         self.sheet.write('E2', 'Point Change', self.results_header_format)
 
+    def write_match_results(self, match_results):
+        row_num = self.first_row - 1
+        regular_format = self.results_regular_format
+        for match_result in match_results:
+            player_one = match_result.player_one
+            player_two = match_result.player_two
+            self.sheet.write(row_num, 0, match_result.player_one_letter, regular_format)
+            self.sheet.write(row_num, 1, player_one.player_name, regular_format)
+            self.sheet.write(row_num, 2, match_result.score[0], regular_format)
+            self.sheet.write(row_num, 3, player_one.player_rating[1], regular_format)
+            self.sheet.write(row_num, 4, match_result.point_change, regular_format)
+            self.sheet.write(row_num + 1, 0, match_result.player_two_letter, regular_format)
+            self.sheet.write(row_num + 1, 1, player_two.player_name, regular_format)
+            self.sheet.write(row_num + 1, 2, match_result.score[1], regular_format)
+            self.sheet.write(row_num + 1, 3, player_two.player_rating[1], regular_format)
+            self.sheet.write(row_num + 1, 4, -match_result.point_change, regular_format)
+            row_num += 3
+
     def construct_sheet(self, league_roster_dict, matches):
         self.sheet_merger()
         self.header_writer()
 
-        # 2 passes: first pass to see if need to adjust ratings, second pass with adjusted ratings if necessary
-        for i in range(2):
-            for index, row_num in enumerate(range(self.first_row, self.last_row, 3)):
-                player_one_letter = self.match_ordering[index][0]
-                player_two_letter = self.match_ordering[index][2]
-                player_one = self.group.sorted_players[ResultSheet.letter_dict[player_one_letter]]
-                player_two = self.group.sorted_players[ResultSheet.letter_dict[player_two_letter]]
-                match = matches[index]
-
-                if len(match) == 0 or (int(match[0]) == int(match[2]) == 0):
-                    point_change = 0
-                    self.sheet.write('C' + str(row_num), 0, self.results_regular_format)
-                    self.sheet.write('C' + str(row_num + 1), 0, self.results_regular_format)
-                else:
-                    point_change = self.rating_calc(player_one.player_rating[i], player_two.player_rating[i],
-                                                    self.higher_rating_is_winner(match))
-                    if int(match[0]) > int(match[2]):
-                        player_one.matches_won += 1
-                    elif int(match[0]) < int(match[2]):
-                        player_two.matches_won += 1
-
-                    player_one.games_won += int(match[0])
-                    player_two.games_won += int(match[2])
-                    self.sheet.write('C' + str(row_num), int(match[0]), self.results_regular_format)
-                    self.sheet.write('C' + str(row_num + 1), int(match[2]), self.results_regular_format)
-
-                self.sheet.write('A' + str(row_num), player_one_letter, self.results_regular_format)
-                self.sheet.write('B' + str(row_num), player_one.player_name, self.results_regular_format)
-                self.sheet.write('D' + str(row_num), player_one.player_rating[1], self.results_regular_format)
-                self.sheet.write('E' + str(row_num), point_change, self.results_regular_format)
-                self.sheet.write('A' + str(row_num + 1), player_two_letter, self.results_regular_format)
-                self.sheet.write('B' + str(row_num + 1), player_two.player_name, self.results_regular_format)
-                self.sheet.write('D' + str(row_num + 1), player_two.player_rating[1], self.results_regular_format)
-                self.sheet.write('E' + str(row_num + 1), -point_change, self.results_regular_format)
-
-                player_one.final_rating += point_change
-                player_one.rating_change += point_change
-                player_two.final_rating -= point_change
-                player_two.rating_change -= point_change
-
-            # determine if ratings need to be adjusted and second pass needed
-            if i == 0:
-                for player in self.group.sorted_players:
-                    if player.rating_change >= 50:
-                        player.player_rating[1] = player.final_rating
-                    player.rating_change = 0
-                    player.final_rating = player.player_rating[1]
-                    player.matches_won = 0
-                    player.games_won = 0
+        self.group_result = rating_engine.compute_group(self.group, matches)
+        self.write_match_results(self.group_result.match_results)
 
         for player in self.group.sorted_players:
             league_roster_dict[player.player_name] = player.final_rating
 
-        self.match_winner = self.get_match_winner(matches)
+        self.match_winner = self.group_result.match_winner
 
 class SummarySheet:
     seed_letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G']
@@ -540,48 +403,37 @@ class SummarySheet:
 
 def check_quit(input_text):
     if input_text.lower().strip() in ['quit', 'q']:
-        try:
-            workbook.close()
-            os.remove(file_name)
-        except:
-            pass
-        finally:
-            sys.exit()
+        sys.exit()
+
+def get_input(input_text):
+    with profiler.span('input', kind=profiler.WAIT):
+        return input(input_text)
 
 def correct_input(input_text, var_type):
     type_dict = {str: 'string', int: 'integer', 'match_input': 'match input, e.g. 3:2',
                  'date_input': 'date input.', 'rating_input': 'rating input.'}
-    pre_input = input(input_text)
+    pre_input = get_input(input_text)
     check_quit(pre_input)
 
     if pre_input.lower().strip() in ['back', 'b'] and var_type != 'date_input':
         return 'back'
     if var_type == 'date_input':
-        date_input = pre_input.strip().replace('\'', '')
+        date_input = pre_input
         while True:
             try:
-                date_long, date_short, is_tryouts = tuple(shared_functions.reformat_file_name(date_input, 'try'))
-                month, day, year = tuple([int(element) for element in date_short])
-                if datetime.datetime(year=year, month=month, day=day):
-                    return '{}-{}-{} Tryouts'.format(month, day, year)\
-                        if is_tryouts else '{}-{}-{}'.format(month, day, year)
+                return format_date_input(date_input)
             except:
                 print("Please input the correct format for the {}".format(type_dict[var_type]))
-                date_input = input('Date: ')
+                date_input = get_input('Date: ')
                 check_quit(date_input)
     elif var_type == 'match_input':
-        match_input = pre_input.strip().replace('.', '')
+        match_input = pre_input
         while True:
             try:
-                if len(match_input) == 2 and match_input[0].isdigit() and match_input[1].isdigit():
-                    return match_input[0] + ":" + match_input[1]
-                elif len(match_input) == 3 and match_input[0].isdigit() and match_input[2].isdigit():
-                    return match_input
-                else:
-                    raise Exception
+                return format_match_input(match_input)
             except:
                 print("Please input the correct format for the {}".format(type_dict[var_type]))
-                match_input = input(input_text)
+                match_input = get_input(input_text)
                 check_quit(match_input)
     elif var_type == 'rating_input':
         rating_input = pre_input.replace('-', '').strip()
@@ -593,7 +445,7 @@ def correct_input(input_text, var_type):
                     raise Exception
             except:
                 print("\nPlease input the correct format for the {}".format(type_dict[var_type]))
-                rating_input = input(input_text)
+                rating_input = get_input(input_text)
                 check_quit(rating_input)
     else:
         value = pre_input.strip()
@@ -604,19 +456,44 @@ def correct_input(input_text, var_type):
                 return var_type(value)
             except ValueError:
                 print("Please input the correct value of type {}.".format(type_dict[var_type]))
-                value = input(input_text).strip()
+                value = get_input(input_text).strip()
                 check_quit(value)
 
+def format_date_input(date_input):
+    date_input = date_input.strip().replace('\'', '')
+    date_long, date_short, is_tryouts = tuple(shared_functions.reformat_file_name(date_input, 'try'))
+    month, day, year = tuple([int(element) for element in date_short])
+    datetime.datetime(year=year, month=month, day=day)
+    return '{}-{}-{} Tryouts'.format(month, day, year) if is_tryouts else '{}-{}-{}'.format(month, day, year)
+
+def format_match_input(match_input):
+    match_input = match_input.strip().replace('.', '')
+    if len(match_input) == 2 and match_input[0].isdigit() and match_input[1].isdigit():
+        return match_input[0] + ":" + match_input[1]
+    elif len(match_input) == 3 and match_input[0].isdigit() and match_input[2].isdigit():
+        return match_input
+    raise ValueError('Invalid match input: {}'.format(match_input))
+
 def len_longest_substring(string):
     return len(max(string.split(' '), key=len))
 
-def set_up_workbook():
+def get_league_name():
     name = correct_input("Please input the date this league took place in 'MM-DD-YY' format.\n"
                          "If you are inputting results for tryouts, input 'MM-DD-YY Tryouts': ", 'date_input')
     print('')
+    return name
+
+def get_file_name(name):
     if '.xlsx' not in name:
-        file_name = name + '.xlsx'
-    workbook = xlsxwriter.Workbook(file_name)
+        return name + '.xlsx'
+    return name
+
+def set_up_workbook(name=None):
+    import xlsxwriter
+    if name is None:
+        name = get_league_name()
+    file_name = get_file_name(name)
+    workbook = xlsxwriter.Workbook(io.BytesIO(), {'in_memory': True})
     name = name.replace('-', '/')
 
     summary_main_title_format = workbook.add_format({
@@ -711,6 +588,20 @@ def set_up_workbook():
 
     return all_info, workbook, file_name
 
+def close_workbook(workbook, file_name=None):
+    """Closes a workbook made by set_up_workbook, also saving it as file_name if one is given.
+
+    Returns:
+        bytes, the .xlsx file's contents.
+    """
+    with profiler.span('workbook close'):
+        workbook.close()
+    workbook_data = workbook.filename.getvalue()
+    if file_name is not None:
+        with open(file_name, 'wb') as excel_file:
+            excel_file.write(workbook_data)
+    return workbook_data
+
 def get_match_inputs(group, backtrack=False):
     print('-  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -  -\n')
     print('Please input the game scores for {}.\n'.format(group.group_name))
@@ -740,7 +631,7 @@ def get_match_inputs(group, backtrack=False):
         return 'backtrack'
     return match_list
 
-def set_up_summary_sheet(args):
+def set_up_summary_sheet(workbook, args):
     worksheet = workbook.add_worksheet('Summary')
     summary_sheet = SummarySheet(worksheet, *args)
     summary_sheet.set_columns()
@@ -767,69 +658,28 @@ def get_prize_points_sheet_name(file_name):
         prize_points_sheet_name = str(int(file_name[7:])-1)+"-"+str(file_name[7:])
     return prize_points_sheet_name
 
-def generate_workbook():
-    print('_______________________________________________________________________________')
-    print("Basic rules for league at GTTTA:\n")
-    print("There can be no more than seven players in any group.")
-    print("There can be no less than three people per group.")
-    print("Type 'back' or 'b' to go back at any time.")
-    print("Type 'quit' or 'q' to exit the program at any time.\n")
-
-    global file_name, workbook
-    all_info, workbook, file_name = set_up_workbook()
-    summary_sheet = set_up_summary_sheet(all_info['summary_info'])
-    title_row_num = 4
-
-    groups = Groups()
-    groups.construct_groups()
-    group_list = groups.group_list
-
-    print('\nLoading roster, please wait...')
-    service = google_sheets_functions.create_service()
+def load_league_data(service, file_name, ratings_values=None, prize_points_values=None):
     ratings_sheet_name = get_ratings_sheet_name(file_name)
-    league_roster_list, league_roster_dict = google_sheets_functions.get_league_roster(service, ratings_sheet_name)
     prize_points_sheet_name = get_prize_points_sheet_name(ratings_sheet_name)
-    prize_points_dict, points_used, num_leagues = google_sheets_functions.get_prize_points(service, prize_points_sheet_name)
-    ratings_sheet_start_row_index = len(league_roster_dict) + 1
-
-    group_index = 0
-    backtrack = False
-    group_matches = []
-    while 0 <= group_index < len(group_list):
-        group = group_list[group_index]
-        if league_roster_list == None:
-            league_roster = []
-        else:
-            league_roster = league_roster_list[1]
-        if group.get_info(league_roster, league_roster_dict, backtrack=backtrack) == 'backtrack':
-            group_index -= 1
-            backtrack = False
-            if group_index < 0:
-                groups.construct_groups(backtrack=True)
-                group_list = groups.group_list
-                group_index = 0
-            else:
-                group_matches.pop()
-        else:
-            readline.set_completer(None)
-            match_inputs = get_match_inputs(group)
-            if match_inputs == 'backtrack':
-                backtrack = True
-            else:
-                if group_index < len(group_matches):
-                    group_matches[group_index] = (group, match_inputs)
-                else:
-                    group_matches.append((group, match_inputs))
-                backtrack = False
-                group_index += 1
-
+    with api_tracer.phase('roster load'):
+        league_roster_list, league_roster_dict = google_sheets_functions.get_league_roster(service, ratings_sheet_name,
+                                                                                           ratings_values)
+        prize_points_table = google_sheets_functions.get_prize_points(service, prize_points_sheet_name,
+                                                                      prize_points_values)
+    return {'ratings_sheet_name': ratings_sheet_name, 'league_roster_list': league_roster_list,
+            'league_roster_dict': league_roster_dict, 'prize_points_sheet_name': prize_points_sheet_name,
+            'prize_points_table': prize_points_table}
+
+def write_results(workbook, summary_sheet, results_info, group_matches, league_roster_dict):
     summary_sheet.create_title_info()
+    title_row_num = 4
 
     prize_points = {}
     for group, matches in group_matches:
         sheet = workbook.add_worksheet(group.group_name)
-        result_sheet = ResultSheet(sheet, group, *all_info['results_info'])
-        result_sheet.construct_sheet(league_roster_dict, matches)
+        result_sheet = ResultSheet(sheet, group, *results_info)
+        with profiler.span('construct_sheet', group.group_name):
+            result_sheet.construct_sheet(league_roster_dict, matches)
         group_prize_points = result_sheet.get_group_prize_points()
         for key, value in group_prize_points.items():
             prize_points[key] = value
@@ -842,30 +692,120 @@ def generate_workbook():
                                      first_data_row_num=first_data_row_num,
                                      match_winner=result_sheet.match_winner)
         title_row_num = last_row_num + 2
-        group_index += 1
+    return prize_points
+
+def update_ratings_sheet(service, league_data):
+    # saved on this computer first so the ratings aren't lost if Sheets can't be reached
+    google_sheets_functions.save_ratings_changes(league_data['ratings_sheet_name'], league_data['league_roster_list'],
+                                                 league_data['league_roster_dict'])
+    with api_tracer.phase('ratings write'):
+        google_sheets_functions.push_sheet_changes(service, google_sheets_functions.RATINGS_SPREADSHEET_ID,
+                                                   league_data['ratings_sheet_name'])
+
+def update_prize_points_sheet(service, file_name, league_data, prize_points):
+    google_sheets_functions.save_prize_points_changes(sheet_name=league_data['prize_points_sheet_name'],
+                                                      prize_points_table=league_data['prize_points_table'],
+                                                      roster=league_data['league_roster_dict'].keys(),
+                                                      league_date=file_name[:-5],
+                                                      league_prize_points=prize_points)
+    with api_tracer.phase('prize write'):
+        google_sheets_functions.push_sheet_changes(service, google_sheets_functions.PRIZE_POINTS_SPREADSHEET_ID,
+                                                   league_data['prize_points_sheet_name'])
+
+def update_sheets(service, file_name, league_data, prize_points):
+    update_ratings_sheet(service, league_data)
+    update_prize_points_sheet(service, file_name, league_data, prize_points)
+
+def enter_results(save_local_copy=True):
+    """Prompts for the league's results and builds the workbook, without updating any Google Sheets.
+
+    Returns:
+        dict with the workbook's file_name and workbook_data (the .xlsx file's contents), the league_data loaded for
+        it, its prize_points, the Sheets service and the drive_permission_check started with the roster load for
+        publish_pipeline.publish_league. The workbook is only saved to file_name if save_local_copy is set.
+    """
+    print('_______________________________________________________________________________')
+    print("Basic rules for league at GTTTA:\n")
+    print("There can be no more than seven players in any group.")
+    print("There can be no less than three people per group.")
+    print("Type 'back' or 'b' to go back at any time.")
+    print("Type 'quit' or 'q' to exit the program at any time.\n")
+
+    # typing in the results is kept apart from building and uploading the workbook when profiling
+    with profiler.span('data entry'):
+        name = get_league_name()
+        file_name = get_file_name(name)
+
+        # load the roster and check the Drive permissions while the groups are being typed in
+        import google_drive_functions
+        ratings_sheet_name = get_ratings_sheet_name(file_name)
+        prefetch = google_sheets_functions.LeagueDataPrefetch(ratings_sheet_name,
+                                                              get_prize_points_sheet_name(ratings_sheet_name))
+        prefetch.start()
+        drive_permission_check = google_drive_functions.DrivePermissionCheck()
+        drive_permission_check.start()
+
+        groups = Groups()
+        groups.construct_groups()
+        group_list = groups.group_list
+
+        with profiler.span('roster wait'):
+            service, ratings_values, prize_points_values = prefetch.get()
+        drive_permission_check.report()
+        league_data = load_league_data(service, file_name, ratings_values, prize_points_values)
+        league_roster_list = league_data['league_roster_list']
+        league_roster_dict = league_data['league_roster_dict']
+
+        group_index = 0
+        backtrack = False
+        group_matches = []
+        while 0 <= group_index < len(group_list):
+            group = group_list[group_index]
+            if league_roster_list == None:
+                league_roster = []
+            else:
+                league_roster = league_roster_list[1]
+            if group.get_info(league_roster, league_roster_dict, backtrack=backtrack) == 'backtrack':
+                group_index -= 1
+                backtrack = False
+                if group_index < 0:
+                    groups.construct_groups(backtrack=True)
+                    group_list = groups.group_list
+                    group_index = 0
+                else:
+                    group_matches.pop()
+            else:
+                if league_roster_dict:
+                    import readline
+                    readline.set_completer(None)
+                match_inputs = get_match_inputs(group)
+                if match_inputs == 'backtrack':
+                    backtrack = True
+                else:
+                    if group_index < len(group_matches):
+                        group_matches[group_index] = (group, match_inputs)
+                    else:
+                        group_matches.append((group, match_inputs))
+                    backtrack = False
+                    group_index += 1
+
+    with profiler.span('workbook build'):
+        all_info, workbook, file_name = set_up_workbook(name)
+        summary_sheet = set_up_summary_sheet(workbook, all_info['summary_info'])
+        prize_points = write_results(workbook, summary_sheet, all_info['results_info'], group_matches,
+                                     league_roster_dict)
 
     print('_______________________________________________________________________________\n')
     print('Opening league sheet...')
 
-    workbook.close()
-    ratings_sheet_end_row_index = len(league_roster_dict) + 1
-    ratings_sheet_data = [[i + 1, element[0], element[1]] for i, element
-                          in enumerate(sorted(league_roster_dict.items(),
-                                              key=operator.itemgetter(1),
-                                              reverse=True))]
-    google_sheets_functions.write_to_ratings_sheet(service=service, row_data=ratings_sheet_data,
-                                                   start_row_index=ratings_sheet_start_row_index,
-                                                   end_row_index=ratings_sheet_end_row_index,
-                                                   sheet_name=ratings_sheet_name)
-
-    prize_points_dict[file_name[:-5]] = prize_points
-    google_sheets_functions.write_to_prize_points_sheet(service=service, roster=league_roster_dict.keys(),
-                                                        prize_points=prize_points_dict,
-                                                        points_used=points_used, num_leagues = num_leagues,
-                                                        start_row_index=ratings_sheet_start_row_index,
-                                                        end_row_index=ratings_sheet_end_row_index,
-                                                        sheet_name=prize_points_sheet_name)
-    return file_name
+    workbook_data = close_workbook(workbook, file_name if save_local_copy else None)
+    return {'file_name': file_name, 'workbook_data': workbook_data, 'league_data': league_data,
+            'prize_points': prize_points, 'service': service, 'drive_permission_check': drive_permission_check}
+
+def generate_workbook():
+    results = enter_results()
+    update_sheets(results['service'], results['file_name'], results['league_data'], results['prize_points'])
+    return results['file_name']
 
 if __name__ == "__main__":
     generate_workbook()
\ No newline at end of file
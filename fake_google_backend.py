@@ -0,0 +1,740 @@
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    from urllib.parse import urlparse, parse_qs, unquote
+except ImportError:
+    from urlparse import urlparse, parse_qs
+    from urllib import unquote
+
+import config
+
+# An in-process stand-in for the parts of the Sheets v4 and Drive v3 APIs this project uses, so the real code paths
+# can be run and timed without a network or credentials. It's picked with the fake_backend entry of a config
+# environment (config.FAKE_ENV, or TT_AUTOMATION_ENV=fake), in which case shared_functions.Session builds its services
+# from the discovery documents below and sends their requests here instead of through an authorized httplib2.Http.
+# Every request can be slowed down by a fixed latency and failed at random with a retryable status, so retries and
+# backoff get exercised too. Spreadsheets and files only live as long as the process.
+#
+# Values are stored the way they were written and read back as formatted strings, so formulas come back as the
+# formula rather than its result. Formatting requests are checked against the sheets they name but not applied.
+
+SHEETS_ROOT_URL = 'https://sheets.googleapis.com/'
+DRIVE_ROOT_URL = 'https://www.googleapis.com/'
+DRIVE_SERVICE_PATH = 'drive/v3/'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+DEFAULT_ERROR_STATUSES = (429, 500, 503)
+DEFAULT_ROW_COUNT = 1000
+DEFAULT_COLUMN_COUNT = 26
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+INTEGER_PARAMETERS = ('pageSize',)
+REPEATED_PARAMETERS = ('ranges',)
+ERROR_REASONS = {400: 'badRequest', 404: 'notFound', 429: 'rateLimitExceeded', 500: 'backendError',
+                 503: 'backendError'}
+# requests that only change how cells look, which are accepted but not applied
+FORMAT_REQUESTS = ('updateBorders', 'updateDimensionProperties', 'mergeCells', 'unmergeCells', 'autoResizeDimensions',
+                   'updateCells')
+
+class ApiError(Exception):
+    def __init__(self, status, message, reason=None):
+        Exception.__init__(self, message)
+        self.status = status
+        self.message = message
+        self.reason = reason or ERROR_REASONS.get(status, 'unknown')
+
+def get_method(method_id, http_method, path, query_parameters=(), request=False, response=True, **options):
+    """Returns the discovery description of an API method, with its path parameters taken from the path."""
+    parameters = OrderedDict()
+    for name in re.findall(r'{(\w+)}', path):
+        parameters[name] = {'type': 'string', 'location': 'path', 'required': True}
+    for name in query_parameters:
+        parameters[name] = {'type': 'integer' if name in INTEGER_PARAMETERS else 'string', 'location': 'query',
+                            'repeated': name in REPEATED_PARAMETERS}
+    method = {
+        'id': method_id,
+        'httpMethod': http_method,
+        'path': path,
+        'parameters': parameters,
+        'parameterOrder': re.findall(r'{(\w+)}', path)
+    }
+    if request:
+        method['request'] = {'$ref': 'Object'}
+    if response:
+        method['response'] = {'$ref': 'Object'}
+    method.update(options)
+    return method
+
+MEDIA_UPLOAD = {'accept': ['*/*'], 'maxSize': '5120GB',
+                'protocols': {'resumable': {'multipart': True, 'path': '/resumable/upload/drive/v3/files'}}}
+
+SHEETS_METHODS = [
+    get_method('sheets.spreadsheets.get', 'GET', 'v4/spreadsheets/{spreadsheetId}', ['ranges']),
+    get_method('sheets.spreadsheets.batchUpdate', 'POST', 'v4/spreadsheets/{spreadsheetId}:batchUpdate',
+               request=True),
+    get_method('sheets.spreadsheets.values.get', 'GET', 'v4/spreadsheets/{spreadsheetId}/values/{range}',
+               ['majorDimension', 'valueRenderOption']),
+    get_method('sheets.spreadsheets.values.update', 'PUT', 'v4/spreadsheets/{spreadsheetId}/values/{range}',
+               ['valueInputOption'], request=True),
+    get_method('sheets.spreadsheets.values.batchGet', 'GET', 'v4/spreadsheets/{spreadsheetId}/values:batchGet',
+               ['ranges', 'majorDimension', 'valueRenderOption']),
+    get_method('sheets.spreadsheets.values.batchUpdate', 'POST', 'v4/spreadsheets/{spreadsheetId}/values:batchUpdate',
+               request=True),
+    get_method('sheets.spreadsheets.values.clear', 'POST', 'v4/spreadsheets/{spreadsheetId}/values/{range}:clear',
+               request=True)
+]
+
+DRIVE_METHODS = [
+    get_method('drive.files.list', 'GET', 'files', ['q', 'pageSize', 'pageToken', 'orderBy', 'spaces']),
+    get_method('drive.files.get', 'GET', 'files/{fileId}'),
+    get_method('drive.files.create', 'POST', 'files', request=True, mediaUpload=MEDIA_UPLOAD,
+               supportsMediaUpload=True),
+    get_method('drive.files.update', 'PATCH', 'files/{fileId}', ['addParents', 'removeParents'], request=True,
+               mediaUpload=MEDIA_UPLOAD, supportsMediaUpload=True),
+    get_method('drive.files.export', 'GET', 'files/{fileId}/export', ['mimeType'], response=False,
+               supportsMediaDownload=True),
+    get_method('drive.revisions.update', 'PATCH', 'files/{fileId}/revisions/{revisionId}', request=True),
+    get_method('drive.permissions.list', 'GET', 'files/{fileId}/permissions')
+]
+
+APIS = {
+    ('sheets', 'v4'): (SHEETS_ROOT_URL, '', SHEETS_METHODS),
+    ('drive', 'v3'): (DRIVE_ROOT_URL, DRIVE_SERVICE_PATH, DRIVE_METHODS)
+}
+
+def get_discovery_document(api, version):
+    """Returns a discovery document for the methods the stand-in answers, as a JSON string."""
+    root_url, service_path, methods = APIS[(api, version)]
+    resources = {}
+    for method in methods:
+        names = method['id'].split('.')[1:]
+        resource = {'resources': resources}
+        for name in names[:-1]:
+            resource = resource['resources'].setdefault(name, {'methods': {}, 'resources': {}})
+        resource['methods'][names[-1]] = method
+    return json.dumps({
+        'kind': 'discovery#restDescription',
+        'discoveryVersion': 'v1',
+        'id': '{}:{}'.format(api, version),
+        'name': api,
+        'version': version,
+        'rootUrl': root_url,
+        'servicePath': service_path,
+        'baseUrl': root_url + service_path,
+        'batchPath': 'batch',
+        'parameters': {
+            'alt': {'type': 'string', 'location': 'query', 'default': 'json'},
+            'fields': {'type': 'string', 'location': 'query'},
+            'quotaUser': {'type': 'string', 'location': 'query'}
+        },
+        'schemas': {'Object': {'id': 'Object', 'type': 'object'}},
+        'resources': resources
+    })
+
+def get_column_index(column_name):
+    index = 0
+    for letter in column_name.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+def parse_range(range_name):
+    """Splits an A1 range like Fall 2017!A2:C into its sheet title and 0 based bounds.
+
+    Returns:
+        tuple of title, start row, end row, start column and end column. The ends are exclusive and None when the
+        range is open ended.
+    """
+    match = re.match(r"^(?:'((?:[^']|'')+)'|([^!]+))(?:!([A-Za-z]*)(\d*)(?::([A-Za-z]*)(\d*))?)?$", range_name)
+    if match is None:
+        raise ApiError(400, 'Unable to parse range: {}'.format(range_name))
+    quoted_title, title, start_column, start_row, end_column, end_row = match.groups()
+    title = quoted_title.replace("''", "'") if quoted_title is not None else title
+    start_row_index = int(start_row) - 1 if start_row else 0
+    start_column_index = get_column_index(start_column) if start_column else 0
+    if end_column is None and end_row is None:
+        if not start_column and not start_row:
+            return title, 0, None, 0, None
+        # a single cell
+        return title, start_row_index, start_row_index + 1, start_column_index, start_column_index + 1
+    return (title, start_row_index, int(end_row) if end_row else None, start_column_index,
+            get_column_index(end_column) + 1 if end_column else None)
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def trim_values(values):
+    values = [list(values_list) for values_list in values]
+    for values_list in values:
+        while values_list and values_list[-1] == '':
+            values_list.pop()
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+def parse_query_string(string):
+    return re.sub(r'\\(.)', r'\1', string[1:-1])
+
+QUERY_CLAUSE_PATTERN = re.compile(r"\s*(?:('(?:[^'\\]|\\.)*')\s+in\s+parents|"
+                                  r"(\w+)\s*(=|!=|contains)\s*('(?:[^'\\]|\\.)*'|true|false))\s*")
+QUERY_AND_PATTERN = re.compile(r'and\b')
+NAME_WORD_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+
+def parse_query(query):
+    """Parses a files().list query made of and-ed clauses into (field, operator, value) conditions."""
+    conditions = []
+    position = 0
+    while position < len(query):
+        match = QUERY_CLAUSE_PATTERN.match(query, position)
+        if match is None:
+            raise ApiError(400, 'Invalid Value', 'invalid')
+        parent, field, operator, operand = match.groups()
+        if parent is not None:
+            conditions.append(('parents', 'in', parse_query_string(parent)))
+        elif operand in ('true', 'false'):
+            conditions.append((field, operator, operand == 'true'))
+        else:
+            conditions.append((field, operator, parse_query_string(operand)))
+        position = match.end()
+        and_match = QUERY_AND_PATTERN.match(query, position)
+        if and_match is not None:
+            position = and_match.end()
+        elif position < len(query):
+            raise ApiError(400, 'Invalid Value', 'invalid')
+    return conditions
+
+def name_contains(name, value):
+    """Matches value against the start of the name's words like Drive does, so 'try' finds 'Fall 2023 Tryouts' but
+    'ry' doesn't. A value of several words has to match consecutive words, the last of them by prefix.
+    """
+    name_words = NAME_WORD_PATTERN.findall(name.lower())
+    value_words = NAME_WORD_PATTERN.findall(value.lower())
+    if not value_words:
+        return True
+    for start in range(len(name_words) - len(value_words) + 1):
+        words = name_words[start:start + len(value_words)]
+        if words[:-1] == value_words[:-1] and words[-1].startswith(value_words[-1]):
+            return True
+    return False
+
+def matches_condition(file, condition):
+    field, operator, value = condition
+    if field == 'parents':
+        return value in file['parents']
+    if field not in ('name', 'mimeType', 'trashed'):
+        raise ApiError(400, 'Invalid Value', 'invalid')
+    if operator == 'contains' and field == 'name':
+        return name_contains(file['name'], value)
+    if operator == 'contains':
+        return value.lower() in file[field].lower()
+    return (file[field] == value) == (operator == '=')
+
+def read_body(body):
+    if body is None:
+        return b''
+    if hasattr(body, 'read'):
+        body = body.read()
+    return body.encode('utf-8') if not isinstance(body, bytes) else body
+
+def load_json(body):
+    body = read_body(body)
+    return json.loads(body.decode('utf-8')) if body else {}
+
+def get_response(status, body=None, headers=None):
+    import httplib2
+    response_headers = {'status': status, 'content-type': 'application/json; charset=UTF-8'}
+    response_headers.update(headers or {})
+    if body is None:
+        content = b''
+    elif isinstance(body, bytes):
+        content = body
+    else:
+        content = json.dumps(body).encode('utf-8')
+    return httplib2.Response(response_headers), content
+
+def get_error_response(status, message, reason):
+    return get_response(status, {'error': {'code': status, 'message': message,
+                                           'errors': [{'domain': 'global', 'reason': reason, 'message': message}]}})
+
+class FakeBackend:
+    """Spreadsheets and Drive files kept in memory, answering requests the same way the real APIs do.
+
+    It takes the place of the httplib2.Http of every service, and since it's thread safe one backend is shared by
+    every thread. The latency is waited out before a request is handled and outside of the lock, so requests made at
+    the same time overlap the way they would over the network. A fraction error_rate of the requests fail with one of
+    error_statuses before anything is changed; pass a seed to fail the same requests every run.
+    """
+    def __init__(self, latency=0, error_rate=0, error_statuses=DEFAULT_ERROR_STATUSES, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.random = random.Random(seed)
+        self.lock = threading.RLock()
+        self.clear()
+        self.routes = [
+            ('GET', r'/v4/spreadsheets/([^/:]+)$', self.get_spreadsheet),
+            ('POST', r'/v4/spreadsheets/([^/:]+):batchUpdate$', self.batch_update),
+            ('GET', r'/v4/spreadsheets/([^/:]+)/values:batchGet$', self.batch_get_values),
+            ('POST', r'/v4/spreadsheets/([^/:]+)/values:batchUpdate$', self.batch_update_values),
+            ('POST', r'/v4/spreadsheets/([^/:]+)/values/([^/:]+):clear$', self.clear_values),
+            ('GET', r'/v4/spreadsheets/([^/:]+)/values/([^/:]+)$', self.get_values),
+            ('PUT', r'/v4/spreadsheets/([^/:]+)/values/([^/:]+)$', self.update_values),
+            ('GET', r'/drive/v3/files$', self.list_files),
+            ('POST', r'/drive/v3/files$', self.create_file),
+            ('GET', r'/drive/v3/files/([^/]+)$', self.get_file),
+            ('PATCH', r'/drive/v3/files/([^/]+)$', self.update_file),
+            ('GET', r'/drive/v3/files/([^/]+)/export$', self.export_file),
+            ('PATCH', r'/drive/v3/files/([^/]+)/revisions/([^/]+)$', self.update_revision),
+            ('GET', r'/drive/v3/files/([^/]+)/permissions$', self.list_permissions),
+            ('POST', r'/upload/drive/v3/files$', self.start_upload),
+            ('PATCH', r'/upload/drive/v3/files/([^/]+)$', self.start_upload),
+            ('PUT', r'/upload/drive/v3/files$', self.upload_chunk)
+        ]
+
+    def clear(self):
+        with self.lock:
+            self.spreadsheets = {}
+            self.files = OrderedDict()
+            self.uploads = {}
+            self.request_count = 0
+            self.injected_error_count = 0
+
+    def get_discovery_document(self, api, version):
+        return get_discovery_document(api, version)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        """Handles a request the way httplib2.Http.request sends it.
+
+        Returns:
+            tuple of the httplib2.Response and its content.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(uri)
+        query = parse_qs(url.query, keep_blank_values=True)
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        if 'x-http-method-override' in headers:
+            # long GET requests are sent as a POST with their query string as the body
+            method = headers['x-http-method-override']
+            query.update(parse_qs(read_body(body).decode('utf-8'), keep_blank_values=True))
+            body = None
+        with self.lock:
+            self.request_count += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.injected_error_count += 1
+                status = self.random.choice(self.error_statuses)
+                return get_error_response(status, 'Injected error', ERROR_REASONS.get(status, 'backendError'))
+            for route_method, pattern, handler in self.routes:
+                match = re.match(pattern, url.path)
+                if match is None or route_method != method:
+                    continue
+                try:
+                    return handler(*[unquote(group) for group in match.groups()], query=query, body=body,
+                                   headers=headers)
+                except ApiError as error:
+                    return get_error_response(error.status, error.message, error.reason)
+        return get_error_response(404, 'Not Found', 'notFound')
+
+    def new_id(self):
+        return 'fake-' + uuid.uuid4().hex
+
+    # Sheets
+
+    def add_spreadsheet(self, spreadsheet_id=None, title='Untitled spreadsheet'):
+        """Adds an empty spreadsheet with a single Sheet1, like a new spreadsheet in Google Sheets."""
+        with self.lock:
+            spreadsheet_id = spreadsheet_id or self.new_id()
+            self.spreadsheets[spreadsheet_id] = {'spreadsheetId': spreadsheet_id, 'properties': {'title': title},
+                                                 'sheets': []}
+            self.add_sheet(self.spreadsheets[spreadsheet_id]['sheets'], {'sheetId': 0, 'title': 'Sheet1'})
+            return spreadsheet_id
+
+    def find_spreadsheet(self, spreadsheet_id):
+        spreadsheet = self.spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            raise ApiError(404, 'Requested entity was not found.')
+        return spreadsheet
+
+    def find_sheet(self, sheets, title=None, sheet_id=None):
+        for sheet in sheets:
+            if (title is not None and sheet['properties']['title'] == title) or \
+                    (sheet_id is not None and sheet['properties']['sheetId'] == sheet_id):
+                return sheet
+        return None
+
+    def find_range(self, spreadsheet, range_name):
+        title, start_row, end_row, start_column, end_column = parse_range(range_name)
+        sheet = self.find_sheet(spreadsheet['sheets'], title=title)
+        if sheet is None:
+            raise ApiError(400, 'Unable to parse range: {}'.format(range_name))
+        return sheet, start_row, end_row, start_column, end_column
+
+    def add_sheet(self, sheets, properties):
+        properties = copy.deepcopy(properties)
+        properties.setdefault('title', 'Sheet{}'.format(len(sheets) + 1))
+        if self.find_sheet(sheets, title=properties['title']) is not None:
+            raise ApiError(400, 'A sheet with the name "{}" already exists. Please enter another name.'.format(
+                properties['title']))
+        if 'sheetId' not in properties:
+            properties['sheetId'] = self.random.randint(1, 2 ** 31 - 1)
+        elif self.find_sheet(sheets, sheet_id=properties['sheetId']) is not None:
+            raise ApiError(400, 'A sheet with the id {} already exists.'.format(properties['sheetId']))
+        properties.setdefault('sheetType', 'GRID')
+        grid_properties = properties.setdefault('gridProperties', {})
+        grid_properties.setdefault('rowCount', DEFAULT_ROW_COUNT)
+        grid_properties.setdefault('columnCount', DEFAULT_COLUMN_COUNT)
+        sheet = {'properties': properties, 'values': []}
+        sheets.insert(min(properties.get('index', len(sheets)), len(sheets)), sheet)
+        for index, sheet in enumerate(sheets):
+            sheet['properties']['index'] = index
+        return properties
+
+    def set_cell(self, sheet, row, column, value):
+        values = sheet['values']
+        while len(values) <= row:
+            values.append([])
+        if len(values[row]) <= column:
+            values[row].extend([None] * (column + 1 - len(values[row])))
+        values[row][column] = value
+        grid_properties = sheet['properties']['gridProperties']
+        grid_properties['rowCount'] = max(grid_properties['rowCount'], row + 1)
+        grid_properties['columnCount'] = max(grid_properties['columnCount'], column + 1)
+
+    def read_range(self, spreadsheet, range_name, major_dimension='ROWS'):
+        sheet, start_row, end_row, start_column, end_column = self.find_range(spreadsheet, range_name)
+        values = sheet['values']
+        end_row = len(values) if end_row is None else min(end_row, len(values))
+        rows = [[format_value(value) for value in values[row][start_column:end_column]]
+                for row in range(start_row, end_row)]
+        if major_dimension == 'COLUMNS':
+            width = max([len(row) for row in rows] + [0])
+            rows = [[row[column] if column < len(row) else '' for row in rows] for column in range(width)]
+        value_range = {'range': range_name, 'majorDimension': major_dimension}
+        rows = trim_values(rows)
+        if rows:
+            value_range['values'] = rows
+        return value_range
+
+    def write_range(self, spreadsheet, range_name, values, major_dimension='ROWS'):
+        sheet, start_row, end_row, start_column, end_column = self.find_range(spreadsheet, range_name)
+        updated_cells = 0
+        for i, values_list in enumerate(values or []):
+            for j, value in enumerate(values_list):
+                if value is None:
+                    continue
+                row, column = (start_row + i, start_column + j) if major_dimension != 'COLUMNS' else \
+                    (start_row + j, start_column + i)
+                self.set_cell(sheet, row, column, value)
+                updated_cells += 1
+        return {'spreadsheetId': spreadsheet['spreadsheetId'], 'updatedRange': range_name,
+                'updatedCells': updated_cells}
+
+    def set_values(self, spreadsheet_id, range_name, values, major_dimension='ROWS'):
+        """Writes values straight into a spreadsheet, adding the sheet if it doesn't exist yet, to set up a run."""
+        with self.lock:
+            if spreadsheet_id not in self.spreadsheets:
+                self.add_spreadsheet(spreadsheet_id)
+            spreadsheet = self.spreadsheets[spreadsheet_id]
+            title = parse_range(range_name)[0]
+            if self.find_sheet(spreadsheet['sheets'], title=title) is None:
+                sheet_id = max(sheet['properties']['sheetId'] for sheet in spreadsheet['sheets']) + 1
+                self.add_sheet(spreadsheet['sheets'], {'sheetId': sheet_id, 'title': title})
+            return self.write_range(spreadsheet, range_name, values, major_dimension)
+
+    def get_sheet_values(self, spreadsheet_id, range_name, major_dimension='ROWS'):
+        with self.lock:
+            return self.read_range(self.find_spreadsheet(spreadsheet_id), range_name, major_dimension).get('values',
+                                                                                                        [])
+
+    def get_spreadsheet(self, spreadsheet_id, query, body, headers):
+        spreadsheet = self.find_spreadsheet(spreadsheet_id)
+        return get_response(200, {
+            'spreadsheetId': spreadsheet_id,
+            'properties': spreadsheet['properties'],
+            'sheets': [{'properties': sheet['properties']} for sheet in spreadsheet['sheets']]
+        })
+
+    def get_grid_range(self, sheets, grid_range, request_name, index):
+        sheet = self.find_sheet(sheets, sheet_id=grid_range.get('sheetId', 0))
+        if sheet is None:
+            raise ApiError(400, 'Invalid requests[{}].{}: No grid with id: {}'.format(
+                index, request_name, grid_range.get('sheetId', 0)))
+        grid_properties = sheet['properties']['gridProperties']
+        return (sheet, grid_range.get('startRowIndex', 0), grid_range.get('endRowIndex', grid_properties['rowCount']),
+                grid_range.get('startColumnIndex', 0),
+                grid_range.get('endColumnIndex', grid_properties['columnCount']))
+
+    def apply_request(self, sheets, request, index):
+        if len(request) != 1:
+            raise ApiError(400, 'Invalid requests[{}]: exactly one kind of request has to be set.'.format(index))
+        request_name, request_body = list(request.items())[0]
+        if request_name == 'addSheet':
+            return {'addSheet': {'properties': self.add_sheet(sheets, request_body.get('properties', {}))}}
+        if request_name == 'deleteSheet':
+            sheet = self.find_sheet(sheets, sheet_id=request_body.get('sheetId'))
+            if sheet is None:
+                raise ApiError(400, 'Invalid requests[{}].deleteSheet: No sheet with id: {}'.format(
+                    index, request_body.get('sheetId')))
+            sheets.remove(sheet)
+        elif request_name == 'updateSheetProperties':
+            properties = request_body.get('properties', {})
+            sheet = self.find_sheet(sheets, sheet_id=properties.get('sheetId', 0))
+            if sheet is None:
+                raise ApiError(400, 'Invalid requests[{}].updateSheetProperties: No grid with id: {}'.format(
+                    index, properties.get('sheetId', 0)))
+            for key, value in properties.items():
+                if isinstance(value, dict):
+                    sheet['properties'].setdefault(key, {}).update(value)
+                else:
+                    sheet['properties'][key] = value
+        elif request_name == 'repeatCell':
+            sheet, start_row, end_row, start_column, end_column = self.get_grid_range(
+                sheets, request_body.get('range', {}), request_name, index)
+            user_entered_value = request_body.get('cell', {}).get('userEnteredValue')
+            if user_entered_value and 'userEnteredValue' in request_body.get('fields', ''):
+                value = list(user_entered_value.values())[0]
+                for row in range(start_row, end_row):
+                    for column in range(start_column, end_column):
+                        self.set_cell(sheet, row, column, value)
+        elif request_name in FORMAT_REQUESTS:
+            if 'range' in request_body:
+                self.get_grid_range(sheets, request_body['range'], request_name, index)
+        else:
+            raise ApiError(400, "Invalid requests[{}]: {} isn't supported by the fake backend.".format(
+                index, request_name))
+        return {}
+
+    def batch_update(self, spreadsheet_id, query, body, headers):
+        spreadsheet = self.find_spreadsheet(spreadsheet_id)
+        # the requests are applied to a copy so that nothing changes if one of them fails, like the real API
+        sheets = [{'properties': copy.deepcopy(sheet['properties']), 'values': [row[:] for row in sheet['values']]}
+                  for sheet in spreadsheet['sheets']]
+        replies = [self.apply_request(sheets, request, index)
+                   for index, request in enumerate(load_json(body).get('requests', []))]
+        spreadsheet['sheets'] = sheets
+        return get_response(200, {'spreadsheetId': spreadsheet_id, 'replies': replies})
+
+    def get_values(self, spreadsheet_id, range_name, query, body, headers):
+        return get_response(200, self.read_range(self.find_spreadsheet(spreadsheet_id), range_name,
+                                                 query.get('majorDimension', ['ROWS'])[0]))
+
+    def batch_get_values(self, spreadsheet_id, query, body, headers):
+        spreadsheet = self.find_spreadsheet(spreadsheet_id)
+        major_dimension = query.get('majorDimension', ['ROWS'])[0]
+        return get_response(200, {
+            'spreadsheetId': spreadsheet_id,
+            'valueRanges': [self.read_range(spreadsheet, range_name, major_dimension)
+                            for range_name in query.get('ranges', [])]
+        })
+
+    def update_values(self, spreadsheet_id, range_name, query, body, headers):
+        value_range = load_json(body)
+        return get_response(200, self.write_range(self.find_spreadsheet(spreadsheet_id), range_name,
+                                                  value_range.get('values'), value_range.get('majorDimension')))
+
+    def batch_update_values(self, spreadsheet_id, query, body, headers):
+        spreadsheet = self.find_spreadsheet(spreadsheet_id)
+        data = load_json(body).get('data', [])
+        # every range is checked before anything is written
+        for value_range in data:
+            self.find_range(spreadsheet, value_range['range'])
+        responses = [self.write_range(spreadsheet, value_range['range'], value_range.get('values'),
+                                      value_range.get('majorDimension')) for value_range in data]
+        return get_response(200, {
+            'spreadsheetId': spreadsheet_id,
+            'totalUpdatedCells': sum(response['updatedCells'] for response in responses),
+            'responses': responses
+        })
+
+    def clear_values(self, spreadsheet_id, range_name, query, body, headers):
+        sheet, start_row, end_row, start_column, end_column = self.find_range(self.find_spreadsheet(spreadsheet_id),
+                                                                              range_name)
+        values = sheet['values']
+        for row in range(start_row, len(values) if end_row is None else min(end_row, len(values))):
+            for column in range(start_column, len(values[row]) if end_column is None else
+                                min(end_column, len(values[row]))):
+                values[row][column] = None
+        return get_response(200, {'spreadsheetId': spreadsheet_id, 'clearedRange': range_name})
+
+    # Drive
+
+    def add_file(self, name, mime_type=FOLDER_MIME_TYPE, parents=(), data=None, app_properties=None, file_id=None):
+        """Adds a file or folder straight to Drive, to set up a run. Returns its id."""
+        with self.lock:
+            file = {
+                'kind': 'drive#file',
+                'id': file_id or self.new_id(),
+                'name': name,
+                'mimeType': mime_type,
+                'parents': list(parents),
+                'trashed': False,
+                'version': '1'
+            }
+            if app_properties:
+                file['appProperties'] = dict(app_properties)
+            self.files[file['id']] = {'file': file, 'data': data, 'revisions': {}}
+            return file['id']
+
+    def find_file(self, file_id):
+        entry = self.files.get(file_id)
+        if entry is None:
+            raise ApiError(404, 'File not found: {}.'.format(file_id))
+        return entry
+
+    def save_file(self, metadata, data=None, file_id=None, query=None):
+        """Creates a file from its metadata, or updates the file with file_id. Returns the file's resource."""
+        metadata = dict(metadata)
+        if file_id is None:
+            for parent_id in metadata.get('parents', []):
+                self.find_file(parent_id)
+            file_id = self.add_file(metadata.get('name', 'Untitled'),
+                                    metadata.get('mimeType', 'application/octet-stream'), metadata.get('parents', []),
+                                    data, metadata.get('appProperties'))
+            return self.files[file_id]['file']
+        entry = self.find_file(file_id)
+        file = entry['file']
+        app_properties = metadata.pop('appProperties', None)
+        metadata.pop('parents', None)
+        file.update(metadata)
+        if app_properties:
+            file.setdefault('appProperties', {}).update(app_properties)
+            file['appProperties'] = {key: value for key, value in file['appProperties'].items() if value is not None}
+        for parent_id in ','.join((query or {}).get('addParents', [])).split(','):
+            if parent_id:
+                self.find_file(parent_id)
+                file['parents'].append(parent_id)
+        for parent_id in ','.join((query or {}).get('removeParents', [])).split(','):
+            if parent_id in file['parents']:
+                file['parents'].remove(parent_id)
+        if data is not None:
+            entry['data'] = data
+            file['version'] = str(int(file['version']) + 1)
+        return file
+
+    def list_files(self, query, body, headers):
+        conditions = parse_query(query.get('q', [''])[0])
+        page_size = min(int(query.get('pageSize', [DEFAULT_PAGE_SIZE])[0]), MAX_PAGE_SIZE)
+        start = int(query.get('pageToken', ['0'])[0] or 0)
+        files = [entry['file'] for entry in self.files.values()
+                 if all(matches_condition(entry['file'], condition) for condition in conditions)]
+        file_list = {'kind': 'drive#fileList', 'files': files[start:start + page_size]}
+        if start + page_size < len(files):
+            file_list['nextPageToken'] = str(start + page_size)
+        return get_response(200, file_list)
+
+    def get_file(self, file_id, query, body, headers):
+        return get_response(200, self.find_file(file_id)['file'])
+
+    def create_file(self, query, body, headers):
+        return get_response(200, self.save_file(load_json(body)))
+
+    def update_file(self, file_id, query, body, headers):
+        return get_response(200, self.save_file(load_json(body), file_id=file_id, query=query))
+
+    def export_file(self, file_id, query, body, headers):
+        entry = self.find_file(file_id)
+        data = entry['data'] or b''
+        response_headers = {'content-type': query.get('mimeType', [''])[0], 'content-length': str(len(data))}
+        match = re.match(r'bytes=(\d+)-(\d*)$', headers.get('range', ''))
+        if match is None:
+            return get_response(200, data, response_headers)
+        # a download asks for a chunk at a time and reads the file's size from the content-range
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+        response_headers.update({'content-range': 'bytes {}-{}/{}'.format(start, end, len(data)),
+                                 'content-length': str(max(end - start + 1, 0))})
+        return get_response(206, data[start:end + 1], response_headers)
+
+    def update_revision(self, file_id, revision_id, query, body, headers):
+        revision = self.find_file(file_id)['revisions'].setdefault(revision_id, {'kind': 'drive#revision',
+                                                                                'id': revision_id})
+        revision.update(load_json(body))
+        return get_response(200, revision)
+
+    def list_permissions(self, file_id, query, body, headers):
+        self.find_file(file_id)
+        return get_response(200, {'kind': 'drive#permissionList',
+                                  'permissions': [{'kind': 'drive#permission', 'id': 'fake-owner', 'type': 'user',
+                                                   'role': 'owner'}]})
+
+    def start_upload(self, file_id=None, query=None, body=None, headers=None):
+        upload_type = query.get('uploadType', [''])[0]
+        if file_id is not None:
+            self.find_file(file_id)
+        if upload_type == 'media':
+            return get_response(200, self.save_file({}, read_body(body), file_id=file_id, query=query))
+        if upload_type != 'resumable':
+            raise ApiError(400, "Only resumable and media uploads are supported by the fake backend.")
+        upload_id = uuid.uuid4().hex
+        size = headers.get('x-upload-content-length')
+        self.uploads[upload_id] = {'file_id': file_id, 'metadata': load_json(body), 'query': query,
+                                   'data': bytearray(), 'size': int(size) if size is not None else None}
+        return get_response(200, headers={
+            'location': '{}upload/{}files?uploadType=resumable&upload_id={}'.format(DRIVE_ROOT_URL,
+                                                                                   DRIVE_SERVICE_PATH, upload_id)})
+
+    def upload_chunk(self, query, body, headers):
+        upload_id = query.get('upload_id', [''])[0]
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise ApiError(404, 'Upload session not found: {}.'.format(upload_id))
+        match = re.match(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$', headers.get('content-range', 'bytes */*'))
+        if match is None:
+            raise ApiError(400, 'Invalid Content-Range: {}.'.format(headers['content-range']))
+        start, end, size = match.groups()
+        if size != '*':
+            upload['size'] = int(size)
+        if start is not None:
+            if int(start) > len(upload['data']):
+                raise ApiError(400, 'Chunk starts at byte {} but only {} bytes were received.'.format(
+                    start, len(upload['data'])))
+            upload['data'][int(start):] = read_body(body)
+        if upload['size'] is not None and len(upload['data']) >= upload['size']:
+            del self.uploads[upload_id]
+            return get_response(200, self.save_file(upload['metadata'], bytes(upload['data']), upload['file_id'],
+                                                    upload['query']))
+        # 308 Resume Incomplete, with the bytes received so far
+        return get_response(308, headers={'range': 'bytes=0-{}'.format(len(upload['data']) - 1)}
+                            if upload['data'] else None)
+
+backend = None
+backend_lock = threading.Lock()
+
+def set_up_environment(fake_backend, env):
+    fake_backend.add_spreadsheet(env['ratings_spreadsheet_id'], 'Ratings')
+    fake_backend.add_spreadsheet(env['prize_points_spreadsheet_id'], 'Prize Points')
+    fake_backend.add_file('Results', file_id=env['results_folder_id'])
+
+def get_backend():
+    """Returns the process' backend, set up from the fake_backend options of config.CURRENT_ENV the first time.
+
+    The environment's ratings and prize points spreadsheets and its results folder are created empty.
+    """
+    global backend
+    with backend_lock:
+        if backend is None:
+            backend = FakeBackend(**config.CURRENT_ENV.get('fake_backend', {}))
+            set_up_environment(backend, config.CURRENT_ENV)
+        return backend
+
+def reset():
+    """Throws away every spreadsheet and file but the environment's empty spreadsheets and results folder.
+
+    The backend itself is kept, so sessions and services that were already built carry on working with it.
+    """
+    with backend_lock:
+        if backend is not None:
+            backend.clear()
+            set_up_environment(backend, config.CURRENT_ENV)
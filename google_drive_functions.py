@@ -1,13 +1,18 @@
 from __future__ import print_function
 import shared_functions
-import httplib2
+import api_tracer
 import config
+import profiler
+import io
+import json
+import os
+import time
+import socket
+import hashlib
+import threading
+import glob
 
-from pprint import pprint
-from apiclient import discovery, errors
-from apiclient.http import MediaFileUpload
 from datetime import date as datetime_date
-from webbrowser import open
 
 # If modifying these scopes, delete your previously saved credentials
 # at ~/.credentials/client_secret.json
@@ -15,31 +20,199 @@ SCOPES = ['https://www.googleapis.com/auth/drive', 'https://www.googleapis.com/a
 CLIENT_SECRET_FILE = 'client_secret.json'
 APPLICATION_NAME = 'TT Automation'
 CACHE_FILE_NAME = 'api.json'
+FOLDER_ID_CACHE_FILE_NAME = 'folder_ids.json'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+LIST_PAGE_SIZE = 1000 # the most files().list returns per page
+UPLOAD_SESSION_CACHE_FILE_NAME = 'upload_sessions.json'
+UPLOAD_DATA_FILE_NAME = 'upload-{}.xlsx'
+UPLOAD_CHUNK_SIZE = 256 * 1024 # resumable upload chunks have to be a multiple of 256 KB
+UPLOAD_SESSION_MAX_AGE = 6 * 24 * 60 * 60 # seconds, Drive keeps an unfinished upload for a week
+UPLOAD_MAX_RETRIES = 8
+SPREADSHEET_MIME_TYPE = 'application/vnd.google-apps.spreadsheet'
+WORKBOOK_HASH_PROPERTY = 'workbookHash'
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
 
 # Defaults to test env. If you want to use live env, go to config and set CURRENT_ENV = LIVE_ENV
 RESULTS_FOLDER_ID = config.CURRENT_ENV['results_folder_id']
 
 def get_credentials():
-    credentials = shared_functions.get_credentials(cache_file_name=CACHE_FILE_NAME,
-                                                   client_secret_file=CLIENT_SECRET_FILE,
-                                                   scopes=SCOPES, application_name=APPLICATION_NAME)
-    return credentials
+    return get_session().credentials
+
+def get_session():
+    return shared_functions.get_session(cache_file_name=CACHE_FILE_NAME, client_secret_file=CLIENT_SECRET_FILE,
+                                        scopes=SCOPES, application_name=APPLICATION_NAME)
 
 def create_service():
-    credentials = get_credentials()
-    http = credentials.authorize(httplib2.Http())
-    service = discovery.build('drive', 'v3', http=http)
-    return service
+    return get_session().build('drive', 'v3')
 
 def create_permissive_service():
     service = create_service()
     shared_functions.check_permissions(service, RESULTS_FOLDER_ID, CACHE_FILE_NAME)
     return service
 
+class DrivePermissionCheck(threading.Thread):
+    """Checks that the results folder can be reached with the cached credentials in the background.
+
+    Started along with the roster prefetch as soon as the league date is known, so somebody without access to Drive
+    finds out before typing in the night's results instead of once they're being uploaded.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self, name='drive permission check')
+        self.daemon = True
+        self.has_permission = None
+        self.error = None
+
+    def run(self):
+        try:
+            with api_tracer.phase('permissions'):
+                self.has_permission = shared_functions.has_permission(create_service(), RESULTS_FOLDER_ID)
+        except BaseException as error:
+            self.error = error
+
+    def report(self):
+        """Stops the run the way create_permissive_service does if the check is done and found no access, without
+        waiting for a check that's still running."""
+        if not self.is_alive() and self.has_permission is False:
+            shared_functions.deny_permission(CACHE_FILE_NAME)
+
+    def wait(self):
+        """Waits for the check and stops the run if there's no access. A check that failed, say because Drive
+        couldn't be reached, is made again."""
+        self.join()
+        if self.has_permission is None:
+            create_permissive_service()
+        elif not self.has_permission:
+            shared_functions.deny_permission(CACHE_FILE_NAME)
+
+class FolderIdCache:
+    """Remembers the Drive id of each school year and semester folder between runs.
+
+    Entries are keyed by (results folder, school year, semester, tryouts) so the test and live environments don't mix,
+    and are stored in ~/.credentials next to the cached credentials. A cached id is only trusted after a files().get
+    confirms the folder still exists and isn't in the trash; otherwise the folder is looked up again and the entry
+    replaced.
+    """
+    def __init__(self, cache_file_name):
+        self.cache_file_name = cache_file_name
+        self.folder_ids = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(school_year, semester=None, is_tryouts=False):
+        return '|'.join([RESULTS_FOLDER_ID, school_year, semester or '', 'tryouts' if is_tryouts else ''])
+
+    def load(self):
+        if self.folder_ids is None:
+            self.folder_ids = {}
+            cache_path = shared_functions.get_credential_path(self.cache_file_name)
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path) as cache_file:
+                        self.folder_ids = json.load(cache_file)
+                except ValueError:
+                    pass
+        return self.folder_ids
+
+    def save(self):
+        with open(shared_functions.get_credential_path(self.cache_file_name), 'w') as cache_file:
+            json.dump(self.folder_ids, cache_file, indent=2, sort_keys=True)
+
+    def get(self, service, key):
+        from apiclient import errors
+        with self.lock:
+            folder_id = self.load().get(key)
+            if folder_id is not None:
+                try:
+                    folder = shared_functions.execute(service.files().get(fileId=folder_id, fields='id,trashed'))
+                    if not folder.get('trashed'):
+                        self.hits += 1
+                        return folder_id
+                except errors.HttpError as error:
+                    if error.resp.status != 404:
+                        raise
+                del self.folder_ids[key]
+                self.save()
+            self.misses += 1
+            return None
+
+    def set(self, key, folder_id):
+        with self.lock:
+            if self.load().get(key) != folder_id:
+                self.folder_ids[key] = folder_id
+                self.save()
+
+    def report(self):
+        return 'Folder id cache: {} hits, {} misses'.format(self.hits, self.misses)
+
+folder_id_cache = FolderIdCache(FOLDER_ID_CACHE_FILE_NAME)
+
+def get_year_folder_name(file_name):
+    month, day, year = file_name
+    if datetime_date(year, month, day) < datetime_date(year, 5, 1):
+        return '{}-{}'.format(year - 1, year)
+    return '{}-{}'.format(year, year + 1)
+
+def get_semester(month):
+    semester_month_dict = {(8, 12): 'Fall', (1, 4): 'Spring', (5, 7): 'Summer'}
+    for month_ranges in semester_month_dict.keys():
+        if month in range(month_ranges[0], month_ranges[1] + 1):
+            return semester_month_dict[month_ranges]
+
+def get_year_folder_id(service, file_name):
+    key = FolderIdCache.get_key(get_year_folder_name(file_name))
+    year_folder_id = folder_id_cache.get(service, key)
+    if year_folder_id is None:
+        year_folder_id = determine_year_folder_id(service=service, file_name=file_name)
+        folder_id_cache.set(key, year_folder_id)
+    return year_folder_id
+
+def get_semester_folder_id(service, file_name, is_tryouts):
+    """Returns the id of the folder the league sheet goes in, from the folder id cache when possible.
+
+    The year and semester folders are only listed, and generated if they're missing, when the cache has no valid id.
+    """
+    key = FolderIdCache.get_key(get_year_folder_name(file_name), get_semester(file_name[0]), is_tryouts)
+    semester_folder_id = folder_id_cache.get(service, key)
+    if semester_folder_id is None:
+        year_folder_id = get_year_folder_id(service, file_name)
+        semester_folder_id = determine_semester_folder_id(service=service, file_name=file_name, is_tryouts=is_tryouts,
+                                                          year_folder_id=year_folder_id)
+        folder_id_cache.set(key, semester_folder_id)
+    return semester_folder_id
+
+def quote_query_string(string):
+    return "'{}'".format(string.replace('\\', '\\\\').replace("'", "\\'"))
+
+def list_children(service, parent_id, mime_type=FOLDER_MIME_TYPE, name_contains=None, name=None,
+                  file_fields='id, name'):
+    """Lists every child of a folder with the given MIME type that isn't in the trash.
+
+    The filtering is done by Drive in the query rather than after downloading every child, and every page of results
+    is followed. Each child has its id and name unless other file_fields are asked for.
+    """
+    query = "'{}' in parents and mimeType = '{}' and trashed = false".format(parent_id, mime_type)
+    if name_contains:
+        query += ' and name contains {}'.format(quote_query_string(name_contains))
+    if name:
+        query += ' and name = {}'.format(quote_query_string(name))
+    children = []
+    page_token = None
+    while True:
+        results = shared_functions.execute(service.files().list(
+            q=query, pageSize=LIST_PAGE_SIZE, fields='nextPageToken, files({})'.format(file_fields),
+            pageToken=page_token))
+        children.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return children
+
 def determine_year_folder_id(service, file_name):
-    results = service.files().list(
-        q="'{}' in parents".format(RESULTS_FOLDER_ID), fields="nextPageToken, files(id, name)").execute()
-    year_folders = results.get('files', [])
+    year_folders = list_children(service, RESULTS_FOLDER_ID)
     if year_folders:
         month, day, year = file_name
         for folder in year_folders:
@@ -53,11 +226,10 @@ def determine_year_folder_id(service, file_name):
     return generate_year_folder_id(service=service, file_name=file_name)
 
 def determine_semester_folder_id(service, file_name, is_tryouts, year_folder_id):
-    results = service.files().list(
-        q="'{}' in parents".format(year_folder_id), fields="nextPageToken, files(id, name)").execute()
-    semester_folders = results.get('files', [])
-    semester_month_dict = {(8, 12): 'fall', (1, 4): 'spring', (5, 7): 'summer'}
     month, day, year = file_name
+    semester_folders = list_children(service, year_folder_id,
+                                     name_contains='try' if is_tryouts else get_semester(month))
+    semester_month_dict = {(8, 12): 'fall', (1, 4): 'spring', (5, 7): 'summer'}
 
     for month_ranges in semester_month_dict.keys():
         if month in range(month_ranges[0], month_ranges[1] + 1):
@@ -87,21 +259,13 @@ def determine_semester_folder_id(service, file_name, is_tryouts, year_folder_id)
             return returned_folder_id
 
 def generate_year_folder_id(service, file_name):
-    month, day, year = file_name
-    date_beginning = datetime_date(year, 5, 1)
-    league_date = datetime_date(year, month, day)
-
-    if league_date < date_beginning:
-        folder_name = '{}-{}'.format(year - 1, year)
-    else:
-        folder_name = '{}-{}'.format(year, year + 1)
-
+    folder_name = get_year_folder_name(file_name)
     file_metadata = {
         'parents': [RESULTS_FOLDER_ID],
         'name': folder_name,
-        'mimeType': 'application/vnd.google-apps.folder'
+        'mimeType': FOLDER_MIME_TYPE
     }
-    file = service.files().create(body=file_metadata, fields='id').execute()
+    file = create_folder(service, file_metadata)
     return file['id']
 
 def generate_semester_folder_id(service, year, semester, year_folder_id, is_tryouts=False):
@@ -109,28 +273,303 @@ def generate_semester_folder_id(service, year, semester, year_folder_id, is_tryo
     file_metadata = {
         'parents': [year_folder_id],
         'name': folder_name,
-        'mimeType': 'application/vnd.google-apps.folder'
+        'mimeType': FOLDER_MIME_TYPE
     }
-    file = service.files().create(body=file_metadata, fields='id').execute()
+    file = create_folder(service, file_metadata)
     return file['id']
 
-def upload_file(service, drive_file_name, excel_file_name, semester_folder_id):
+def create_folder(service, file_metadata):
+    # a create whose response was lost may still have made the folder, so it's looked for before trying again
+    def find_folder():
+        folders = list_children(service, file_metadata['parents'][0], name=file_metadata['name'])
+        return folders[0] if folders else None
+    return shared_functions.execute(service.files().create(body=file_metadata, fields='id'), find_result=find_folder)
+
+upload_session_lock = threading.RLock()
+
+def get_upload_data_path(session_key):
+    return shared_functions.get_credential_path(
+        UPLOAD_DATA_FILE_NAME.format(hashlib.sha1(session_key.encode('utf-8')).hexdigest()))
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def load_upload_sessions():
+    """Returns the saved upload sessions young enough for Drive to still have them.
+
+    Older sessions are dropped from the cache along with the workbooks saved for them, as are saved workbooks left
+    behind by uploads that stopped before they got a session.
+    """
+    cache_path = shared_functions.get_credential_path(UPLOAD_SESSION_CACHE_FILE_NAME)
+    with upload_session_lock:
+        upload_sessions = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path) as cache_file:
+                    upload_sessions = json.load(cache_file)
+            except ValueError:
+                pass
+        now = time.time()
+        live_upload_sessions = {key: upload_session for key, upload_session in upload_sessions.items()
+                                if now - upload_session['created'] < UPLOAD_SESSION_MAX_AGE}
+        if len(live_upload_sessions) < len(upload_sessions):
+            for key in set(upload_sessions) - set(live_upload_sessions):
+                remove_file(get_upload_data_path(key))
+            write_upload_sessions(live_upload_sessions)
+        live_data_paths = set(get_upload_data_path(key) for key in live_upload_sessions)
+        data_path_pattern = os.path.join(os.path.dirname(cache_path), UPLOAD_DATA_FILE_NAME.format('*'))
+        for data_path in glob.glob(data_path_pattern):
+            if data_path not in live_data_paths and now - os.path.getmtime(data_path) >= UPLOAD_SESSION_MAX_AGE:
+                remove_file(data_path)
+        return live_upload_sessions
+
+def write_upload_sessions(upload_sessions):
+    with open(shared_functions.get_credential_path(UPLOAD_SESSION_CACHE_FILE_NAME), 'w') as cache_file:
+        json.dump(upload_sessions, cache_file, indent=2, sort_keys=True)
+
+def save_upload_session(session_key, resumable_uri):
+    with upload_session_lock:
+        upload_sessions = load_upload_sessions()
+        if resumable_uri is None:
+            upload_sessions.pop(session_key, None)
+            remove_file(get_upload_data_path(session_key))
+        else:
+            upload_sessions[session_key] = {'uri': resumable_uri, 'created': time.time()}
+        write_upload_sessions(upload_sessions)
+
+def get_upload_data(session_key, workbook_data):
+    """Returns the workbook to upload for session_key, which is the one saved when its session started if it has one.
+
+    A workbook rebuilt after a restart only differs from the one whose upload was cut off in its docProps, but a
+    session can only carry on with the bytes it started with.
+    """
+    data_path = get_upload_data_path(session_key)
+    with upload_session_lock:
+        if session_key in load_upload_sessions() and os.path.exists(data_path):
+            with open(data_path, 'rb') as data_file:
+                return data_file.read()
+        with open(data_path, 'wb') as data_file:
+            data_file.write(workbook_data)
+    return workbook_data
+
+def print_upload_progress(drive_file_name, progress):
+    print('Uploading {}: {:.0f}%'.format(drive_file_name, progress * 100))
+
+def resume_upload(request):
+    """Asks Drive how much of a resumable upload it already has and moves the request on to the first missing byte.
+
+    Sends the empty PUT with a Content-Range of bytes */<size> that the resumable upload protocol uses to query an
+    upload session.
+
+    Returns:
+        The response body if Drive already has the whole file, otherwise None.
+    """
+    from apiclient import errors
+    size = request.resumable.size()
+    headers = {'Content-Range': 'bytes */{}'.format('*' if size is None else size), 'Content-Length': '0'}
+    response, content = request.http.request(request.resumable_uri, method='PUT', headers=headers)
+    if response.status in (200, 201):
+        return request.postproc(response, content)
+    if response.status != 308:
+        raise errors.HttpError(response, content, uri=request.uri)
+    # the range header is bytes=0-<last byte received>, and is left out if nothing was received
+    request.resumable_progress = int(response['range'].split('-')[1]) + 1 if 'range' in response else 0
+    if 'location' in response:
+        request.resumable_uri = response['location']
+    return None
+
+def execute_resumable(request, session_key, progress_callback=None):
+    """Sends a resumable upload request chunk by chunk until it's finished.
+
+    Chunks that fail with a 429 or 5xx, or because the connection dropped, are retried with exponential backoff, and
+    Drive is asked how much it already has before carrying on. The upload session is saved under session_key in
+    ~/.credentials so an upload cut off by a restart picks up where it left off the next time it's run.
+
+    Returns:
+        The response body of the finished upload.
+    """
+    from apiclient import errors
+    import httplib2
+    upload_session = load_upload_sessions().get(session_key)
+    if upload_session is not None:
+        request.resumable_uri = upload_session['uri']
+    saved_uri = request.resumable_uri
+    needs_resume = upload_session is not None
+
+    response = None
+    retries = 0
+    while response is None:
+        try:
+            if needs_resume and request.resumable_uri is not None:
+                with profiler.span('upload status'):
+                    response = resume_upload(request)
+                needs_resume = False
+                continue
+            with profiler.span('upload chunk'):
+                status, response = request.next_chunk()
+        except errors.HttpError as error:
+            if error.resp.status in (404, 410) and request.resumable_uri is not None:
+                # the upload session expired, so the upload starts over
+                print('The upload session for {} expired, starting the upload over.'.format(session_key))
+                request.resumable_uri = None
+                request.resumable_progress = 0
+            elif not shared_functions.is_transient_error(error) or retries >= UPLOAD_MAX_RETRIES:
+                raise
+        except (httplib2.HttpLib2Error, socket.error):
+            if retries >= UPLOAD_MAX_RETRIES:
+                raise
+        else:
+            retries = 0
+            if status is not None and progress_callback is not None:
+                progress_callback(status.progress())
+            continue
+        finally:
+            if request.resumable_uri != saved_uri:
+                saved_uri = request.resumable_uri
+                save_upload_session(session_key, saved_uri)
+        retries += 1
+        needs_resume = True
+        delay = shared_functions.get_backoff(retries)
+        print('Upload interrupted, retrying in {:.0f} seconds ({} of {}).'.format(delay, retries, UPLOAD_MAX_RETRIES))
+        with profiler.span('retry backoff'):
+            time.sleep(delay)
+
+    save_upload_session(session_key, None)
+    if progress_callback is not None:
+        progress_callback(1.0)
+    return response
+
+def download_media(request, media_file):
+    """Downloads a media request into media_file chunk by chunk.
+
+    Chunks that fail with a 429 or 5xx, or because the connection dropped, are retried with exponential backoff the
+    same way shared_functions.execute retries requests, picking up from the first byte that hasn't been written yet.
+    """
+    from apiclient import errors
+    from apiclient.http import MediaIoBaseDownload
+    import httplib2
+    downloader = MediaIoBaseDownload(media_file, request)
+    done = False
+    retries = 0
+    while not done:
+        try:
+            with profiler.span('download chunk'):
+                _, done = downloader.next_chunk()
+        except errors.HttpError as error:
+            if not shared_functions.is_transient_error(error) or retries >= shared_functions.MAX_RETRIES:
+                raise
+        except (httplib2.HttpLib2Error, socket.error):
+            if retries >= shared_functions.MAX_RETRIES:
+                raise
+        else:
+            retries = 0
+            continue
+        retries += 1
+        with profiler.span('retry backoff'):
+            time.sleep(shared_functions.get_backoff(retries))
+
+def get_workbook_hash(workbook_data):
+    """Hashes an .xlsx file's contents, leaving out docProps since it holds the time the workbook was made."""
+    import zipfile
+    workbook_hash = hashlib.sha1()
+    with zipfile.ZipFile(io.BytesIO(workbook_data)) as archive:
+        for member in sorted(archive.namelist()):
+            if member.startswith('docProps/'):
+                continue
+            workbook_hash.update(member.encode('utf-8'))
+            workbook_hash.update(archive.read(member))
+    return workbook_hash.hexdigest()
+
+def upload_file(service, drive_file_name, excel_file_name=None, semester_folder_id=None, workbook_data=None,
+                progress_callback=None, file_id=None):
+    """Uploads a league workbook as a Google Sheet, from excel_file_name or straight from workbook_data if given.
+
+    A new file is created in the semester folder unless the id of an existing file_id is given, in which case its
+    contents are replaced. The workbook's hash is stored in the file's appProperties. The upload is resumable and goes
+    through execute_resumable, so it survives a dropped connection. Progress is printed unless another
+    progress_callback is given.
+    """
+    from apiclient.http import MediaIoBaseUpload
+    if workbook_data is None:
+        with open(excel_file_name, 'rb') as excel_file:
+            workbook_data = excel_file.read()
+    workbook_hash = get_workbook_hash(workbook_data)
     file_metadata = {
-        'parents': [semester_folder_id],
         'name': drive_file_name,
-        'mimeType': 'application/vnd.google-apps.spreadsheet'
+        'mimeType': SPREADSHEET_MIME_TYPE,
+        'appProperties': {WORKBOOK_HASH_PROPERTY: workbook_hash}
     }
-    media = MediaFileUpload(excel_file_name, mimetype='application/vnd.ms-excel', resumable=True)
-    file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-    service.revisions().update(fileId=file['id'], revisionId=1, body={'published': True, 'publishAuto': True}).execute()
+    # the same workbook going to the same file or folder resumes the same upload session, even once it's been rebuilt
+    session_key = '{}/{} {}'.format(file_id or semester_folder_id, drive_file_name, workbook_hash)
+    workbook_data = get_upload_data(session_key, workbook_data)
+    media = MediaIoBaseUpload(io.BytesIO(workbook_data), mimetype='application/vnd.ms-excel',
+                              chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    if file_id is None:
+        file_metadata['parents'] = [semester_folder_id]
+        request = service.files().create(body=file_metadata, media_body=media, fields='id')
+    else:
+        request = service.files().update(fileId=file_id, body=file_metadata, media_body=media, fields='id')
+    if progress_callback is None:
+        progress_callback = lambda progress: print_upload_progress(drive_file_name, progress)
+    with profiler.span('drive upload', drive_file_name):
+        file = execute_resumable(request, session_key, progress_callback)
     return file['id']
 
-def main(file_name, service):
+def find_league_file(service, drive_file_name, semester_folder_id):
+    league_files = list_children(service, semester_folder_id, SPREADSHEET_MIME_TYPE, name=drive_file_name,
+                                 file_fields='id, name, appProperties')
+    return league_files[0] if league_files else None
+
+def sync_league_file(service, drive_file_name, semester_folder_id, excel_file_name=None, workbook_data=None):
+    """Uploads a league workbook unless the semester folder already has an identical copy of it.
+
+    An existing league sheet with the same name is updated in place, so it keeps its id and published URL, and is
+    left alone entirely if the hash in its appProperties matches the workbook's.
+
+    Returns:
+        dict with the league sheet's id and its status, CREATED, UPDATED or UNCHANGED.
+    """
+    if workbook_data is None:
+        with open(excel_file_name, 'rb') as excel_file:
+            workbook_data = excel_file.read()
+    league_file = find_league_file(service, drive_file_name, semester_folder_id)
+    if league_file is None:
+        return {'id': upload_file(service=service, drive_file_name=drive_file_name,
+                                  semester_folder_id=semester_folder_id, workbook_data=workbook_data),
+                'status': CREATED}
+    if league_file.get('appProperties', {}).get(WORKBOOK_HASH_PROPERTY) == get_workbook_hash(workbook_data):
+        print('{} is already up to date in Google Drive.'.format(drive_file_name))
+        return {'id': league_file['id'], 'status': UNCHANGED}
+    upload_file(service=service, drive_file_name=drive_file_name, workbook_data=workbook_data,
+                file_id=league_file['id'])
+    return {'id': league_file['id'], 'status': UPDATED}
+
+def publish_file(service, file_id):
+    shared_functions.execute(service.revisions().update(fileId=file_id, revisionId=1,
+                                                        body={'published': True, 'publishAuto': True}))
+    return file_id
+
+def publish_league_file(service, league_file):
+    """Publishes a league sheet returned by sync_league_file, whatever its status.
+
+    Publishing is idempotent, and an unchanged or updated sheet may have been uploaded by a run that stopped before
+    publishing it, so it's published again rather than trusting that an earlier run got that far.
+    """
+    publish_file(service=service, file_id=league_file['id'])
+    return league_file['id']
+
+def open_league_file(league_file_id):
+    import webbrowser
+    webbrowser.open("https://docs.google.com/spreadsheets/d/{}".format(league_file_id))
+
+def main(file_name, service, workbook_data=None):
     date_long, date_short, is_tryouts = shared_functions.reformat_file_name(file_name)
-    year_folder_id = determine_year_folder_id(service=service, file_name=date_long)
-    semester_folder_id = determine_semester_folder_id(service=service, file_name=date_long, is_tryouts=is_tryouts,
-                                                      year_folder_id=year_folder_id)
+    semester_folder_id = get_semester_folder_id(service=service, file_name=date_long, is_tryouts=is_tryouts)
     drive_file_name = '{}-{}-{}'.format(*date_short)
-    league_file_id = upload_file(service=service, drive_file_name=drive_file_name, excel_file_name=file_name,
-                                 semester_folder_id=semester_folder_id)
-    open("https://docs.google.com/spreadsheets/d/{}".format(league_file_id))
\ No newline at end of file
+    league_file = sync_league_file(service=service, drive_file_name=drive_file_name,
+                                   semester_folder_id=semester_folder_id, excel_file_name=file_name,
+                                   workbook_data=workbook_data)
+    open_league_file(publish_league_file(service=service, league_file=league_file))
\ No newline at end of file
@@ -1,12 +1,12 @@
 from __future__ import print_function
-from apiclient import discovery, errors
-from pprint import pprint
-from tabulate import tabulate
 import shared_functions
-import httplib2
+import api_tracer
 import config
-from collections import defaultdict
-import xlsxwriter
+import prize_points as prize_points_module
+import sheets_mirror
+from collections import OrderedDict
+import threading
+from skip_list import IndexableSkipList
 
 # If modifying these scopes, delete your previously saved credentials
 # at ~/.credentials/client_secret.json
@@ -20,31 +20,122 @@ RATINGS_SPREADSHEET_ID = config.CURRENT_ENV['ratings_spreadsheet_id']
 PRIZE_POINTS_SPREADSHEET_ID = config.CURRENT_ENV['prize_points_spreadsheet_id']
 
 def create_service():
-    credentials = shared_functions.get_credentials(cache_file_name=CACHE_FILE_NAME,
-                                                   client_secret_file=CLIENT_SECRET_FILE,
-                                                   scopes=SCOPES, application_name=APPLICATION_NAME)
-    http = credentials.authorize(httplib2.Http())
-    discoveryUrl = 'https://sheets.googleapis.com/$discovery/rest?version=v4'
-    service = discovery.build('sheets', 'v4', http=http, discoveryServiceUrl=discoveryUrl)
-    return service
-
-def get_sheets(service, spreadsheet_id):
+    session = shared_functions.get_session(cache_file_name=CACHE_FILE_NAME, client_secret_file=CLIENT_SECRET_FILE,
+                                           scopes=SCOPES, application_name=APPLICATION_NAME)
+    return session.build('sheets', 'v4')
+
+class BatchWriter:
+    """Queues value writes and formatting requests for a spreadsheet so they can be sent together.
+
+    flush() sends every queued formatting request in one spreadsheets().batchUpdate call followed by every queued
+    value write in one spreadsheets().values().batchUpdate call, so a whole run costs at most two round trips per
+    spreadsheet. Formatting requests go first so that sheets added with addSheet exist before values are written.
+    Formatting requests can be sent twice, but adding a sheet can't, so a batch that adds sheets is only retried after
+    an uncertain failure if the sheets aren't there.
+    """
+    def __init__(self, service, spreadsheet_id):
+        self.service = service
+        self.spreadsheet_id = spreadsheet_id
+        self.requests = []
+        self.value_ranges = []
+
+    def add_requests(self, requests):
+        self.requests.extend(requests)
+
+    def add_values(self, range, values, major_dimension='ROWS'):
+        self.value_ranges.append({'range': range, 'majorDimension': major_dimension, 'values': values})
+
+    def flush(self):
+        replies = []
+        if self.requests:
+            result = shared_functions.execute(self.service.spreadsheets().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'requests': self.requests}
+            ), is_idempotent=not self.get_added_sheet_titles(), find_result=self.find_added_sheets)
+            replies = result.get('replies', [])
+        if self.value_ranges:
+            shared_functions.execute(self.service.spreadsheets().values().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'valueInputOption': 'USER_ENTERED', 'data': self.value_ranges}
+            ))
+        self.requests = []
+        self.value_ranges = []
+        return replies
+
+    def get_added_sheet_titles(self):
+        return [request['addSheet']['properties']['title'] for request in self.requests if 'addSheet' in request]
+
+    def find_added_sheets(self):
+        # a batchUpdate is carried out in full or not at all, so if its sheets were added the rest of it was done too
+        sheet_metadata_cache.invalidate(self.spreadsheet_id)
+        sheet_ids = sheet_metadata_cache.get_sheet_ids(self.service, self.spreadsheet_id)
+        if all(title in sheet_ids for title in self.get_added_sheet_titles()):
+            return {'replies': []}
+        return None
+
+class SheetMetadataCache:
+    """Caches the sheet title to sheet id mapping of each spreadsheet for the rest of the run.
+
+    Only the titles and ids are requested from the API instead of the whole spreadsheet's metadata.
+    """
+    def __init__(self):
+        self.sheet_ids = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_sheet_ids(self, service, spreadsheet_id):
+        with self.lock:
+            if spreadsheet_id in self.sheet_ids:
+                self.hits += 1
+                return self.sheet_ids[spreadsheet_id]
+            self.misses += 1
+            result = shared_functions.execute(service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id, fields='sheets.properties(title,sheetId)'))
+            sheet_ids = OrderedDict((sheet['properties']['title'], sheet['properties']['sheetId'])
+                                    for sheet in result.get('sheets', []))
+            self.sheet_ids[spreadsheet_id] = sheet_ids
+            return sheet_ids
+
+    def invalidate(self, spreadsheet_id):
+        with self.lock:
+            self.sheet_ids.pop(spreadsheet_id, None)
+
+    def report(self):
+        return 'Sheet metadata cache: {} hits, {} misses'.format(self.hits, self.misses)
+
+sheet_metadata_cache = SheetMetadataCache()
+
+def get_new_sheet_id(service, spreadsheet_id):
+    return max(list(get_sheet_ids(service, spreadsheet_id).values()) + [0]) + 1
+
+def get_sheet_ids(service, spreadsheet_id):
+    from apiclient import errors
     try:
-        result = service.spreadsheets().get(
-            spreadsheetId=spreadsheet_id).execute()
-        return [sheet for sheet in result['sheets']]
-    except errors.HttpError:
+        return sheet_metadata_cache.get_sheet_ids(service, spreadsheet_id)
+    except errors.HttpError as error:
+        # only a real permission problem clears the credentials; anything else has already been retried
+        if not shared_functions.is_auth_error(error):
+            raise
         print("You don't have permission to access these files.")
         shared_functions.remove_file_from_cache(CACHE_FILE_NAME)
 
-def get_ratings_sheet_info(service, sheet_name):
-    sheets = get_sheets(service, RATINGS_SPREADSHEET_ID)
-    sheet_names = [sheet['properties']['title'] for sheet in sheets]
-    if sheet_name in sheet_names:
-        range = '{}!A2:C'.format(sheet_name)
-        result = service.spreadsheets().values().get(
-            spreadsheetId=RATINGS_SPREADSHEET_ID, range=range, majorDimension='COLUMNS').execute()
-        values = result.get('values', [])
+def get_sheets(service, spreadsheet_id):
+    return [{'properties': {'title': title, 'sheetId': sheet_id}}
+            for title, sheet_id in get_sheet_ids(service, spreadsheet_id).items()]
+
+def read_ratings_values(service, sheet_name):
+    if sheet_name not in get_sheet_ids(service, RATINGS_SPREADSHEET_ID):
+        return None
+    result = shared_functions.execute(service.spreadsheets().values().batchGet(
+        spreadsheetId=RATINGS_SPREADSHEET_ID, ranges=['{}!A2:C'.format(sheet_name)],
+        majorDimension='COLUMNS'))
+    return result['valueRanges'][0].get('values', [])
+
+def get_ratings_sheet_info(service, sheet_name, values=None):
+    if values is None:
+        values = read_ratings_values(service, sheet_name)
+    if values is not None:
         if not values:
             print('No roster found for this semester.')
         else:
@@ -52,6 +143,7 @@ def get_ratings_sheet_info(service, sheet_name):
             for i, row_num in enumerate(values[0]):
                 formatted_roster.append([row_num, values[1][i], values[2][i]])
 
+            from tabulate import tabulate
             print('Roster detected.\n')
             print(tabulate(formatted_roster, headers=['', 'Name', 'Rating']))
             return values
@@ -60,18 +152,162 @@ def get_ratings_sheet_info(service, sheet_name):
         generate_ratings_sheet(service, sheet_name)
     return None
 
-def get_league_roster(service, ratings_sheet_name):
-    league_roster = get_ratings_sheet_info(service, ratings_sheet_name)
+class RatingsRanking:
+    """The ratings sheet's roster kept in rank order while ratings are updated.
+
+    Players are ordered by rating with ties kept in the order they were added, which matches sorting the roster
+    dictionary by rating. The order is an indexable skip list keyed on (-rating, order added, name), so each update
+    is an expected O(log n) removal and insertion that also gives the ranks the player moved between. Only rows
+    between those ranks can have changed, so get_changed_row_ranges() compares just the span that updates touched
+    against the rows that were read from the sheet.
+    """
+    def __init__(self, league_roster=None):
+        # league_roster is the sheet's rank, name and rating columns as returned by get_league_roster
+        self.original_rows = []
+        if league_roster:
+            self.original_rows = [[str(league_roster[0][i]), league_roster[1][i], str(league_roster[2][i])]
+                                  for i in range(len(league_roster[0]))]
+        self.keys = {}
+        for row in self.original_rows:
+            self.keys[row[1]] = (-int(row[2]), len(self.keys), row[1])
+        self.order = IndexableSkipList(self.keys.values())
+        # row indexes from changed_start up to but not including changed_end may differ from the sheet
+        self.changed_start = None
+        self.changed_end = None
+        if self.get_rows() != [[int(row[0]), row[1], int(row[2])] for row in self.original_rows]:
+            # the sheet was out of order to begin with, e.g. edited by hand
+            self.mark_changed(0, max(len(self.order), len(self.original_rows)))
+
+    def __len__(self):
+        return len(self.order)
+
+    def update(self, player_name, rating):
+        key = self.keys.get(player_name)
+        if key is not None:
+            if -key[0] == rating:
+                return
+            old_index = self.order.remove(key)
+            key = (-rating, key[1], player_name)
+        else:
+            old_index = None
+            key = (-rating, len(self.keys), player_name)
+        self.keys[player_name] = key
+        new_index = self.order.insert(key)
+        if old_index is None:
+            # a new player pushes everyone below them down a row
+            self.mark_changed(new_index, len(self.order))
+        else:
+            self.mark_changed(min(old_index, new_index), max(old_index, new_index) + 1)
+
+    def mark_changed(self, start, end):
+        self.changed_start = start if self.changed_start is None else min(self.changed_start, start)
+        self.changed_end = end if self.changed_end is None else max(self.changed_end, end)
+
+    def get_rows(self, start=0, stop=None):
+        return [[rank, player_name, -negative_rating] for rank, (negative_rating, _, player_name)
+                in enumerate(self.order.iterate(start, stop), start + 1)]
+
+    def get_columns(self):
+        """Returns the rank, name and rating columns the way read_ratings_values returns them from the sheet."""
+        rows = self.get_rows()
+        if not rows:
+            return []
+        return [[str(row[0]) for row in rows], [row[1] for row in rows], [str(row[2]) for row in rows]]
+
+    def get_changed_row_ranges(self):
+        """Returns (first row index, rows) for each run of consecutive rows that differ from the sheet."""
+        if self.changed_start is None:
+            return []
+        changed_row_ranges = []
+        start_index = None
+        offset = self.changed_start
+        rows = self.get_rows(offset, self.changed_end)
+        for index, row in enumerate(rows, offset):
+            is_changed = index >= len(self.original_rows) or \
+                         [str(element) for element in row] != self.original_rows[index]
+            if is_changed and start_index is None:
+                start_index = index
+            elif not is_changed and start_index is not None:
+                changed_row_ranges.append((start_index, rows[start_index - offset:index - offset]))
+                start_index = None
+        if start_index is not None:
+            changed_row_ranges.append((start_index, rows[start_index - offset:]))
+        return changed_row_ranges
+
+class LeagueDataPrefetch(threading.Thread):
+    """Creates the Sheets service and syncs the roster and prize points with the local mirror in the background.
+
+    Started as soon as the league date is known so the sync overlaps with typing in the groups: changes waiting in the
+    mirror's outbox are pushed, then each spreadsheet is read with a single values().batchGet call. get() doesn't wait
+    for any of it if both sheets are already mirrored, so a slow or missing network never holds up a league night.
+    Sheets that don't exist yet come back empty and are added to the spreadsheet when the night's changes are pushed.
+    """
+    def __init__(self, ratings_sheet_name, prize_points_sheet_name):
+        threading.Thread.__init__(self, name='roster prefetch')
+        self.daemon = True
+        self.ratings_sheet_name = ratings_sheet_name
+        self.prize_points_sheet_name = prize_points_sheet_name
+        self.service = None
+        self.ratings_values = None
+        self.prize_points_values = None
+        self.pushed_count = 0
+        self.conflict = None
+        self.error = None
+
+    def run(self):
+        try:
+            with api_tracer.phase('roster load'):
+                self.service = create_service()
+                self.pushed_count, self.conflict, self.ratings_values, self.prize_points_values = sync_mirror(
+                    self.service, self.ratings_sheet_name, self.prize_points_sheet_name)
+        except BaseException as error:
+            self.error = error
+
+    def get(self):
+        """Returns the service, which is None if it isn't ready yet, and the two sheets' values.
+
+        The values are the ones just read from Sheets if the sync is done, otherwise the mirrored ones. It only waits
+        for the sync if a sheet isn't mirrored yet, and if Sheets can't be reached that sheet comes back empty.
+        """
+        mirror = sheets_mirror.get_mirror()
+        ratings_values = mirror.get_values(RATINGS_SPREADSHEET_ID, self.ratings_sheet_name)
+        prize_points_values = mirror.get_values(PRIZE_POINTS_SPREADSHEET_ID, self.prize_points_sheet_name)
+        is_mirrored = ratings_values is not None and prize_points_values is not None
+        if self.is_alive() and not is_mirrored:
+            print('\nLoading roster, please wait...')
+        self.join(0 if is_mirrored else None)
+        if self.pushed_count:
+            print('Pushed {} changes saved on this computer to Google Sheets.'.format(self.pushed_count))
+        if self.conflict is not None:
+            print(self.conflict)
+        if not self.is_alive() and self.error is None:
+            return self.service, self.ratings_values, self.prize_points_values
+        if self.error is not None and not shared_functions.is_connection_error(self.error):
+            raise self.error
+        if self.error is not None:
+            print("Couldn't reach Google Sheets{}.".format(
+                ', using the roster and prize points saved on this computer' if is_mirrored else ''))
+        for sheet_name, values in [(self.ratings_sheet_name, ratings_values),
+                                   (self.prize_points_sheet_name, prize_points_values)]:
+            if values is None:
+                print('{} isn\'t saved on this computer yet, so it starts out empty.'.format(sheet_name))
+        return self.service, ratings_values or [], prize_points_values or []
+
+def get_league_roster(service, ratings_sheet_name, values=None):
+    league_roster = get_ratings_sheet_info(service, ratings_sheet_name, values)
     league_roster_dict = {league_roster[1][index]: int(league_roster[2][index])
                           for index, element in enumerate(league_roster[0])} if league_roster else {}
     return league_roster, league_roster_dict
 
 def generate_ratings_sheet(service, sheet_name):
+    # the sheet id is picked here so the new sheet can be added and formatted in the same batchUpdate
+    new_sheet_id = get_new_sheet_id(service, RATINGS_SPREADSHEET_ID)
     new_sheet_body = {
         'requests': [
             {
                 'addSheet': {
                     'properties': {
+                        'sheetId': new_sheet_id,
                         'title': sheet_name,
                         'index': 0
                     }
@@ -79,8 +315,6 @@ def generate_ratings_sheet(service, sheet_name):
             },
         ]
     }
-    add_sheet = service.spreadsheets().batchUpdate(spreadsheetId=RATINGS_SPREADSHEET_ID, body=new_sheet_body).execute()
-    new_sheet_id = add_sheet['replies'][0]['addSheet']['properties']['sheetId']
 
     update_headers_body = {
         'majorDimension': 'ROWS',
@@ -242,48 +476,20 @@ def generate_ratings_sheet(service, sheet_name):
         }]
     }
 
-    service.spreadsheets().values().update(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        range='{}!A1:C1'.format(sheet_name),
-        body=update_headers_body,
-        valueInputOption='USER_ENTERED'
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=update_bg_color_body
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=update_border_body
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=update_frozen_row_body
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=adjust_len_width_body
-    ).execute()
+    batch = BatchWriter(service, RATINGS_SPREADSHEET_ID)
+    batch.add_requests(new_sheet_body['requests'])
+    batch.add_requests(update_bg_color_body['requests'])
+    batch.add_requests(update_border_body['requests'])
+    batch.add_requests(update_frozen_row_body['requests'])
+    batch.add_requests(adjust_len_width_body['requests'])
+    batch.add_values('{}!A1:C1'.format(sheet_name), update_headers_body['values'])
+    batch.flush()
+    sheet_metadata_cache.invalidate(RATINGS_SPREADSHEET_ID)
 
 def get_sheet_id(service, spreadsheet_id, sheet_name):
-    sheets = get_sheets(service, spreadsheet_id)
-    for sheet in sheets:
-        if sheet['properties']['title'] == sheet_name:
-            return sheet['properties']['sheetId']
-    return None
-
-def write_to_ratings_sheet(service, row_data, start_row_index, end_row_index, sheet_name):
-    sheet_id = get_sheet_id(service, RATINGS_SPREADSHEET_ID, sheet_name)
-
-    write_body = {
-        'majorDimension': 'ROWS',
-        'values': row_data
-    }
+    return get_sheet_ids(service, spreadsheet_id).get(sheet_name)
 
+def get_ratings_format_requests(sheet_id, start_row_index, end_row_index):
     set_bold_font_body = {
         'requests': [{
             'repeatCell': {
@@ -374,75 +580,82 @@ def write_to_ratings_sheet(service, row_data, start_row_index, end_row_index, sh
         }]
     }
 
-    service.spreadsheets().values().update(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        range='{}!A2:C'.format(sheet_name),
-        body=write_body,
-        valueInputOption='USER_ENTERED'
-    ).execute()
+    return set_bold_font_body['requests'] + set_unbold_font_body['requests'] + update_border_body['requests']
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=set_bold_font_body
-    ).execute()
+def write_to_ratings_sheet(service, row_data, start_row_index, end_row_index, sheet_name):
+    sheet_id = get_sheet_id(service, RATINGS_SPREADSHEET_ID, sheet_name)
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=set_unbold_font_body
-    ).execute()
+    write_body = {
+        'majorDimension': 'ROWS',
+        'values': row_data
+    }
 
-    service.spreadsheets().batchUpdate(
+    batch = BatchWriter(service, RATINGS_SPREADSHEET_ID)
+    batch.add_requests(get_ratings_format_requests(sheet_id, start_row_index, end_row_index))
+    batch.add_values('{}!A2:C'.format(sheet_name), write_body['values'])
+    batch.flush()
+
+def write_ratings_changes(service, ranking, sheet_name):
+    """Writes only the rows of the ratings sheet that changed since the roster was read.
+
+    New rows at the bottom of the sheet are formatted the same way write_to_ratings_sheet formats them.
+    """
+    batch = BatchWriter(service, RATINGS_SPREADSHEET_ID)
+    for start_index, row_data in ranking.get_changed_row_ranges():
+        batch.add_values('{}!A{}:C{}'.format(sheet_name, start_index + 2, start_index + len(row_data) + 1), row_data)
+
+    start_row_index = len(ranking.original_rows) + 1
+    end_row_index = len(ranking) + 1
+    if end_row_index > start_row_index:
+        sheet_id = get_sheet_id(service, RATINGS_SPREADSHEET_ID, sheet_name)
+        batch.add_requests(get_ratings_format_requests(sheet_id, start_row_index, end_row_index))
+    batch.flush()
+
+def clear_ratings_sheet(service, sheet_name):
+    shared_functions.execute(service.spreadsheets().values().clear(
         spreadsheetId=RATINGS_SPREADSHEET_ID,
-        body=update_border_body
-    ).execute()
-
-def get_prize_points_sheet_info(service, sheet_name):
-    sheets = get_sheets(service, PRIZE_POINTS_SPREADSHEET_ID)
-    sheet_names = [sheet['properties']['title'] for sheet in sheets]
-    if sheet_name in sheet_names:
-        num_leagues_range = '{}!1:2'.format(sheet_name)
-        num_leagues_info = service.spreadsheets().values().get(
-            spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID, range=num_leagues_range, majorDimension='COLUMNS').execute()
-        num_leagues = len(num_leagues_info.get('values', [])) - 4
-
-        prize_points_range = '{}!A1:'.format(sheet_name) + xlsxwriter.utility.xl_col_to_name(num_leagues + 4)
-        prize_points_info = service.spreadsheets().values().get(
-            spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID, range=prize_points_range, majorDimension='ROWS').execute()
-        prize_points = prize_points_info.get('values', [])
+        range='{}!A2:C'.format(sheet_name),
+        body={}
+    ))
+
+def read_prize_points_values(service, sheet_name):
+    if sheet_name not in get_sheet_ids(service, PRIZE_POINTS_SPREADSHEET_ID):
+        return None
+    result = shared_functions.execute(service.spreadsheets().values().batchGet(
+        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID, ranges=[sheet_name], majorDimension='ROWS'))
+    return result['valueRanges'][0].get('values', [])
+
+def get_prize_points_sheet_info(service, sheet_name, values=None):
+    if values is None:
+        values = read_prize_points_values(service, sheet_name)
+    if values is not None:
+        # the header row has the name, total earned, total used and total remaining columns followed by the leagues
+        num_leagues = max([len(row) for row in values[:2]] + [4]) - 4
+        prize_points = [row[:num_leagues + 5] for row in values]
 
         if not num_leagues:
             print('No prize points found for this semester.')
         else:
             print('Prize points detected.\n')
-            return prize_points, num_leagues
+        return prize_points, num_leagues
     else:
         print('No prize points found for this semester.')
         generate_prize_points_sheet(service, sheet_name)
     return None, 0
 
-def get_prize_points(service, prize_points_sheet_name):
-    prize_points, num_leagues = get_prize_points_sheet_info(service, prize_points_sheet_name)
-    prize_points_dict = defaultdict(dict) # this will look something like { '09-10-23': { 'Jonathan L': 6, 'Alex L': 8 } }
-    name_to_points_used_dict = {}
-
-    for col in range(1, num_leagues + 1):
-        for row in range(1, len(prize_points)):
-            league_date = prize_points[0][3 + col]
-            name = prize_points[row][0]
-            points = prize_points[row][3 + col]
-            points_used = prize_points[row][2]
-
-            prize_points_dict[league_date][name] = points
-            name_to_points_used_dict[name] = points_used if points_used != '' else 0
-
-    return prize_points_dict, name_to_points_used_dict, num_leagues
+def get_prize_points(service, prize_points_sheet_name, values=None):
+    prize_points, num_leagues = get_prize_points_sheet_info(service, prize_points_sheet_name, values)
+    return prize_points_module.PrizePointsTable.from_sheet_values(prize_points)
 
 def generate_prize_points_sheet(service, sheet_name):
+    # the sheet id is picked here so the new sheet can be added and formatted in the same batchUpdate
+    new_sheet_id = get_new_sheet_id(service, PRIZE_POINTS_SPREADSHEET_ID)
     new_sheet_body = {
         'requests': [
             {
                 'addSheet': {
                     'properties': {
+                        'sheetId': new_sheet_id,
                         'title': sheet_name,
                         'index': 0
                     }
@@ -450,8 +663,6 @@ def generate_prize_points_sheet(service, sheet_name):
             },
         ]
     }
-    add_sheet = service.spreadsheets().batchUpdate(spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID, body=new_sheet_body).execute()
-    new_sheet_id = add_sheet['replies'][0]['addSheet']['properties']['sheetId']
 
     update_headers_body = {
         'majorDimension': 'ROWS',
@@ -546,32 +757,16 @@ def generate_prize_points_sheet(service, sheet_name):
         }]
     }
 
-    service.spreadsheets().values().update(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        range='{}!A1:D1'.format(sheet_name),
-        body=update_headers_body,
-        valueInputOption='USER_ENTERED'
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        body=update_header_format
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        body=update_frozen_column_body
-    ).execute()
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        body=adjust_len_width_body
-    ).execute()
-
-def write_to_prize_points_sheet(service, roster, prize_points, points_used, num_leagues, start_row_index, end_row_index, sheet_name):
-    sheet_id = get_sheet_id(service, PRIZE_POINTS_SPREADSHEET_ID, sheet_name)
-    roster = sorted(roster)
+    batch = BatchWriter(service, PRIZE_POINTS_SPREADSHEET_ID)
+    batch.add_requests(new_sheet_body['requests'])
+    batch.add_requests(update_header_format['requests'])
+    batch.add_requests(update_frozen_column_body['requests'])
+    batch.add_requests(adjust_len_width_body['requests'])
+    batch.add_values('{}!A1:D1'.format(sheet_name), update_headers_body['values'])
+    batch.flush()
+    sheet_metadata_cache.invalidate(PRIZE_POINTS_SPREADSHEET_ID)
 
+def get_prize_points_bold_requests(sheet_id, start_row_index, end_row_index):
     set_bold_font_body = {
         'requests': [{
             'repeatCell': {
@@ -598,111 +793,213 @@ def write_to_prize_points_sheet(service, roster, prize_points, points_used, num_
         }]
     }
 
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        body=set_bold_font_body
-    ).execute()
-
-    write_data = []
-    for i in prize_points.keys():
-        col_data = [i]
-        for j in roster:
-            if j in prize_points[i]:
-                col_data.append(prize_points[i][j])
-            else:
-                col_data.append(0)
-        write_data.append(col_data)
+    return set_bold_font_body['requests']
 
-    write_body = {
-        'majorDimension': 'COLUMNS',
-        'values': write_data
-    }
+def append_to_prize_points_sheet(service, prize_points_table, roster, league_date, league_prize_points, sheet_name,
+                                 batch=None):
+    """Writes one league's prize points without rewriting the leagues that are already on the sheet.
 
-    service.spreadsheets().values().update(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        range='{}!E1:'.format(sheet_name)+xlsxwriter.utility.xl_col_to_name(num_leagues+4),
-        body=write_body,
-        valueInputOption='USER_ENTERED'
-    ).execute()
-
-    roster_rows = [[i] for i in roster]
-    roster_data = {
-        'majorDimension': 'ROWS',
-        'values': roster_rows
-    }
-
-    service.spreadsheets().values().update(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        range='{}!A2'.format(sheet_name),
-        body=roster_data,
-        valueInputOption='USER_ENTERED'
-    ).execute()
-
-    formula = "=SUM(E2:"+xlsxwriter.utility.xl_col_to_name(num_leagues+4)+"2)"
-    total_points_formula = {
-        "requests": [{
-            "repeatCell": {
-                "range": {
-                    "sheetId": sheet_id,
-                    "startRowIndex": 1,
-                    "endRowIndex": len(roster)+1,
-                    "startColumnIndex": 1,
-                    "endColumnIndex": 2
-                },
-                "cell": {
-                    "userEnteredValue": {
-                        "formulaValue": formula
-                    }
+    Only the league's column is written, along with full rows for roster names that aren't on the sheet yet, so the
+    cost of a run doesn't grow over the school year. prize_points_table holds the sheet as read by get_prize_points
+    and is updated to match what was written. If a batch is given the writes are queued on it instead of being sent,
+    so several leagues can go in one batch.
+    """
+    from xlsxwriter.utility import xl_col_to_name
+    sheet_id = get_sheet_id(service, PRIZE_POINTS_SPREADSHEET_ID, sheet_name)
+    league_dates = prize_points_table.dates
+    sheet_roster = list(prize_points_table.names)
+    new_names = sorted(name for name in roster if name not in prize_points_table)
+
+    is_new_league = league_date not in league_dates
+    league_col = 4 + (len(league_dates) if is_new_league else league_dates.index(league_date))
+    league_col_name = xl_col_to_name(league_col)
+
+    flush = batch is None
+    if flush:
+        batch = BatchWriter(service, PRIZE_POINTS_SPREADSHEET_ID)
+    col_data = [league_date] + [league_prize_points.get(name, 0) for name in sheet_roster]
+    batch.add_values('{}!{}1:{}{}'.format(sheet_name, league_col_name, league_col_name, len(col_data)), [col_data],
+                     major_dimension='COLUMNS')
+
+    if new_names:
+        first_row_num = len(sheet_roster) + 2
+        new_rows = []
+        for row_num, name in enumerate(new_names, first_row_num):
+            row = [name, '=SUM(E{0}:{0})'.format(row_num), 0, '=B{0}-C{0}'.format(row_num)]
+            row.extend(0 for _ in range(4, league_col))
+            row.append(league_prize_points.get(name, 0))
+            new_rows.append(row)
+        batch.add_values('{}!A{}:{}{}'.format(sheet_name, first_row_num, league_col_name,
+                                              first_row_num + len(new_rows) - 1), new_rows)
+        batch.add_requests(get_prize_points_bold_requests(sheet_id, first_row_num - 1,
+                                                          first_row_num - 1 + len(new_rows)))
+
+    if is_new_league and sheet_roster:
+        # open ended totals so they pick up this league's column and every later one
+        batch.add_requests([{
+            'repeatCell': {
+                'range': {
+                    'sheetId': sheet_id,
+                    'startRowIndex': 1,
+                    'endRowIndex': len(sheet_roster) + 1,
+                    'startColumnIndex': 1,
+                    'endColumnIndex': 2
                 },
-                "fields": "userEnteredValue"
-            }
-        }]
-    }
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        body=total_points_formula
-    ).execute()
-
-    points_used_data = []
-    for j in roster:
-        if j in points_used:
-            points_used_data.append([points_used[j]])
-        else:
-            points_used_data.append([0])
-    points_used_body = {
-        'majorDimension': 'ROWS',
-        'values': points_used_data
-    }
-
-    service.spreadsheets().values().update(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        range='{}!C2:D'.format(sheet_name),
-        body=points_used_body,
-        valueInputOption='USER_ENTERED'
-    ).execute()
-
-    total_remaining_formula = {
-        "requests": [{
-            "repeatCell": {
-                "range": {
-                    "sheetId": sheet_id,
-                    "startRowIndex": 1,
-                    "endRowIndex": len(roster)+1,
-                    "startColumnIndex": 3,
-                    "endColumnIndex": 4
-                },
-                "cell": {
-                    "userEnteredValue": {
-                        "formulaValue": "=B2-C2"
+                'cell': {
+                    'userEnteredValue': {
+                        'formulaValue': '=SUM(E2:2)'
                     }
                 },
-                "fields": "userEnteredValue"
+                'fields': 'userEnteredValue'
             }
-        }]
-    }
-
-    service.spreadsheets().batchUpdate(
-        spreadsheetId=PRIZE_POINTS_SPREADSHEET_ID,
-        body=total_remaining_formula
-    ).execute()
\ No newline at end of file
+        }])
+    if flush:
+        batch.flush()
+
+    for name in new_names:
+        prize_points_table.add_player(name)
+    prize_points_table.set_league_points(league_date, league_prize_points)
+
+def apply_ratings_changes(values, ratings):
+    ranking = RatingsRanking(values)
+    for name, (base_rating, rating) in ratings.items():
+        ranking.update(name, rating)
+    return ranking
+
+def apply_prize_points_changes(values, leagues):
+    table = prize_points_module.PrizePointsTable.from_sheet_values(values)
+    for league in leagues:
+        for name in sorted(name for name in league['roster'] if name not in table):
+            table.add_player(name)
+        table.set_league_points(league['league_date'], league['points'])
+    return table
+
+def save_ratings_changes(sheet_name, league_roster, ratings):
+    """Saves the ratings that changed since league_roster was read to the mirror's outbox for push_sheet_changes.
+
+    league_roster is the ratings sheet's columns as they were read and ratings the {name: rating} after the league.
+    """
+    base_ratings = dict(zip(league_roster[1], [int(rating) for rating in league_roster[2]])) if league_roster else {}
+    changes = OrderedDict((name, [base_ratings.get(name), rating]) for name, rating in ratings.items()
+                          if base_ratings.get(name) != rating)
+    if changes:
+        sheets_mirror.get_mirror().add_change(RATINGS_SPREADSHEET_ID, sheet_name, sheets_mirror.RATINGS,
+                                              {'ratings': changes},
+                                              lambda values: apply_ratings_changes(values, changes).get_columns())
+
+def save_prize_points_changes(sheet_name, prize_points_table, roster, league_date, league_prize_points):
+    """Saves a league's prize points to the mirror's outbox for push_sheet_changes, along with the league's column as
+    it was in prize_points_table, if it was there at all, to check for conflicts against."""
+    base_points = None
+    if league_date in prize_points_table.date_index:
+        base_points = {name: prize_points_table.get_points(league_date, name) for name in prize_points_table.names}
+    change = {'league_date': league_date, 'points': league_prize_points, 'roster': list(roster), 'base': base_points}
+    sheets_mirror.get_mirror().add_change(PRIZE_POINTS_SPREADSHEET_ID, sheet_name, sheets_mirror.PRIZE_POINTS, change,
+                                          lambda values: apply_prize_points_changes(values,
+                                                                                    [change]).to_sheet_values())
+
+def push_ratings_changes(service, sheet_name, changes, force=False):
+    values = read_ratings_values(service, sheet_name)
+    if values is None:
+        generate_ratings_sheet(service, sheet_name)
+        values = []
+    ratings = sheets_mirror.coalesce_ratings(change['change'] for change in changes)
+    conflicts = sheets_mirror.get_ratings_conflicts(ratings, values)
+    if conflicts and not force:
+        return conflicts, None
+    ranking = apply_ratings_changes(values, ratings)
+    write_ratings_changes(service, ranking, sheet_name)
+    return [], ranking.get_columns()
+
+def push_prize_points_changes(service, sheet_name, changes, force=False):
+    values = read_prize_points_values(service, sheet_name)
+    if values is None:
+        generate_prize_points_sheet(service, sheet_name)
+        values = []
+    leagues = sheets_mirror.coalesce_prize_points(change['change'] for change in changes)
+    conflicts = sheets_mirror.get_prize_points_conflicts(leagues, values)
+    if conflicts and not force:
+        return conflicts, None
+    table = prize_points_module.PrizePointsTable.from_sheet_values(values)
+    batch = BatchWriter(service, PRIZE_POINTS_SPREADSHEET_ID)
+    for league in leagues.values():
+        append_to_prize_points_sheet(service, table, league['roster'], league['league_date'], league['points'],
+                                     sheet_name, batch=batch)
+    batch.flush()
+    return [], table.to_sheet_values()
+
+# pushes and refreshes of the mirror happen one at a time, so a refresh can't overwrite what a push just wrote
+push_lock = threading.RLock()
+
+def push_changes(service, spreadsheet_id=None, sheet_name=None, force=False):
+    """Pushes the changes waiting in the mirror's outbox, coalesced into one write per sheet.
+
+    The sheet is read first, and a sheet where a player or league that a change touches differs from both what it was
+    when the results were entered and what would be written is left alone unless force is set. Sheets missing from
+    the spreadsheet are added. Connection errors are raised as they are and leave the outbox as it was.
+
+    Returns:
+        int, the number of changes pushed. ConflictError is raised once every other sheet has been pushed if any sheet
+        had conflicts.
+    """
+    mirror = sheets_mirror.get_mirror()
+    pushed_count = 0
+    conflicts = []
+    with push_lock:
+        for pending_spreadsheet_id, pending_sheet_name, kind in mirror.get_pending_sheets(spreadsheet_id, sheet_name):
+            changes = mirror.get_changes(pending_spreadsheet_id, pending_sheet_name)
+            push = push_ratings_changes if kind == sheets_mirror.RATINGS else push_prize_points_changes
+            sheet_conflicts, values = push(service, pending_sheet_name, changes, force)
+            change_ids = [change['id'] for change in changes]
+            if sheet_conflicts:
+                mirror.set_conflict(change_ids, '; '.join(sheet_conflicts))
+                conflicts.append('{}: {}'.format(pending_sheet_name, '; '.join(sheet_conflicts)))
+            else:
+                mirror.finish_push(pending_spreadsheet_id, pending_sheet_name, change_ids, values)
+                pushed_count += len(changes)
+    if conflicts:
+        raise sheets_mirror.ConflictError(
+            "These changes weren't pushed because the sheet was changed after the results were entered:\n{}\n"
+            "Run sheets_mirror.py to see what's waiting, with --push --force to write them anyway or --discard to "
+            "drop them.".format('\n'.join(conflicts)))
+    return pushed_count
+
+def push_sheet_changes(service, spreadsheet_id, sheet_name):
+    """Pushes the changes waiting for a sheet, leaving them in the outbox for the next run if Sheets can't be reached.
+
+    Returns:
+        bool, whether they were pushed.
+    """
+    try:
+        push_changes(service or create_service(), spreadsheet_id, sheet_name)
+    except Exception as error:
+        if not shared_functions.is_connection_error(error):
+            raise
+        print("Couldn't reach Google Sheets; the changes to {} are saved on this computer and will be pushed on the "
+              "next run.".format(sheet_name))
+        return False
+    return True
+
+def sync_mirror(service, ratings_sheet_name, prize_points_sheet_name):
+    """Pushes every change waiting in the mirror's outbox, then refreshes the mirror's copy of both sheets from Sheets.
+
+    A sheet whose changes couldn't be pushed because of a conflict keeps its local copy.
+
+    Returns:
+        (number of changes pushed, ConflictError or None, ratings values, prize points values), with the values as
+        now mirrored.
+    """
+    mirror = sheets_mirror.get_mirror()
+    with push_lock:
+        pushed_count = 0
+        conflict = None
+        try:
+            pushed_count = push_changes(service)
+        except sheets_mirror.ConflictError as error:
+            conflict = error
+        mirror.refresh_values(RATINGS_SPREADSHEET_ID, ratings_sheet_name,
+                              read_ratings_values(service, ratings_sheet_name) or [])
+        mirror.refresh_values(PRIZE_POINTS_SPREADSHEET_ID, prize_points_sheet_name,
+                              read_prize_points_values(service, prize_points_sheet_name) or [])
+    return (pushed_count, conflict, mirror.get_values(RATINGS_SPREADSHEET_ID, ratings_sheet_name),
+            mirror.get_values(PRIZE_POINTS_SPREADSHEET_ID, prize_points_sheet_name))
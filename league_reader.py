@@ -0,0 +1,174 @@
+import json
+import re
+import sys
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+import rating_engine
+
+# Reads the league workbooks made by excel_functions (a Summary sheet plus a "Group N" sheet per group) back into
+# players, ratings and scores. Sheets are parsed incrementally and each row is thrown away once it has been read, so
+# memory stays flat no matter how many workbooks are read.
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+DOC_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+SUMMARY_TITLE_PREFIX = 'League Summary - '
+GROUP_SHEET_PATTERN = re.compile(r'Group (\d+)$')
+CELL_REF_PATTERN = re.compile(r'([A-Z]+)(\d+)$')
+
+class LeaguePlayer:
+    def __init__(self, player_name, seed):
+        self.player_name = player_name
+        self.seed = seed
+        self.rating_before = None
+        self.adjusted_rating = None
+        self.matches_won = None
+        self.games_won = None
+        self.rating_change = None
+        self.rating_after = None
+        self.is_group_winner = False
+
+class LeagueGroup:
+    def __init__(self, group_num):
+        self.group_num = group_num
+        self.group_name = 'Group {}'.format(group_num)
+        self.players = [] # in seed order
+        self.matches = [] # in ResultSheet.match_ordering_selection order, e.g. ['3:1', '2:3', ...]
+
+class League:
+    def __init__(self, name):
+        self.name = name
+        self.groups = []
+
+def iter_rows(archive, member, shared_strings):
+    """Yields (row number, {column letter: value}) for every non-empty row of a worksheet."""
+    with archive.open(member) as sheet_file:
+        sheet_data = None
+        for event, element in ElementTree.iterparse(sheet_file, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == MAIN_NS + 'sheetData':
+                    sheet_data = element
+                continue
+            if element.tag != MAIN_NS + 'row':
+                continue
+            row = {}
+            for cell in element.iter(MAIN_NS + 'c'):
+                value = get_cell_value(cell, shared_strings)
+                if value is not None:
+                    row[CELL_REF_PATTERN.match(cell.get('r')).group(1)] = value
+            row_num = int(element.get('r'))
+            # rows that have been read are dropped so memory doesn't grow with the sheet
+            element.clear()
+            if sheet_data is not None:
+                sheet_data.clear()
+            if row:
+                yield row_num, row
+
+def get_cell_value(cell, shared_strings):
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        return ''.join(text.text or '' for text in cell.iter(MAIN_NS + 't'))
+    value = cell.find(MAIN_NS + 'v')
+    if value is None or value.text is None:
+        return None
+    if cell_type == 's':
+        return shared_strings[int(value.text)]
+    if cell_type in ('str', 'b', 'e'):
+        return value.text
+    number = float(value.text)
+    return int(number) if number.is_integer() else number
+
+def get_shared_strings(archive):
+    shared_strings = []
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return shared_strings
+    with archive.open('xl/sharedStrings.xml') as strings_file:
+        for _, element in ElementTree.iterparse(strings_file):
+            if element.tag == MAIN_NS + 'si':
+                shared_strings.append(''.join(text.text or '' for text in element.iter(MAIN_NS + 't')))
+                element.clear()
+    return shared_strings
+
+def get_sheet_members(archive):
+    with archive.open('xl/_rels/workbook.xml.rels') as rels_file:
+        targets = {rel.get('Id'): rel.get('Target') for _, rel in ElementTree.iterparse(rels_file)
+                   if rel.tag == REL_NS + 'Relationship'}
+    sheet_members = OrderedDict()
+    with archive.open('xl/workbook.xml') as workbook_file:
+        for _, element in ElementTree.iterparse(workbook_file):
+            if element.tag == MAIN_NS + 'sheet':
+                target = targets[element.get(DOC_REL_NS + 'id')]
+                sheet_members[element.get('name')] = target[1:] if target.startswith('/') else 'xl/' + target
+    return sheet_members
+
+def read_summary(archive, member, shared_strings, league_name):
+    groups = OrderedDict()
+    group = None
+    for row_num, row in iter_rows(archive, member, shared_strings):
+        title = row.get('B')
+        if isinstance(title, str) and title.startswith(SUMMARY_TITLE_PREFIX):
+            league_name = title[len(SUMMARY_TITLE_PREFIX):]
+        elif isinstance(title, str) and title.startswith('Group '):
+            group = LeagueGroup(int(title.split(' ')[1]))
+            groups[group.group_num] = group
+        elif group is not None and title in rating_engine.letter_dict and 'C' in row:
+            player_name = str(row['C'])
+            player = LeaguePlayer(player_name.replace('**', '').strip(), title)
+            player.is_group_winner = player_name.endswith('**')
+            player.rating_before = row.get('D')
+            player.adjusted_rating = row.get('E')
+            player.matches_won = row.get('F')
+            player.games_won = row.get('G')
+            player.rating_change = row.get('H')
+            player.rating_after = row.get('I')
+            group.players.append(player)
+    return league_name, groups
+
+def read_matches(archive, member, shared_strings):
+    scores = {}
+    for row_num, row in iter_rows(archive, member, shared_strings):
+        if row_num >= 4 and (row_num - 4) % 3 != 2 and 'A' in row:
+            scores[row_num] = row.get('C', 0)
+    matches = []
+    row_num = 4
+    while row_num in scores:
+        matches.append('{}:{}'.format(scores[row_num], scores.get(row_num + 1, 0)))
+        row_num += 3
+    return matches
+
+def read_league(path):
+    """Reads a league workbook from a file name or file object.
+
+    Returns:
+        League, the league's name and its groups with their players (in seed order) and match scores.
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared_strings = get_shared_strings(archive)
+        sheet_members = get_sheet_members(archive)
+        league_name, groups = read_summary(archive, sheet_members['Summary'], shared_strings, None)
+        league = League(league_name)
+
+        for sheet_name, member in sheet_members.items():
+            group_match = GROUP_SHEET_PATTERN.match(sheet_name)
+            if group_match:
+                group = groups.setdefault(int(group_match.group(1)), LeagueGroup(int(group_match.group(1))))
+                group.matches = read_matches(archive, member, shared_strings)
+        league.groups = [groups[group_num] for group_num in sorted(groups.keys())]
+    return league
+
+def iter_leagues(paths):
+    for path in paths:
+        yield path, read_league(path)
+
+def to_results(league):
+    """Converts a League into the results format read by batch_automation."""
+    return {'date': league.name,
+            'groups': [{'players': [{'name': player.player_name, 'rating': player.rating_before}
+                                    for player in group.players],
+                        'matches': group.matches} for group in league.groups]}
+
+if __name__ == '__main__':
+    for path, league in iter_leagues(sys.argv[1:]):
+        print(json.dumps(to_results(league)))
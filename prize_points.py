@@ -0,0 +1,96 @@
+from array import array
+
+HEADER = ['Name', 'Total earned', 'Total used', 'Total remaining']
+
+def to_points(value):
+    if value is None or value == '':
+        return 0
+    return int(float(value))
+
+class PrizePointsTable:
+    """A school year's prize points stored by column, the same way the prize points sheet lays them out.
+
+    Every league date is a dense integer column with one entry per player, and players are looked up through a
+    name to row index. Players keep the order of the sheet's rows.
+    """
+    def __init__(self):
+        self.names = []
+        self.name_index = {}
+        self.dates = []
+        self.date_index = {}
+        self.columns = []
+        self.points_used = array('l')
+
+    @classmethod
+    def from_sheet_values(cls, values):
+        """Builds the table from the prize points sheet's rows, header row included."""
+        table = cls()
+        if not values:
+            return table
+        for date in values[0][len(HEADER):]:
+            table.add_league(date)
+        for row in values[1:]:
+            if not row or not row[0]:
+                continue
+            index = table.add_player(row[0])
+            table.points_used[index] = to_points(row[2] if len(row) > 2 else None)
+            for col, value in enumerate(row[len(HEADER):len(HEADER) + len(table.dates)]):
+                table.columns[col][index] = to_points(value)
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.name_index
+
+    def add_player(self, name):
+        index = self.name_index.get(name)
+        if index is None:
+            index = len(self.names)
+            self.names.append(name)
+            self.name_index[name] = index
+            self.points_used.append(0)
+            for column in self.columns:
+                column.append(0)
+        return index
+
+    def add_league(self, date):
+        col = self.date_index.get(date)
+        if col is None:
+            col = len(self.dates)
+            self.dates.append(date)
+            self.date_index[date] = col
+            self.columns.append(array('l', bytes(self.points_used.itemsize * len(self.names))))
+        return col
+
+    def set_league_points(self, date, league_prize_points):
+        column = self.columns[self.add_league(date)]
+        for name, points in league_prize_points.items():
+            column[self.add_player(name)] = to_points(points)
+
+    def get_points(self, date, name):
+        return self.columns[self.date_index[date]][self.name_index[name]]
+
+    def totals(self):
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None and self.columns:
+            return numpy.sum([numpy.frombuffer(column, dtype=numpy.dtype(column.typecode))
+                              for column in self.columns], axis=0).tolist()
+        totals = [0] * len(self.names)
+        for column in self.columns:
+            for index, points in enumerate(column):
+                totals[index] += points
+        return totals
+
+    def to_sheet_values(self):
+        """Returns the table as the prize points sheet's rows, header included, with the totals worked out."""
+        totals = self.totals()
+        values = [HEADER + list(self.dates)]
+        for index, name in enumerate(self.names):
+            values.append([name, totals[index], self.points_used[index], totals[index] - self.points_used[index]] +
+                          [column[index] for column in self.columns])
+        return values
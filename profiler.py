@@ -0,0 +1,268 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Times the phases of a run, from loading credentials and building services to typing in results, building the
+# workbook and each Sheets and Drive request, as nested spans per thread. Time spent waiting for somebody to type
+# something is kept apart from the time the program itself takes, so a slow run can be told apart from a slow typist.
+# Nothing is recorded unless profiling is enabled, in which case a summary is printed at exit. Spans still running at
+# exit are reported as unfinished, so a run that hangs and gets interrupted shows where it was stuck.
+#
+# With a profile directory the spans are also written to trace.json in the Chrome trace event format, which can be
+# opened in chrome://tracing or https://ui.perfetto.dev, and each top level span of a thread can be run under cProfile
+# and have its allocations traced with tracemalloc, each written to a file of its own.
+
+MACHINE = 'machine'
+WAIT = 'wait' # waiting for input
+DEFAULT_PROFILE_DIR = 'profile'
+TRACE_FILE_NAME = 'trace.json'
+MEMORY_TOP_STATS = 25
+
+enabled = False
+profile_dir = None
+cpu_profiling = False
+memory_profiling = False
+start_time = None
+spans = []
+spans_lock = threading.Lock()
+span_local = threading.local()
+top_level_count = 0
+
+class Span:
+    def __init__(self, name, detail, kind, depth):
+        self.name = name
+        self.detail = detail
+        self.kind = kind
+        self.depth = depth
+        self.thread = threading.current_thread()
+        self.path = tuple(span.name for span in get_stack()) + (name,)
+        self.start = time.time()
+        self.end = None
+        self.error = None
+        self.memory_kb = None
+        self.peak_kb = None
+
+    def get_elapsed_time(self, now=None):
+        return (self.end if self.end is not None else now or time.time()) - self.start
+
+def get_stack():
+    if not hasattr(span_local, 'stack'):
+        span_local.stack = []
+    return span_local.stack
+
+def get_file_path(name, extension):
+    global top_level_count
+    with spans_lock:
+        top_level_count += 1
+        count = top_level_count
+    return os.path.join(profile_dir, '{:02d}-{}.{}'.format(count, re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-'),
+                                                          extension))
+
+@contextmanager
+def span(name, detail=None, kind=MACHINE):
+    """Times the with block as a span nested in the thread's current one. kind is WAIT while waiting for input."""
+    if not enabled:
+        yield
+        return
+    stack = get_stack()
+    current_span = Span(name, detail, kind, len(stack))
+    with spans_lock:
+        spans.append(current_span)
+    stack.append(current_span)
+
+    cpu_profile = None
+    memory_snapshot = None
+    if current_span.depth == 0 and cpu_profiling:
+        import cProfile
+        cpu_profile = cProfile.Profile()
+        try:
+            cpu_profile.enable()
+        except ValueError:
+            # only one profiler can run at a time on some Python versions
+            cpu_profile = None
+    if memory_profiling:
+        import tracemalloc
+        memory_start = tracemalloc.get_traced_memory()[0]
+        if current_span.depth == 0:
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            memory_snapshot = tracemalloc.take_snapshot()
+    try:
+        yield
+    except BaseException as error:
+        current_span.error = type(error).__name__
+        raise
+    finally:
+        current_span.end = time.time()
+        stack.pop()
+        if cpu_profile is not None:
+            cpu_profile.disable()
+            cpu_profile.dump_stats(get_file_path(name, 'prof'))
+        if memory_profiling:
+            memory_now, memory_peak = tracemalloc.get_traced_memory()
+            current_span.memory_kb = (memory_now - memory_start) / 1024.0
+            if memory_snapshot is not None:
+                current_span.peak_kb = memory_peak / 1024.0
+                write_memory_stats(get_file_path(name, 'memory.txt'), current_span,
+                                   tracemalloc.take_snapshot().compare_to(memory_snapshot, 'lineno'))
+
+def write_memory_stats(path, current_span, stats):
+    with open(path, 'w') as stats_file:
+        stats_file.write('{} on {}: {:+.1f} KB, peak {:.1f} KB\n\n'.format(
+            current_span.name, current_span.thread.name, current_span.memory_kb, current_span.peak_kb or 0))
+        for stat in stats[:MEMORY_TOP_STATS]:
+            stats_file.write('{}\n'.format(stat))
+
+def traced(name, function):
+    """Wraps a function so each call is timed as a span, for threads and task schedulers."""
+    def traced_function(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+    return traced_function
+
+def get_spans():
+    with spans_lock:
+        return list(spans)
+
+def get_wait_time(recorded_spans, now):
+    # waits nested in another wait aren't counted twice
+    return sum(recorded_span.get_elapsed_time(now) for recorded_span in recorded_spans
+               if recorded_span.kind == WAIT and
+               not any(parent_span.kind == WAIT for parent_span in recorded_spans
+                       if parent_span.thread is recorded_span.thread and parent_span.depth < recorded_span.depth and
+                       parent_span.start <= recorded_span.start and
+                       (parent_span.end is None or recorded_span.end is not None and
+                        recorded_span.end <= parent_span.end)))
+
+def summarize(recorded_spans=None, now=None):
+    """Totals the spans by thread and by where they were nested, in the order they first started on each thread.
+
+    Returns:
+        list of [thread, name indented by nesting, calls, total seconds, slowest seconds, calls that raised or never
+        finished, net KB, peak KB] rows.
+    """
+    recorded_spans = get_spans() if recorded_spans is None else recorded_spans
+    now = now or time.time()
+    totals = OrderedDict()
+    for recorded_span in recorded_spans:
+        total = totals.setdefault((recorded_span.thread.name, recorded_span.path), [
+            recorded_span.thread.name, '. ' * recorded_span.depth + recorded_span.name, 0, 0, 0, 0, None, None])
+        elapsed_time = recorded_span.get_elapsed_time(now)
+        total[2] += 1
+        total[3] += elapsed_time
+        total[4] = max(total[4], elapsed_time)
+        total[5] += recorded_span.end is None or recorded_span.error is not None
+        if recorded_span.memory_kb is not None:
+            total[6] = (total[6] or 0) + recorded_span.memory_kb
+        if recorded_span.peak_kb is not None:
+            total[7] = max(total[7] or 0, recorded_span.peak_kb)
+    rows = sorted(totals.values(), key=lambda total: (total[0] != threading.main_thread().name, total[0]))
+    return [row[:3] + [round(row[3], 3), round(row[4], 3)] + row[5:] for row in rows]
+
+def report():
+    from tabulate import tabulate
+    now = time.time()
+    recorded_spans = get_spans()
+    if not recorded_spans:
+        return 'Nothing was profiled.'
+    wall_time = now - start_time
+    wait_time = get_wait_time(recorded_spans, now)
+    headers = ['Thread', 'Span', 'Calls', 'Total s', 'Slowest s', 'Failed']
+    rows = summarize(recorded_spans, now)
+    if memory_profiling:
+        headers += ['Net KB', 'Peak KB']
+    else:
+        rows = [row[:6] for row in rows]
+    lines = [tabulate(rows, headers=headers, floatfmt='.3f', missingval=''), '',
+             'Ran for {:.2f} seconds: {:.2f} waiting for input and {:.2f} of machine time.'.format(
+                 wall_time, wait_time, wall_time - wait_time)]
+    unfinished_spans = [recorded_span for recorded_span in recorded_spans if recorded_span.end is None]
+    for unfinished_span in unfinished_spans:
+        lines.append('Still running at exit after {:.2f} seconds: {} on {}'.format(
+            unfinished_span.get_elapsed_time(now), ' > '.join(unfinished_span.path), unfinished_span.thread.name))
+    if profile_dir is not None:
+        lines.append('Profile written to {}'.format(profile_dir))
+    return '\n'.join(lines)
+
+def get_trace(recorded_spans=None, now=None):
+    """Returns the spans as Chrome trace events."""
+    recorded_spans = get_spans() if recorded_spans is None else recorded_spans
+    now = now or time.time()
+    process_id = os.getpid()
+    events = []
+    thread_names = OrderedDict()
+    for recorded_span in recorded_spans:
+        thread_names[recorded_span.thread.ident] = recorded_span.thread.name
+        args = OrderedDict()
+        for key in ('detail', 'error', 'memory_kb', 'peak_kb'):
+            if getattr(recorded_span, key) is not None:
+                args[key] = getattr(recorded_span, key)
+        if recorded_span.end is None:
+            args['unfinished'] = True
+        events.append(OrderedDict([
+            ('name', recorded_span.name),
+            ('cat', recorded_span.kind),
+            ('ph', 'X'),
+            ('ts', round((recorded_span.start - start_time) * 1e6)),
+            ('dur', round(recorded_span.get_elapsed_time(now) * 1e6)),
+            ('pid', process_id),
+            ('tid', recorded_span.thread.ident),
+            ('args', args)
+        ]))
+    for thread_id, thread_name in thread_names.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': process_id, 'tid': thread_id,
+                       'args': {'name': thread_name}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def write_trace():
+    with open(os.path.join(profile_dir, TRACE_FILE_NAME), 'w') as trace_file:
+        json.dump(get_trace(), trace_file)
+
+def print_report():
+    if profile_dir is not None:
+        write_trace()
+    print('\n' + report())
+
+def enable(directory=None, cpu=False, memory=False):
+    """Starts recording spans and prints their summary at exit.
+
+    If a directory is given the spans are also written to its trace.json, along with a cProfile .prof file per top
+    level span if cpu is set and the allocations made by each top level span if memory is set. Either of those on
+    their own writes to DEFAULT_PROFILE_DIR.
+    """
+    global enabled, profile_dir, cpu_profiling, memory_profiling, start_time
+    if directory is None and (cpu or memory):
+        directory = DEFAULT_PROFILE_DIR
+    if directory is not None and not os.path.exists(directory):
+        os.makedirs(directory)
+    profile_dir = directory
+    cpu_profiling = cpu
+    if memory and not memory_profiling:
+        import tracemalloc
+        tracemalloc.start()
+    memory_profiling = memory_profiling or memory
+    if not enabled:
+        enabled = True
+        start_time = time.time()
+        atexit.register(print_report)
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help='print how long each phase took, apart from time spent waiting for input, at exit')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='also write the phases to DIR/trace.json for chrome://tracing or Perfetto')
+    parser.add_argument('--profile-cpu', action='store_true',
+                        help='run each phase under cProfile and write its stats to a .prof file in the profile '
+                             'directory')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="trace each phase's memory with tracemalloc and write its biggest allocations to the "
+                             'profile directory')
+
+def enable_from_args(args):
+    if args.profile or args.profile_dir or args.profile_cpu or args.profile_memory:
+        enable(args.profile_dir, cpu=args.profile_cpu, memory=args.profile_memory)
@@ -0,0 +1,70 @@
+import shared_functions
+import api_tracer
+import excel_functions
+import google_drive_functions
+import google_sheets_functions
+import task_scheduler
+
+# The end of a league night: the ratings and prize points sheets are updated while the league sheet is uploaded to
+# its semester folder and published, all at the same time. Only the Drive calls depend on each other, so the run
+# takes about as long as its slowest chain of calls rather than all of them added up. Every task builds its own
+# services since the authorized http objects can't be shared between threads.
+
+def publish_league(file_name, league_data, prize_points, workbook_data=None, max_workers=None, open_league_file=True,
+                   drive_permission_check=None):
+    """Updates the Google Sheets and uploads and publishes the league sheet, then prints how long each part took and
+    how often the sheet metadata and folder id caches saved a request.
+
+    The league sheet is uploaded from workbook_data when it's given, otherwise from the file_name on disk. The Drive
+    permissions are taken from drive_permission_check, a google_drive_functions.DrivePermissionCheck started before
+    the results were typed in, if there is one and otherwise checked here.
+
+    Returns:
+        TaskScheduler that ran the tasks, with the published file's id as the result of the 'publish' task.
+    """
+    date_long, date_short, is_tryouts = shared_functions.reformat_file_name(file_name)
+    drive_file_name = '{}-{}-{}'.format(*date_short)
+
+    def update_ratings_sheet():
+        excel_functions.update_ratings_sheet(google_sheets_functions.create_service(), league_data)
+
+    def update_prize_points_sheet():
+        excel_functions.update_prize_points_sheet(google_sheets_functions.create_service(), file_name, league_data,
+                                                  prize_points)
+
+    def check_drive_permissions():
+        if drive_permission_check is not None:
+            drive_permission_check.wait()
+        else:
+            google_drive_functions.create_permissive_service()
+
+    def get_semester_folder_id():
+        return google_drive_functions.get_semester_folder_id(service=google_drive_functions.create_service(),
+                                                             file_name=date_long, is_tryouts=is_tryouts)
+
+    def upload(semester_folder_id):
+        return google_drive_functions.sync_league_file(service=google_drive_functions.create_service(),
+                                                       drive_file_name=drive_file_name,
+                                                       semester_folder_id=semester_folder_id,
+                                                       excel_file_name=file_name, workbook_data=workbook_data)
+
+    def publish(league_file):
+        return google_drive_functions.publish_league_file(service=google_drive_functions.create_service(),
+                                                          league_file=league_file)
+
+    scheduler = task_scheduler.TaskScheduler(max_workers or task_scheduler.DEFAULT_MAX_WORKERS)
+    scheduler.add_task('ratings sheet', update_ratings_sheet)
+    scheduler.add_task('prize points sheet', update_prize_points_sheet)
+    scheduler.add_task('drive permissions', api_tracer.traced('permissions', check_drive_permissions))
+    scheduler.add_task('folders', api_tracer.traced('folder resolution', lambda _: get_semester_folder_id()),
+                       dependencies=['drive permissions'])
+    scheduler.add_task('upload', api_tracer.traced('upload', upload), dependencies=['folders'])
+    scheduler.add_task('publish', api_tracer.traced('publish', publish), dependencies=['upload'])
+
+    scheduler.run()
+    print(scheduler.report())
+    print(google_sheets_functions.sheet_metadata_cache.report())
+    print(google_drive_functions.folder_id_cache.report())
+    if open_league_file and scheduler.tasks['publish'].status == task_scheduler.DONE:
+        google_drive_functions.open_league_file(scheduler.get_result('publish'))
+    return scheduler
@@ -0,0 +1,206 @@
+import math
+from bisect import bisect_right
+
+# Rating and standings calculations for a group. Nothing in here touches a worksheet, so the same results can be
+# rendered by ResultSheet/SummarySheet or reused for replays and simulations.
+
+match_ordering_selection = {3: ['A:C', 'B:C', 'A:B'],
+                            4: ['B:D', 'A:C', 'B:C', 'A:D', 'C:D', 'A:B'],
+                            5: ['A:D', 'B:C', 'B:E', 'C:D', 'A:E', 'B:D', 'A:C', 'D:E', 'C:E', 'A:B'],
+                            6: ['A:D', 'B:C', 'E:F', 'A:E', 'B:D', 'C:F', 'B:F', 'D:E', 'A:C', 'A:F',
+                                'B:E', 'C:D', 'C:E', 'D:F', 'A:B'],
+                            7: ['A:F', 'B:E', 'C:D', 'B:G', 'C:F', 'D:E', 'A:E', 'B:D', 'C:G', 'A:C', 'D:F',
+                                'E:G', 'F:G', 'A:D', 'B:C', 'A:B', 'E:F', 'D:G', 'A:G', 'B:F', 'C:E']}
+letter_dict = {'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5, 'G': 6}
+prize_points_amounts = {1: [10, 8, 6, 4, 2, 2, 2],
+                        2: [8, 6, 4, 2, 2, 2, 2],
+                        3: [8, 6, 4, 2, 2, 2, 2],
+                        4: [7, 5, 3, 1, 1, 1, 1],
+                        5: [7, 5, 3, 1, 1, 1, 1],
+                        6: [7, 5, 3, 1, 1, 1, 1],
+                        7: [7, 5, 3, 1, 1, 1, 1],
+                        8: [7, 5, 3, 1, 1, 1, 1]}
+rating_adjustment_threshold = 50
+
+# point changes for the higher seeded player, looked up by the rating difference between the two players
+expected_difference_thresholds = [13, 38, 63, 88, 113, 138, 188, 238]
+expected_point_changes = [8, 7, 6, 5, 4, 3, 2, 1, 0]
+upset_difference_thresholds = [13, 38, 63, 88, 113, 138, 163, 188, 213, 238]
+upset_point_changes = [-8, -10, -13, -16, -20, -25, -30, -35, -40, -45, -50]
+
+class MatchResult:
+    def __init__(self, player_one_letter, player_one, player_two_letter, player_two, score, point_change):
+        self.player_one_letter = player_one_letter
+        self.player_one = player_one
+        self.player_two_letter = player_two_letter
+        self.player_two = player_two
+        self.score = score # (games won by player one, games won by player two), (0, 0) if the match wasn't played
+        self.point_change = point_change # points gained by player one and lost by player two
+
+class GroupResult:
+    def __init__(self, group, match_results, match_winner):
+        self.group = group
+        self.match_results = match_results
+        self.match_winner = match_winner
+
+def higher_rating_is_winner(match):
+    games_won = match[0]
+    games_lost = match[2]
+    if games_won == games_lost:
+        return 'tied'
+    return int(games_won) > int(games_lost)
+
+def rating_calc(higher_rating, lower_rating, higher_rating_is_winner):
+    if higher_rating_is_winner == 'tied':
+        return 0
+    difference = higher_rating - lower_rating
+    # expected
+    if higher_rating_is_winner:
+        return expected_point_changes[bisect_right(expected_difference_thresholds, difference)]
+    # upset
+    return upset_point_changes[bisect_right(upset_difference_thresholds, difference)]
+
+def is_unplayed(match):
+    return len(match) == 0 or (int(match[0]) == int(match[2]) == 0)
+
+def get_match_players(group, match_ordering, index):
+    player_one_letter = match_ordering[index][0]
+    player_two_letter = match_ordering[index][2]
+    player_one = group.sorted_players[letter_dict[player_one_letter]]
+    player_two = group.sorted_players[letter_dict[player_two_letter]]
+    return player_one_letter, player_one, player_two_letter, player_two
+
+def get_point_changes(group, matches, rating_idx):
+    match_ordering = match_ordering_selection[group.num_players]
+    point_changes = []
+    for index, match in enumerate(matches):
+        if is_unplayed(match):
+            point_changes.append(0)
+        else:
+            _, player_one, _, player_two = get_match_players(group, match_ordering, index)
+            point_changes.append(rating_calc(player_one.player_rating[rating_idx], player_two.player_rating[rating_idx],
+                                             higher_rating_is_winner(match)))
+    return point_changes
+
+def compute_group(group, matches):
+    """Calculates rating changes, adjusted ratings, matches/games won and the tiebreak order for a group.
+
+    Ratings are first calculated from each player's initial rating. Anybody who gains at least
+    rating_adjustment_threshold points gets an adjusted rating, in which case the point changes are recalculated
+    from the adjusted ratings. The players in group.sorted_players are updated in place.
+
+    Returns:
+        GroupResult, the per match results and the tiebreak order of the group.
+    """
+    match_ordering = match_ordering_selection[group.num_players]
+    point_changes = get_point_changes(group, matches, 0)
+
+    rating_changes = {player: 0 for player in group.sorted_players}
+    for index, point_change in enumerate(point_changes):
+        _, player_one, _, player_two = get_match_players(group, match_ordering, index)
+        rating_changes[player_one] += point_change
+        rating_changes[player_two] -= point_change
+
+    is_adjusted = False
+    for player in group.sorted_players:
+        player.player_rating[1] = player.player_rating[0]
+        if rating_changes[player] >= rating_adjustment_threshold:
+            player.player_rating[1] = player.player_rating[0] + rating_changes[player]
+            is_adjusted = True
+        player.rating_change = 0
+        player.matches_won = 0
+        player.games_won = 0
+
+    # ratings only need to be recalculated if somebody's rating was adjusted
+    if is_adjusted:
+        point_changes = get_point_changes(group, matches, 1)
+
+    match_results = []
+    for index, match in enumerate(matches):
+        player_one_letter, player_one, player_two_letter, player_two = get_match_players(group, match_ordering, index)
+        point_change = point_changes[index]
+        if is_unplayed(match):
+            score = (0, 0)
+        else:
+            score = (int(match[0]), int(match[2]))
+            if score[0] > score[1]:
+                player_one.matches_won += 1
+            elif score[0] < score[1]:
+                player_two.matches_won += 1
+            player_one.games_won += score[0]
+            player_two.games_won += score[1]
+        player_one.rating_change += point_change
+        player_two.rating_change -= point_change
+        match_results.append(MatchResult(player_one_letter, player_one, player_two_letter, player_two, score,
+                                         point_change))
+
+    for player in group.sorted_players:
+        player.final_rating = player.player_rating[1] + player.rating_change
+
+    return GroupResult(group, match_results, get_match_winner(group, matches))
+
+def get_match_winner(group, matches):
+    #Sort by matches won, ties broken with games won
+    match_ordering = match_ordering_selection[group.num_players]
+    match_winner_groups = []
+    sort_match_winner = sorted(group.sorted_players, key=lambda player: player.games_won, reverse=True)
+    sort_match_winner = sorted(sort_match_winner, key=lambda player: player.matches_won, reverse=True)
+    #Check for further ties
+    start = 0
+    end = 1
+    while(start != len(sort_match_winner)-1):
+        if (sort_match_winner[start].matches_won == sort_match_winner[end].matches_won) and (sort_match_winner[start].games_won == sort_match_winner[end].games_won):
+            if end+1 < len(sort_match_winner):
+                end+=1
+            else:
+                match_winner_groups.append(sort_match_winner[start:])
+                break
+        else:
+            #if two-way tie get h2h
+            if end-start == 2:
+                player1_index = group.sorted_players.index(sort_match_winner[start])
+                player2_index = group.sorted_players.index(sort_match_winner[start+1])
+                if player2_index < player1_index:
+                    sort_match_winner[start], sort_match_winner[start+1] = sort_match_winner[start+1], sort_match_winner[start]
+                    tempIndex = player2_index
+                    player2_index = player1_index
+                    player1_index = tempIndex
+                for key, val in letter_dict.items():
+                    if val == player1_index:
+                        player1_letter = key
+                    if val == player2_index:
+                        player2_letter = key
+                index = match_ordering.index(player1_letter+':'+player2_letter)
+                if int(matches[index][0]) < int(matches[index][2]):
+                    sort_match_winner[start], sort_match_winner[start+1] = sort_match_winner[start+1], sort_match_winner[start]
+                match_winner_groups.append([sort_match_winner[start]])
+                match_winner_groups.append([sort_match_winner[start+1]])
+            #if more than two-way tie accept tie
+            elif end-start > 2:
+                match_winner_groups.append(sort_match_winner[start:end])
+            #if no tie
+            elif end-start == 1:
+                match_winner_groups.append([sort_match_winner[start]])
+
+            start = end
+            if start+1 < len(sort_match_winner):
+                end = start + 1
+            else:
+                match_winner_groups.append([sort_match_winner[start]])
+                break
+    return match_winner_groups
+
+def get_group_prize_points(group, match_winner):
+    # tables past the last one in prize_points_amounts get the same points as it
+    amounts = prize_points_amounts[min(group.group_num, max(prize_points_amounts))]
+    group_prize_points = {}
+    rank = 0
+    for i in match_winner:
+        if len(i) == 1:
+            group_prize_points[i[0].player_name] = amounts[rank]
+        elif len(i) > 1:
+            point_value = math.ceil(sum(amounts[rank:rank+len(i)])/len(i))
+            for j in i:
+                group_prize_points[j.player_name] = point_value
+        rank += len(i)
+    return group_prize_points
@@ -0,0 +1,146 @@
+import argparse
+import api_tracer
+import profiler
+import io
+import os
+import operator
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import shared_functions
+import excel_functions
+import google_drive_functions
+import google_sheets_functions
+import league_reader
+import rating_engine
+import sheets_mirror
+from tabulate import tabulate
+
+# Rebuilds every semester's ratings sheet by replaying the archived league workbooks in date order. Each school
+# year's leagues are chained through the same rating rules as ResultSheet, with independent school years replayed in
+# parallel. The archive is read from a local mirror of the Drive results folder which can be refreshed with
+# --download.
+
+DEFAULT_MIRROR_DIR = 'league_archive'
+XLSX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def get_league_date(file_name):
+    date_long, date_short, is_tryouts = shared_functions.reformat_file_name(os.path.basename(file_name))
+    month, day, year = date_long
+    return year, month, day, not is_tryouts
+
+def find_league_files(mirror_dir):
+    league_files = []
+    for directory, _, file_names in os.walk(mirror_dir):
+        for file_name in file_names:
+            if not file_name.endswith('.xlsx'):
+                continue
+            try:
+                get_league_date(file_name)
+            except (IndexError, ValueError):
+                continue
+            league_files.append(os.path.join(directory, file_name))
+    return sorted(league_files, key=get_league_date)
+
+def get_school_year(file_name):
+    ratings_sheet_name = excel_functions.get_ratings_sheet_name(os.path.basename(file_name))
+    return ratings_sheet_name, excel_functions.get_prize_points_sheet_name(ratings_sheet_name)
+
+def replay_school_year(league_files):
+    ratings = {}
+    semester_rosters = OrderedDict()
+    for league_file in league_files:
+        ratings_sheet_name, _ = get_school_year(league_file)
+        semester_roster = semester_rosters.setdefault(ratings_sheet_name, OrderedDict())
+        for league_group in league_reader.read_league(league_file).groups:
+            group = excel_functions.Group(group_num=league_group.group_num, num_players=len(league_group.players))
+            for league_player in league_group.players:
+                player_rating = ratings.get(league_player.player_name, league_player.rating_before)
+                group.players.append(excel_functions.Player(player_name=league_player.player_name,
+                                                            player_rating=player_rating))
+            # keep the archived seeding so the match ordering still lines up with the scores
+            group.sorted_players = list(group.players)
+            rating_engine.compute_group(group, league_group.matches)
+            for player in group.sorted_players:
+                ratings[player.player_name] = player.final_rating
+                semester_roster[player.player_name] = player.final_rating
+
+    ratings_sheets = OrderedDict()
+    for ratings_sheet_name, semester_roster in semester_rosters.items():
+        ratings_sheets[ratings_sheet_name] = [[i + 1, element[0], element[1]] for i, element
+                                              in enumerate(sorted(semester_roster.items(),
+                                                                  key=operator.itemgetter(1), reverse=True))]
+    return ratings_sheets
+
+def replay(league_files, max_workers=None):
+    school_years = defaultdict(list)
+    for league_file in league_files:
+        school_years[get_school_year(league_file)[1]].append(league_file)
+
+    ratings_sheets = OrderedDict()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for school_year_sheets in executor.map(replay_school_year, school_years.values()):
+            ratings_sheets.update(school_year_sheets)
+    return ratings_sheets
+
+def download_results(service, mirror_dir, results_folder_id):
+    for year_folder in google_drive_functions.list_children(service, results_folder_id):
+        for semester_folder in google_drive_functions.list_children(service, year_folder['id']):
+            folder_path = os.path.join(mirror_dir, year_folder['name'], semester_folder['name'])
+            for league_file in google_drive_functions.list_children(service, semester_folder['id'],
+                                                                   google_drive_functions.SPREADSHEET_MIME_TYPE):
+                file_path = os.path.join(folder_path, league_file['name'] + '.xlsx')
+                if os.path.exists(file_path):
+                    continue
+                if not os.path.exists(folder_path):
+                    os.makedirs(folder_path)
+                request = service.files().export_media(fileId=league_file['id'], mimeType=XLSX_MIME_TYPE)
+                buffer = io.BytesIO()
+                google_drive_functions.download_media(request, buffer)
+                with open(file_path, 'wb') as output_file:
+                    output_file.write(buffer.getvalue())
+                print('Downloaded {}'.format(file_path))
+
+def write_ratings_sheets(service, ratings_sheets):
+    for sheet_name, row_data in ratings_sheets.items():
+        if google_sheets_functions.get_sheet_id(service, google_sheets_functions.RATINGS_SPREADSHEET_ID,
+                                                sheet_name) is None:
+            google_sheets_functions.generate_ratings_sheet(service, sheet_name)
+        google_sheets_functions.clear_ratings_sheet(service, sheet_name)
+        google_sheets_functions.write_to_ratings_sheet(service=service, row_data=row_data, start_row_index=1,
+                                                       end_row_index=len(row_data) + 1, sheet_name=sheet_name)
+        sheets_mirror.get_mirror().forget(google_sheets_functions.RATINGS_SPREADSHEET_ID, sheet_name)
+        print('Rebuilt {} with {} players.'.format(sheet_name, len(row_data)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the semester ratings sheets from the archived leagues.')
+    parser.add_argument('--mirror', default=DEFAULT_MIRROR_DIR,
+                        help='local copy of the Drive results folder (default: {})'.format(DEFAULT_MIRROR_DIR))
+    parser.add_argument('--download', action='store_true',
+                        help='download any league sheets missing from the mirror before replaying')
+    parser.add_argument('--school-year', help="only rebuild one school year, e.g. '2023-2024'")
+    parser.add_argument('--processes', type=int, help='number of school years to replay at once')
+    parser.add_argument('--dry-run', action='store_true', help='print the rebuilt ratings instead of writing them')
+    api_tracer.add_arguments(parser)
+    profiler.add_arguments(parser)
+    args, _ = parser.parse_known_args()
+    api_tracer.enable_from_args(args)
+    profiler.enable_from_args(args)
+
+    if args.download:
+        with api_tracer.phase('download'):
+            download_results(google_drive_functions.create_permissive_service(), args.mirror,
+                             google_drive_functions.RESULTS_FOLDER_ID)
+
+    league_files = find_league_files(args.mirror)
+    if args.school_year:
+        league_files = [league_file for league_file in league_files
+                        if get_school_year(league_file)[1] == args.school_year]
+    ratings_sheets = replay(league_files, max_workers=args.processes)
+
+    if args.dry_run:
+        for sheet_name, row_data in ratings_sheets.items():
+            print('\n' + sheet_name)
+            print(tabulate(row_data, headers=['', 'Name', 'Rating']))
+    else:
+        with api_tracer.phase('ratings write'):
+            write_ratings_sheets(google_sheets_functions.create_service(), ratings_sheets)
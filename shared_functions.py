@@ -1,18 +1,35 @@
 from warnings import filterwarnings
 filterwarnings("ignore")
 
-import os, sys
-from apiclient import errors
-from oauth2client.file import Storage
-from oauth2client import client
-from oauth2client import tools
+import os, sys, json, time, datetime, threading, random, socket
 from re import split
+import api_tracer
+import profiler
+import config
 
-try:
-    import argparse
-    flags = argparse.ArgumentParser(parents=[tools.argparser]).parse_args()
-except ImportError:
-    flags = None
+# apiclient, oauth2client and httplib2 take a noticeable part of a second to import, so they're only imported once the
+# first request is made rather than before the date prompt shows up.
+
+DISCOVERY_URLS = {
+    ('drive', 'v3'): 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest',
+    ('sheets', 'v4'): 'https://sheets.googleapis.com/$discovery/rest?version=v4'
+}
+DISCOVERY_CACHE_DIR_NAME = 'discovery'
+DISCOVERY_CACHE_MAX_AGE = 7 * 24 * 60 * 60 # seconds
+TOKEN_REFRESH_MARGIN = 5 * 60 # seconds before the access token expires
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+AUTH_STATUSES = (401, 403)
+MAX_RETRIES = 6
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'PATCH', 'DELETE')
+# POSTs that overwrite or clear fixed ranges, so making them twice leaves the same values as making them once
+IDEMPOTENT_METHOD_IDS = ('sheets.spreadsheets.values.batchUpdate', 'sheets.spreadsheets.values.batchClear',
+                         'sheets.spreadsheets.values.clear')
+MAX_BACKOFF = 64 # seconds
+SHEETS_WRITE_REQUESTS_PER_MINUTE = 60 # per user quota
+
+flags = None
 
 class HiddenPrints:
     def __enter__(self):
@@ -22,13 +39,137 @@ class HiddenPrints:
     def __exit__(self, exc_type, exc_val, exc_tb):
         sys.stdout = self._original_stdout
 
-def check_permissions(service, folder_id, cache_file_name):
+def get_flags():
+    """Parses the oauth2client command line flags the first time credentials are needed."""
+    global flags
+    if flags is None:
+        from oauth2client import tools
+        try:
+            import argparse
+            flags = argparse.ArgumentParser(parents=[tools.argparser], add_help=False).parse_known_args()[0]
+        except ImportError:
+            flags = False
+    return flags
+
+class TokenBucket:
+    """Spaces requests out to stay within a per minute quota, letting short bursts through up to capacity."""
+    def __init__(self, requests_per_minute, capacity=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity or requests_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+sheets_write_bucket = TokenBucket(SHEETS_WRITE_REQUESTS_PER_MINUTE)
+
+def get_error_reason(error):
     try:
-        with HiddenPrints():
-            service.permissions().list(fileId=folder_id).execute()
-    except errors.HttpError:
-        print("You don't have permission to access these files.")
-        remove_file_from_cache(cache_file_name)
+        content = error.content.decode('utf-8') if isinstance(error.content, bytes) else error.content
+        return json.loads(content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def is_rate_limit_error(error):
+    return error.resp.status == 429 or (error.resp.status == 403 and get_error_reason(error) in RATE_LIMIT_REASONS)
+
+def is_transient_error(error):
+    return error.resp.status in RETRYABLE_STATUSES or is_rate_limit_error(error)
+
+def is_auth_error(error):
+    return error.resp.status in AUTH_STATUSES and not is_rate_limit_error(error)
+
+def is_connection_error(error):
+    """Whether Google couldn't be reached, or kept failing after every retry, so the call can be made again later."""
+    from apiclient import errors
+    import httplib2
+    if isinstance(error, errors.HttpError):
+        return is_transient_error(error)
+    return isinstance(error, (httplib2.HttpLib2Error, socket.error))
+
+def get_backoff(retry):
+    return min(2 ** retry, MAX_BACKOFF) * random.uniform(0.5, 1)
+
+def execute(request, max_retries=MAX_RETRIES, is_idempotent=None, find_result=None):
+    """Executes a Google API request, retrying rate limits, server errors and dropped connections.
+
+    Retries wait with jittered exponential backoff. Any other error, auth errors included, is raised straight away so
+    the caller can tell a missing permission apart from a busy server. Sheets writes wait for sheets_write_bucket so
+    long batch runs stay within the per user write quota instead of failing partway through.
+
+    After a server error or a dropped connection the request may have been carried out even though its response was
+    lost, so it's only made again if doing it twice is harmless. That's GETs, PUTs, PATCHes and DELETEs and the POSTs
+    in IDEMPOTENT_METHOD_IDS unless is_idempotent says otherwise. Anything else, like creating a file or adding a
+    sheet, is only retried if find_result, which looks for what the request would have made, returns None; what it
+    finds is returned instead. Without a find_result the error is raised. Rate limits are always retried since the
+    request was turned away before it was carried out.
+
+    Returns:
+        The request's response body.
+    """
+    from apiclient import errors
+    import httplib2
+    if is_idempotent is None:
+        is_idempotent = request.method in IDEMPOTENT_METHODS or request.methodId in IDEMPOTENT_METHOD_IDS
+    with profiler.span(request.methodId or request.method):
+        if request.method != 'GET' and 'sheets.googleapis.com' in request.uri:
+            with profiler.span('sheets quota wait'):
+                sheets_write_bucket.acquire()
+        retry = 0
+        while True:
+            try:
+                return request.execute()
+            except errors.HttpError as error:
+                is_outcome_unknown = not is_rate_limit_error(error)
+                if not is_transient_error(error) or retry >= max_retries or \
+                        is_outcome_unknown and not is_idempotent and find_result is None:
+                    raise
+            except (httplib2.HttpLib2Error, socket.error):
+                is_outcome_unknown = True
+                if retry >= max_retries or not is_idempotent and find_result is None:
+                    raise
+            if is_outcome_unknown and not is_idempotent:
+                with profiler.span('find result'):
+                    result = find_result()
+                if result is not None:
+                    return result
+            retry += 1
+            with profiler.span('retry backoff'):
+                time.sleep(get_backoff(retry))
+
+def has_permission(service, folder_id):
+    """Whether the folder can be reached with the service's credentials. Errors other than a missing permission are
+    raised."""
+    from apiclient import errors
+    try:
+        execute(service.permissions().list(fileId=folder_id))
+    except errors.HttpError as error:
+        # Drive answers with a 404 for folders that aren't shared with you
+        if not is_auth_error(error) and error.resp.status != 404:
+            raise
+        return False
+    return True
+
+def check_permissions(service, folder_id, cache_file_name):
+    with HiddenPrints():
+        is_permitted = has_permission(service, folder_id)
+    if not is_permitted:
+        deny_permission(cache_file_name)
+
+def deny_permission(cache_file_name):
+    print("You don't have permission to access these files.")
+    remove_file_from_cache(cache_file_name)
 
 def remove_file_from_cache(cache_file_name):
     credential_path = get_credential_path(cache_file_name)
@@ -53,6 +194,9 @@ def get_credentials(cache_file_name, client_secret_file, scopes, application_nam
     Returns:
         Credentials, the obtained credential.
     """
+    from oauth2client.file import Storage
+    from oauth2client import client
+    from oauth2client import tools
     credential_path = get_credential_path(cache_file_name)
     store = Storage(credential_path)
     credentials = store.get()
@@ -60,8 +204,8 @@ def get_credentials(cache_file_name, client_secret_file, scopes, application_nam
         with HiddenPrints():
             flow = client.flow_from_clientsecrets(client_secret_file, scopes)
             flow.user_agent = application_name
-            if flags:
-                credentials = tools.run_flow(flow, store, flags)
+            if get_flags():
+                credentials = tools.run_flow(flow, store, get_flags())
             else: # Needed only for compatibility with Python 2.6
                 credentials = tools.run(flow, store)
         print('Storing credentials to {}'.format(credential_path))
@@ -80,4 +224,118 @@ def reformat_file_name(file_name, tryout_string='tryout'):
         date = name_elements
     date_short = (date[0], date[1], date[2][:2])
     date_long = tuple([int(element) for element in (date[0], date[1], '20' + date[2][:2])])
-    return date_long, date_short, is_tryouts
\ No newline at end of file
+    return date_long, date_short, is_tryouts
+
+def get_discovery_document(api, version):
+    """Returns the API's discovery document, downloading it only if the local copy is missing or older than a week."""
+    discovery_dir = get_credential_path(DISCOVERY_CACHE_DIR_NAME)
+    if not os.path.exists(discovery_dir):
+        os.makedirs(discovery_dir)
+    document_path = os.path.join(discovery_dir, '{}.{}.json'.format(api, version))
+    if os.path.exists(document_path) and time.time() - os.path.getmtime(document_path) < DISCOVERY_CACHE_MAX_AGE:
+        with open(document_path) as document_file:
+            return document_file.read()
+
+    import httplib2
+    from apiclient import errors
+    response, content = httplib2.Http().request(DISCOVERY_URLS[(api, version)])
+    if response.status >= 400:
+        if os.path.exists(document_path):
+            with open(document_path) as document_file:
+                return document_file.read()
+        raise errors.HttpError(response, content)
+    document = content.decode('utf-8') if isinstance(content, bytes) else content
+    json.loads(document)
+    with open(document_path, 'w') as document_file:
+        document_file.write(document)
+    return document
+
+def get_fake_backend():
+    """Returns the in-process stand-in for Sheets and Drive if the config environment asks for one, otherwise None."""
+    if 'fake_backend' not in config.CURRENT_ENV:
+        return None
+    import fake_google_backend
+    return fake_google_backend.get_backend()
+
+class Session:
+    """Credentials loaded once per run and shared by the Drive and Sheets services.
+
+    Each thread gets its own authorized keep-alive httplib2.Http, since httplib2 isn't thread safe, along with its own
+    services built from the locally cached discovery documents. The access token is refreshed in the background shortly
+    before it expires so requests don't have to wait for a refresh. When the config environment uses the fake backend
+    no credentials are loaded and every service sends its requests to the backend instead.
+    """
+    def __init__(self, cache_file_name, client_secret_file, scopes, application_name):
+        self.cache_file_name = cache_file_name
+        self.fake_backend = get_fake_backend()
+        self.credentials = None
+        if self.fake_backend is None:
+            with profiler.span('credential load'):
+                self.credentials = get_credentials(cache_file_name=cache_file_name,
+                                                   client_secret_file=client_secret_file, scopes=scopes,
+                                                   application_name=application_name)
+        self.local = threading.local()
+        self.refresh_lock = threading.Lock()
+        self.refresh_timer = None
+        self.schedule_token_refresh()
+
+    def http(self):
+        if getattr(self.local, 'http', None) is None:
+            if self.fake_backend is not None:
+                self.local.http = self.fake_backend
+            else:
+                import httplib2
+                self.local.http = self.credentials.authorize(httplib2.Http())
+            self.local.services = {}
+        return self.local.http
+
+    def build(self, api, version):
+        http = self.http()
+        service = self.local.services.get((api, version))
+        if service is None:
+            with profiler.span('service build', '{} {}'.format(api, version)):
+                from apiclient import discovery
+                if self.fake_backend is not None:
+                    document = self.fake_backend.get_discovery_document(api, version)
+                else:
+                    document = get_discovery_document(api, version)
+                service = discovery.build_from_document(document, http=http,
+                                                        requestBuilder=api_tracer.get_request_builder())
+            self.local.services[(api, version)] = service
+        return service
+
+    def get_seconds_until_expiry(self):
+        token_expiry = getattr(self.credentials, 'token_expiry', None)
+        if token_expiry is None:
+            return None
+        return (token_expiry - datetime.datetime.utcnow()).total_seconds()
+
+    def schedule_token_refresh(self):
+        seconds_until_expiry = self.get_seconds_until_expiry()
+        if seconds_until_expiry is None:
+            return
+        self.refresh_timer = threading.Timer(max(seconds_until_expiry - TOKEN_REFRESH_MARGIN, 0), self.refresh_token)
+        self.refresh_timer.daemon = True
+        self.refresh_timer.start()
+
+    def refresh_token(self):
+        with self.refresh_lock:
+            seconds_until_expiry = self.get_seconds_until_expiry()
+            if seconds_until_expiry is None or seconds_until_expiry <= TOKEN_REFRESH_MARGIN:
+                try:
+                    import httplib2
+                    self.credentials.refresh(httplib2.Http())
+                except Exception:
+                    # the authorized http objects will still refresh the token themselves when it's needed
+                    return
+        self.schedule_token_refresh()
+
+session = None
+session_lock = threading.Lock()
+
+def get_session(cache_file_name, client_secret_file, scopes, application_name):
+    global session
+    with session_lock:
+        if session is None:
+            session = Session(cache_file_name, client_secret_file, scopes, application_name)
+        return session
@@ -0,0 +1,292 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+import config
+import shared_functions
+import prize_points as prize_points_module
+
+# A copy of each semester's ratings sheet and each school year's prize points sheet kept in SQLite on this computer,
+# so the roster is read from disk instead of waiting on Sheets and a league night can be finished with no network.
+# Each sheet is stored as the values Sheets returns for it. The ratings and prize points a league night writes go into
+# an outbox in the same database, committed before anything is sent, and are applied to the local copy straight away.
+# google_sheets_functions pushes the outbox to Sheets, coalescing every change waiting for a sheet into one write. A
+# change is held back as a conflict when a player or league it touches has changed on the sheet since the results
+# were entered. Nothing here talks to Google; run this file to see what's waiting and to push, force or discard it.
+
+MIRROR_FILE_NAME = 'sheets_mirror.sqlite3'
+SQLITE_TIMEOUT = 30 # seconds to wait for another run that has the database locked
+RATINGS = 'ratings'
+PRIZE_POINTS = 'prize points'
+
+class ConflictError(Exception):
+    pass
+
+class SheetsMirror:
+    """The mirrored sheets and the outbox of changes waiting to be pushed, in one SQLite database.
+
+    One connection is shared by every thread of the run and each method holds the lock for its whole transaction, so
+    a change and its effect on the local copy are saved together or not at all.
+    """
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS sheets (spreadsheet_id TEXT NOT NULL, '
+                                    'sheet_name TEXT NOT NULL, sheet_values TEXT NOT NULL, synced_at REAL, '
+                                    'PRIMARY KEY (spreadsheet_id, sheet_name))')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                    'spreadsheet_id TEXT NOT NULL, sheet_name TEXT NOT NULL, kind TEXT NOT NULL, '
+                                    'change TEXT NOT NULL, created_at REAL NOT NULL, conflict TEXT)')
+
+    def get_values(self, spreadsheet_id, sheet_name):
+        """Returns the sheet's mirrored values, or None if it has never been mirrored."""
+        with self.lock:
+            row = self.connection.execute('SELECT sheet_values FROM sheets WHERE spreadsheet_id = ? AND sheet_name = ?',
+                                          (spreadsheet_id, sheet_name)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def has_changes(self, spreadsheet_id, sheet_name):
+        with self.lock:
+            return self.count_changes(spreadsheet_id, sheet_name) > 0
+
+    def count_changes(self, spreadsheet_id, sheet_name):
+        return self.connection.execute('SELECT COUNT(*) FROM outbox WHERE spreadsheet_id = ? AND sheet_name = ?',
+                                       (spreadsheet_id, sheet_name)).fetchone()[0]
+
+    def store_values(self, spreadsheet_id, sheet_name, values, synced_at):
+        self.connection.execute('INSERT OR REPLACE INTO sheets (spreadsheet_id, sheet_name, sheet_values, synced_at) '
+                                'VALUES (?, ?, ?, ?)', (spreadsheet_id, sheet_name, json.dumps(values), synced_at))
+
+    def refresh_values(self, spreadsheet_id, sheet_name, values):
+        """Stores values read from Sheets, unless the sheet has changes waiting that they wouldn't include.
+
+        Returns:
+            bool, whether the values were stored.
+        """
+        with self.lock, self.connection:
+            if self.count_changes(spreadsheet_id, sheet_name):
+                return False
+            self.store_values(spreadsheet_id, sheet_name, values, time.time())
+            return True
+
+    def forget(self, spreadsheet_id, sheet_name):
+        """Drops the sheet's local copy so it's read from Sheets again, unless it has changes waiting."""
+        with self.lock, self.connection:
+            if not self.count_changes(spreadsheet_id, sheet_name):
+                self.connection.execute('DELETE FROM sheets WHERE spreadsheet_id = ? AND sheet_name = ?',
+                                        (spreadsheet_id, sheet_name))
+
+    def add_change(self, spreadsheet_id, sheet_name, kind, change, apply):
+        """Saves a change to the outbox and applies it to the sheet's local copy in the same transaction.
+
+        apply takes the sheet's values, an empty list if it isn't mirrored, and returns them with the change made.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute('SELECT sheet_values, synced_at FROM sheets WHERE spreadsheet_id = ? AND '
+                                          'sheet_name = ?', (spreadsheet_id, sheet_name)).fetchone()
+            values = json.loads(row[0]) if row is not None else []
+            self.connection.execute('INSERT INTO outbox (spreadsheet_id, sheet_name, kind, change, created_at) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    (spreadsheet_id, sheet_name, kind, json.dumps(change), time.time()))
+            self.store_values(spreadsheet_id, sheet_name, apply(values), row[1] if row is not None else None)
+
+    def get_changes(self, spreadsheet_id=None, sheet_name=None):
+        """Returns the changes waiting to be pushed, oldest first, as dicts with the change itself under 'change'."""
+        query = 'SELECT id, spreadsheet_id, sheet_name, kind, change, created_at, conflict FROM outbox'
+        conditions, parameters = get_conditions(spreadsheet_id, sheet_name)
+        with self.lock:
+            rows = self.connection.execute(query + conditions + ' ORDER BY id', parameters).fetchall()
+        return [{'id': row[0], 'spreadsheet_id': row[1], 'sheet_name': row[2], 'kind': row[3],
+                 'change': json.loads(row[4]), 'created_at': row[5], 'conflict': row[6]} for row in rows]
+
+    def get_pending_sheets(self, spreadsheet_id=None, sheet_name=None):
+        """Returns (spreadsheet id, sheet name, kind) for each sheet with changes waiting, oldest change first."""
+        pending_sheets = OrderedDict()
+        for change in self.get_changes(spreadsheet_id, sheet_name):
+            pending_sheets.setdefault((change['spreadsheet_id'], change['sheet_name']), change['kind'])
+        return [key + (kind,) for key, kind in pending_sheets.items()]
+
+    def set_conflict(self, change_ids, conflict):
+        with self.lock, self.connection:
+            self.connection.executemany('UPDATE outbox SET conflict = ? WHERE id = ?',
+                                        [(conflict, change_id) for change_id in change_ids])
+
+    def finish_push(self, spreadsheet_id, sheet_name, change_ids, values):
+        """Removes the pushed changes from the outbox and stores the sheet's values as they now are on Sheets.
+
+        The values aren't stored if more changes were added while pushing, since the local copy already has those.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM outbox WHERE id = ?', [(change_id,) for change_id in change_ids])
+            if not self.count_changes(spreadsheet_id, sheet_name):
+                self.store_values(spreadsheet_id, sheet_name, values, time.time())
+
+    def discard_changes(self, spreadsheet_id=None, sheet_name=None):
+        """Drops the waiting changes along with the local copies they were applied to.
+
+        Returns:
+            int, the number of changes dropped.
+        """
+        conditions, parameters = get_conditions(spreadsheet_id, sheet_name)
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sheets WHERE (spreadsheet_id, sheet_name) IN (SELECT spreadsheet_id, '
+                                    'sheet_name FROM outbox' + conditions + ')', parameters)
+            return self.connection.execute('DELETE FROM outbox' + conditions, parameters).rowcount
+
+    def get_sheets(self):
+        """Returns (spreadsheet id, sheet name, time last synced with Sheets) for every mirrored sheet."""
+        with self.lock:
+            return self.connection.execute('SELECT spreadsheet_id, sheet_name, synced_at FROM sheets '
+                                           'ORDER BY spreadsheet_id, sheet_name').fetchall()
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM sheets')
+            self.connection.execute('DELETE FROM outbox')
+
+def get_conditions(spreadsheet_id, sheet_name):
+    conditions = []
+    parameters = []
+    if spreadsheet_id is not None:
+        conditions.append('spreadsheet_id = ?')
+        parameters.append(spreadsheet_id)
+    if sheet_name is not None:
+        conditions.append('sheet_name = ?')
+        parameters.append(sheet_name)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), parameters
+
+mirror = None
+mirror_lock = threading.Lock()
+
+def get_mirror():
+    """Returns the mirror for the config environment, opening it the first time it's needed."""
+    global mirror
+    with mirror_lock:
+        if mirror is None:
+            path = config.CURRENT_ENV.get('sheets_mirror_path') or shared_functions.get_credential_path(
+                MIRROR_FILE_NAME)
+            mirror = SheetsMirror(path)
+        return mirror
+
+def to_rating(value):
+    if value is None or value == '':
+        return None
+    return int(float(value))
+
+def coalesce_ratings(changes):
+    """Merges ratings changes in order into one {name: [rating when entered, new rating]}.
+
+    Each player keeps the rating they had before the first change and the rating from the last one.
+    """
+    ratings = OrderedDict()
+    for change in changes:
+        for name, (base_rating, rating) in change['ratings'].items():
+            if name in ratings:
+                ratings[name][1] = rating
+            else:
+                ratings[name] = [base_rating, rating]
+    return ratings
+
+def get_ratings_conflicts(ratings, values):
+    """Returns a line for each player whose rating on the sheet is neither what it was when the results were entered
+    nor what is about to be written. values is the ratings sheet's rank, name and rating columns."""
+    sheet_ratings = dict(zip(values[1], [to_rating(value) for value in values[2]])) if len(values) > 2 else {}
+    conflicts = []
+    for name, (base_rating, rating) in ratings.items():
+        sheet_rating = sheet_ratings.get(name)
+        if sheet_rating not in (base_rating, rating):
+            conflicts.append('{} is {} on the sheet but was {} when the results were entered; this computer has {}'
+                             .format(name, sheet_rating, base_rating, rating))
+    return conflicts
+
+def coalesce_prize_points(changes):
+    """Merges prize points changes in order into one change per league date, keeping the last points entered and the
+    league's prize points as they were on the sheet before the first change."""
+    leagues = OrderedDict()
+    for change in changes:
+        league = leagues.get(change['league_date'])
+        if league is None:
+            leagues[change['league_date']] = dict(change, roster=list(change['roster']))
+        else:
+            league['points'] = change['points']
+            league['roster'].extend(name for name in change['roster'] if name not in league['roster'])
+    return leagues
+
+def is_same_league(points, other_points):
+    return all(prize_points_module.to_points(points.get(name)) == prize_points_module.to_points(other_points.get(name))
+               for name in set(points) | set(other_points))
+
+def get_prize_points_conflicts(leagues, values):
+    """Returns a line for each league whose column on the sheet is neither what it was when the results were entered
+    nor what is about to be written. values is the prize points sheet's rows, header included."""
+    table = prize_points_module.PrizePointsTable.from_sheet_values(values)
+    conflicts = []
+    for league_date, league in leagues.items():
+        if league_date not in table.date_index:
+            continue
+        sheet_points = {name: table.get_points(league_date, name) for name in table.names}
+        if not is_same_league(sheet_points, league['base'] or {}) and not is_same_league(sheet_points,
+                                                                                         league['points']):
+            conflicts.append('the {} league was changed on the sheet after the results were entered'
+                             .format(league_date))
+    return conflicts
+
+def get_spreadsheet_name(spreadsheet_id):
+    if spreadsheet_id == config.CURRENT_ENV['ratings_spreadsheet_id']:
+        return 'Ratings'
+    if spreadsheet_id == config.CURRENT_ENV['prize_points_spreadsheet_id']:
+        return 'Prize points'
+    return spreadsheet_id
+
+def format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp)) if timestamp else 'never'
+
+def report(sheets_mirror):
+    from tabulate import tabulate
+    changes = sheets_mirror.get_changes()
+    rows = []
+    for spreadsheet_id, sheet_name, synced_at in sheets_mirror.get_sheets():
+        sheet_changes = [change for change in changes
+                         if (change['spreadsheet_id'], change['sheet_name']) == (spreadsheet_id, sheet_name)]
+        conflicts = [change['conflict'] for change in sheet_changes if change['conflict']]
+        rows.append([get_spreadsheet_name(spreadsheet_id), sheet_name, format_time(synced_at), len(sheet_changes),
+                     conflicts[-1] if conflicts else ''])
+    if not rows:
+        return 'Nothing is mirrored in {} yet.'.format(sheets_mirror.path)
+    return '{}\n\n{} changes waiting to be pushed.'.format(
+        tabulate(rows, headers=['Spreadsheet', 'Sheet', 'Last synced', 'Waiting', 'Conflict']), len(changes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show, push or discard the ratings and prize points changes saved on '
+                                                 'this computer that are waiting to go to Google Sheets.')
+    parser.add_argument('--push', action='store_true', help='push the waiting changes now')
+    parser.add_argument('--force', action='store_true',
+                        help="with --push, write changes even where the sheet was changed since they were entered")
+    parser.add_argument('--discard', action='store_true',
+                        help='drop the waiting changes so the sheets are read from Google Sheets again')
+    parser.add_argument('--sheet', help="only push or discard the changes to one sheet, e.g. 'Fall 2023'")
+    args = parser.parse_args(argv)
+
+    sheets_mirror = get_mirror()
+    if args.discard:
+        print('Discarded {} changes.'.format(sheets_mirror.discard_changes(sheet_name=args.sheet)))
+    elif args.push:
+        import api_tracer
+        import google_sheets_functions
+        try:
+            with api_tracer.phase('sync'):
+                pushed_count = google_sheets_functions.push_changes(google_sheets_functions.create_service(),
+                                                                    sheet_name=args.sheet, force=args.force)
+            print('Pushed {} changes.'.format(pushed_count))
+        except ConflictError as error:
+            print(error)
+    print(report(sheets_mirror))
+    sys.exit(1 if any(change['conflict'] for change in sheets_mirror.get_changes()) else 0)
+
+if __name__ == '__main__':
+    main()
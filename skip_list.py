@@ -0,0 +1,130 @@
+import random
+
+MAX_LEVELS = 20 # plenty for a million keys
+
+class Last:
+    """Sorts after every key, to end each level of the list."""
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+class Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # how many keys each link moves forward
+        self.width = [1] * levels
+
+END = Node(Last(), 0)
+
+class IndexableSkipList:
+    """Keys kept sorted with expected O(log n) insertion, removal and lookup by index.
+
+    Each node's links record how many keys they skip, so the index of a key is the sum of the links followed to reach
+    it. Node heights come from a seeded generator so that runs over the same data build the same list.
+    """
+    def __init__(self, keys=()):
+        self.size = 0
+        self.head = Node(None, MAX_LEVELS)
+        self.head.next = [END] * MAX_LEVELS
+        self.random = random.Random(0)
+        # sorted keys are linked in one pass, each level's last node waiting for the next one tall enough to reach it
+        tails = [self.head] * MAX_LEVELS
+        tail_indexes = [-1] * MAX_LEVELS
+        for index, key in enumerate(sorted(keys)):
+            node = Node(key, self.get_level_count())
+            for level in range(len(node.next)):
+                tails[level].next[level] = node
+                tails[level].width[level] = index - tail_indexes[level]
+                tails[level] = node
+                tail_indexes[level] = index
+            self.size += 1
+        for level in range(MAX_LEVELS):
+            tails[level].next[level] = END
+            tails[level].width[level] = self.size - tail_indexes[level]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return self.iterate()
+
+    def get_level_count(self):
+        levels = 1
+        while levels < MAX_LEVELS and self.random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def find_chain(self, key, inclusive):
+        # the last node before key on every level, and how far along the list each one is
+        chain = [None] * MAX_LEVELS
+        indexes = [0] * MAX_LEVELS
+        node = self.head
+        index = -1
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key <= key if inclusive else node.next[level].key < key:
+                index += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            indexes[level] = index
+        return chain, indexes
+
+    def insert(self, key):
+        """Adds a key after any equal ones.
+
+        Returns:
+            int: the index the key was inserted at.
+        """
+        chain, indexes = self.find_chain(key, inclusive=True)
+        index = indexes[0] + 1
+        levels = self.get_level_count()
+        node = Node(key, levels)
+        for level in range(levels):
+            previous_node = chain[level]
+            steps = index - indexes[level]
+            node.next[level] = previous_node.next[level]
+            node.width[level] = previous_node.width[level] - steps + 1
+            previous_node.next[level] = node
+            previous_node.width[level] = steps
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+        return index
+
+    def remove(self, key):
+        """Removes a key, raising KeyError if it isn't in the list.
+
+        Returns:
+            int: the index the key was removed from.
+        """
+        chain, indexes = self.find_chain(key, inclusive=False)
+        node = chain[0].next[0]
+        if node is END or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous_node = chain[level]
+            previous_node.width[level] += node.width[level] - 1
+            previous_node.next[level] = node.next[level]
+        for level in range(len(node.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+        return indexes[0] + 1
+
+    def iterate(self, start=0, stop=None):
+        """Yields the keys from index start up to but not including stop."""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return
+        node = self.head
+        remaining = start + 1
+        for level in reversed(range(MAX_LEVELS)):
+            while node.width[level] <= remaining and node.next[level] is not END:
+                remaining -= node.width[level]
+                node = node.next[level]
+        for _ in range(stop - start):
+            yield node.key
+            node = node.next[0]
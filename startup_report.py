@@ -0,0 +1,90 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Reports how long it takes to get from launching the CLI to its first prompt, using the interpreter's -X importtime
+# output. Everything imported before the date prompt is on the critical path, so the modules that should only be
+# loaded once their phase begins are flagged if they show up.
+
+DEFAULT_MODULE = 'automation'
+DEFAULT_BUDGET_MS = 150
+DEFAULT_TOP = 15
+DEFERRED_MODULES = ['apiclient', 'googleapiclient', 'oauth2client', 'httplib2', 'tabulate', 'xlsxwriter', 'readline',
+                    'numpy']
+
+def get_import_times(module_name):
+    """Imports a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        list of (module, self microseconds, cumulative microseconds) in import order, and the wall clock seconds the
+        interpreter took to start and import the module.
+    """
+    start = time.time()
+    # run from this directory so the module is found wherever the CLI was launched from
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module_name)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    _, stderr = process.communicate()
+    wall_time = time.time() - start
+    if process.returncode != 0:
+        raise RuntimeError('Importing {} failed:\n{}'.format(module_name, stderr))
+
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative_time, name = line[len('import time:'):].split('|')
+        import_times.append((name.strip(), int(self_time), int(cumulative_time)))
+    return import_times, wall_time
+
+def get_frozen_import_times(module_name):
+    """Times the import in this process, for bundled executables where -X importtime isn't available."""
+    loaded_modules = set(sys.modules)
+    start = time.time()
+    __import__(module_name)
+    wall_time = time.time() - start
+    return [(name, 0, 0) for name in sys.modules if name not in loaded_modules], wall_time
+
+def report(module_name=DEFAULT_MODULE, budget_ms=DEFAULT_BUDGET_MS, top=DEFAULT_TOP):
+    """Prints the slowest imports and any deferred module that was loaded early.
+
+    Returns:
+        bool, whether the import stayed within the budget without loading any deferred module.
+    """
+    if getattr(sys, 'frozen', False):
+        import_times, wall_time = get_frozen_import_times(module_name)
+    else:
+        import_times, wall_time = get_import_times(module_name)
+    total_ms = wall_time * 1000
+
+    print('Importing {} took {:.0f} ms (budget {} ms), {} modules.'.format(module_name, total_ms, budget_ms,
+                                                                           len(import_times)))
+    slowest = sorted(import_times, key=lambda import_time: import_time[2], reverse=True)[:top]
+    if slowest and slowest[0][2]:
+        print('\n{:>10} {:>10}  {}'.format('self ms', 'total ms', 'module'))
+        for name, self_time, cumulative_time in slowest:
+            print('{:>10.1f} {:>10.1f}  {}'.format(self_time / 1000.0, cumulative_time / 1000.0, name))
+
+    early_modules = sorted(set(name.split('.')[0] for name, _, _ in import_times) & set(DEFERRED_MODULES))
+    if early_modules:
+        print('\nLoaded before the first prompt but should wait for their phase: {}'.format(', '.join(early_modules)))
+    within_budget = total_ms <= budget_ms and not early_modules
+    if not within_budget:
+        print('\nStartup is over budget.')
+    return within_budget
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report how long the CLI takes to reach its first prompt.')
+    parser.add_argument('--module', default=DEFAULT_MODULE,
+                        help='module to import (default: {})'.format(DEFAULT_MODULE))
+    parser.add_argument('--budget-ms', type=int, default=DEFAULT_BUDGET_MS,
+                        help='startup time allowed before the report fails (default: {})'.format(DEFAULT_BUDGET_MS))
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP,
+                        help='number of slowest imports to list (default: {})'.format(DEFAULT_TOP))
+    args, _ = parser.parse_known_args(argv)
+    sys.exit(0 if report(args.module, args.budget_ms, args.top) else 1)
+
+if __name__ == '__main__':
+    main()
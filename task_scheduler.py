@@ -0,0 +1,119 @@
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Runs a handful of network calls at the same time on a small thread pool while keeping the order between the ones
+# that depend on each other, e.g. a file can only be published once it has been uploaded. A task is called with the
+# results of its dependencies, in the order they were listed, and is skipped if any of them failed.
+
+DEFAULT_MAX_WORKERS = 4
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+class Task:
+    def __init__(self, name, function, dependencies):
+        self.name = name
+        self.function = function
+        self.dependencies = list(dependencies)
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.start_time = None
+        self.end_time = None
+
+    def get_elapsed_time(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+class TaskScheduler:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.tasks = OrderedDict()
+        self.start_time = None
+        self.end_time = None
+
+    def add_task(self, name, function, dependencies=()):
+        """Adds a task that runs once all of its dependencies are done. Dependencies have to be added first."""
+        if name in self.tasks:
+            raise ValueError('There is already a task named {}.'.format(name))
+        for dependency in dependencies:
+            if dependency not in self.tasks:
+                raise ValueError('{} depends on {}, which has to be added before it.'.format(name, dependency))
+        self.tasks[name] = Task(name, function, dependencies)
+        return self.tasks[name]
+
+    def run_task(self, task):
+        task.start_time = time.time()
+        try:
+            task.result = task.function(*[self.tasks[dependency].result for dependency in task.dependencies])
+            task.status = DONE
+        except BaseException as error:
+            # SystemExit included, since losing permissions exits from deep inside the Google API helpers
+            task.error = error
+            task.traceback = traceback.format_exc()
+            task.status = FAILED
+        finally:
+            task.end_time = time.time()
+
+    def get_ready_tasks(self):
+        ready_tasks = []
+        for task in self.tasks.values():
+            if task.status != PENDING:
+                continue
+            dependency_statuses = [self.tasks[dependency].status for dependency in task.dependencies]
+            if FAILED in dependency_statuses or SKIPPED in dependency_statuses:
+                task.status = SKIPPED
+            elif all(status == DONE for status in dependency_statuses):
+                ready_tasks.append(task)
+        return ready_tasks
+
+    def run(self):
+        """Runs every task, starting each one as soon as its dependencies are done.
+
+        Returns:
+            bool, whether every task succeeded.
+        """
+        self.start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='task') as executor:
+            futures = set()
+            while True:
+                # tasks are marked as skipped here, which can make their own dependents skippable
+                ready_tasks = self.get_ready_tasks()
+                while ready_tasks:
+                    for task in ready_tasks:
+                        task.status = RUNNING
+                        futures.add(executor.submit(self.run_task, task))
+                    ready_tasks = self.get_ready_tasks()
+                if not futures:
+                    break
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        self.end_time = time.time()
+        return self.succeeded()
+
+    def succeeded(self):
+        return all(task.status == DONE for task in self.tasks.values())
+
+    def get_result(self, name):
+        return self.tasks[name].result
+
+    def report(self):
+        lines = ['{:<20} {:<8} {:>9}'.format('Task', 'Status', 'Seconds')]
+        for task in self.tasks.values():
+            elapsed_time = task.get_elapsed_time()
+            lines.append('{:<20} {:<8} {:>9}'.format(task.name, task.status,
+                                                     '' if elapsed_time is None else '{:.2f}'.format(elapsed_time)))
+        total_time = sum(task.get_elapsed_time() or 0 for task in self.tasks.values())
+        lines.append('{} of {} tasks succeeded in {:.2f} seconds ({:.2f} seconds one after another).'.format(
+            sum(task.status == DONE for task in self.tasks.values()), len(self.tasks),
+            (self.end_time or time.time()) - (self.start_time or time.time()), total_time))
+        for task in self.tasks.values():
+            if task.status == FAILED:
+                lines.append('\n{} failed:\n{}'.format(task.name, task.traceback.rstrip()))
+        return '\n'.join(lines)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the tests run against the in-memory fake of Sheets and Drive, which has to be picked before config is imported
+os.environ['TT_AUTOMATION_ENV'] = 'fake'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,100 @@
+import pytest
+
+import excel_functions
+import rating_engine
+
+def baseline_rating_calc(higher_rating, lower_rating, higher_rating_is_winner):
+    # ResultSheet.rating_calc as it was before the lookup tables, kept to check the tables against
+    difference = higher_rating - lower_rating
+    rating_increment = 25
+    min_rating_threshold = 13
+    max_rating_threshold = min_rating_threshold + rating_increment * 9 + 1
+
+    if higher_rating_is_winner == 'tied':
+        return 0
+    elif higher_rating_is_winner:
+        point_change = 8
+        if 138 <= difference < 188:
+            return 2
+        elif 188 <= difference < 238:
+            return 1
+        elif difference >= 238:
+            return 0
+        for difference_threshold in range(min_rating_threshold, 139, rating_increment):
+            if difference < difference_threshold:
+                return point_change
+            else:
+                point_change -= 1
+    else:
+        point_change = -20
+        if difference < 13:
+            return -8
+        elif 13 <= difference < 38:
+            return -10
+        elif 38 <= difference < 63:
+            return -13
+        elif 63 <= difference < 88:
+            return -16
+        for difference_threshold in range(113, max_rating_threshold, rating_increment):
+            if difference < difference_threshold:
+                return point_change
+            else:
+                point_change -= 5
+    return point_change
+
+BRACKET_BOUNDARIES = sorted(set(rating_engine.expected_difference_thresholds +
+                                rating_engine.upset_difference_thresholds))
+
+@pytest.mark.parametrize('is_winner', [True, False, 'tied'])
+@pytest.mark.parametrize('difference', sorted(set(
+    [0, 500, 1000] + [boundary + offset for boundary in BRACKET_BOUNDARIES for offset in (-1, 0, 1)])))
+def test_rating_calc_matches_the_baseline_at_the_bracket_boundaries(difference, is_winner):
+    assert rating_engine.rating_calc(1500 + difference, 1500, is_winner) == \
+        baseline_rating_calc(1500 + difference, 1500, is_winner)
+
+@pytest.mark.parametrize('is_winner', [True, False])
+def test_rating_calc_matches_the_baseline_for_every_difference(is_winner):
+    # an adjusted rating can put the lower seed ahead, so the difference can be negative
+    for difference in range(-300, 400):
+        assert rating_engine.rating_calc(1000 + difference, 1000, is_winner) == \
+            baseline_rating_calc(1000 + difference, 1000, is_winner), difference
+
+@pytest.mark.parametrize('difference, expected, upset', [
+    (0, 8, -8), (12, 8, -8), (13, 7, -10), (37, 7, -10), (38, 6, -13), (62, 6, -13), (63, 5, -16), (87, 5, -16),
+    (88, 4, -20), (112, 4, -20), (113, 3, -25), (137, 3, -25), (138, 2, -30), (162, 2, -30), (163, 2, -35),
+    (187, 2, -35), (188, 1, -40), (212, 1, -40), (213, 1, -45), (237, 1, -45), (238, 0, -50), (1000, 0, -50)])
+def test_rating_calc_brackets(difference, expected, upset):
+    assert rating_engine.rating_calc(1200 + difference, 1200, True) == expected
+    assert rating_engine.rating_calc(1200 + difference, 1200, False) == upset
+
+def get_group(ratings):
+    group = excel_functions.Group(group_num=1, num_players=len(ratings))
+    for index, rating in enumerate(ratings):
+        group.players.append(excel_functions.Player(player_name='Player {}'.format(index + 1), player_rating=rating))
+    group.sort_ratings(0)
+    return group
+
+def test_compute_group_recalculates_from_adjusted_ratings():
+    # C beats A and B, gaining 40 + 20 points, so C is adjusted to 1360 and every match is worked out again
+    group = get_group([1500, 1400, 1300])
+    result = rating_engine.compute_group(group, ['1:3', '0:3', '3:1'])
+    player_a, player_b, player_c = group.sorted_players
+    assert [match.point_change for match in result.match_results] == [-30, -13, 4]
+    assert [player.player_rating for player in group.sorted_players] == [[1500, 1500], [1400, 1400], [1300, 1360]]
+    assert [player.final_rating for player in group.sorted_players] == [1474, 1383, 1403]
+    assert [player.matches_won for player in group.sorted_players] == [1, 0, 2]
+    assert [player.games_won for player in group.sorted_players] == [4, 1, 6]
+    assert [[player.player_name for player in players] for players in result.match_winner] == \
+        [[player_c.player_name], [player_a.player_name], [player_b.player_name]]
+
+def test_compute_group_without_an_adjustment():
+    group = get_group([1500, 1400, 1300])
+    result = rating_engine.compute_group(group, ['3:0', '3:1', '3:2'])
+    assert [match.point_change for match in result.match_results] == [1, 4, 4]
+    assert [player.final_rating for player in group.sorted_players] == [1505, 1400, 1295]
+
+def test_unplayed_matches_change_nothing():
+    group = get_group([1500, 1400, 1300, 1200])
+    result = rating_engine.compute_group(group, ['0:0'] * 6)
+    assert [match.point_change for match in result.match_results] == [0] * 6
+    assert [player.final_rating for player in group.sorted_players] == [1500, 1400, 1300, 1200]
@@ -0,0 +1,88 @@
+import bisect
+import random
+
+import pytest
+
+from google_sheets_functions import RatingsRanking
+from skip_list import IndexableSkipList
+
+def get_roster(ratings):
+    return [[i + 1 for i in range(len(ratings))], ['p{}'.format(i) for i in range(len(ratings))], ratings]
+
+def get_full_rewrite(roster, updates):
+    # the whole sheet sorted again, the way it was written before the ranking was kept up to date incrementally
+    ratings = dict(zip(roster[1], roster[2]))
+    for name, rating in updates:
+        ratings[name] = rating
+    return [[str(rank), name, str(rating)] for rank, (name, rating)
+            in enumerate(sorted(ratings.items(), key=lambda item: -item[1]), 1)]
+
+def apply_changed_row_ranges(roster, ranking):
+    rows = [[str(roster[0][i]), roster[1][i], str(roster[2][i])] for i in range(len(roster[0]))]
+    for start_index, row_data in ranking.get_changed_row_ranges():
+        rows[start_index:start_index + len(row_data)] = [[str(element) for element in row] for row in row_data]
+    return rows
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_updates_match_a_full_rewrite(seed):
+    rng = random.Random(seed)
+    roster = get_roster(sorted((rng.randint(0, 2500) for _ in range(rng.randint(0, 80))), reverse=True))
+    ranking = RatingsRanking(roster if roster[0] else None)
+    updates = []
+    for _ in range(rng.randint(0, 30)):
+        # mostly players already on the sheet, sometimes a new one, and sometimes a rating that doesn't change
+        name = 'p{}'.format(rng.randint(0, len(roster[0]) + 10))
+        rating = rng.choice([rng.randint(0, 2500), rng.choice(roster[2] or [1000])])
+        updates.append((name, rating))
+        ranking.update(name, rating)
+
+    expected_rows = get_full_rewrite(roster, updates)
+    assert [[str(element) for element in row] for row in ranking.get_rows()] == expected_rows
+    assert len(ranking) == len(expected_rows)
+    assert apply_changed_row_ranges(roster, ranking) == expected_rows
+
+def test_only_the_rows_between_the_old_and_new_rank_change():
+    roster = get_roster([2000, 1900, 1800, 1700, 1600, 1500])
+    ranking = RatingsRanking(roster)
+    ranking.update('p4', 1850)
+    assert ranking.get_changed_row_ranges() == [(2, [[3, 'p4', 1850], [4, 'p2', 1800], [5, 'p3', 1700]])]
+
+def test_changed_row_ranges_leave_out_rows_that_end_up_the_same():
+    roster = get_roster([2000, 1900, 1800])
+    ranking = RatingsRanking(roster)
+    ranking.update('p2', 2100)
+    ranking.update('p2', 1800)
+    assert ranking.get_changed_row_ranges() == []
+
+def test_new_players_are_added_after_players_with_the_same_rating():
+    ranking = RatingsRanking(get_roster([2000, 1500]))
+    ranking.update('new', 1500)
+    assert ranking.get_changed_row_ranges() == [(2, [[3, 'new', 1500]])]
+
+def test_a_sheet_out_of_order_is_rewritten():
+    roster = get_roster([1500, 2000])
+    ranking = RatingsRanking(roster)
+    assert ranking.get_changed_row_ranges() == [(0, [[1, 'p1', 2000], [2, 'p0', 1500]])]
+
+def test_skip_list_matches_a_sorted_list():
+    rng = random.Random(0)
+    keys = [(rng.randint(0, 20), i) for i in range(200)]
+    skip_list = IndexableSkipList(keys)
+    expected = sorted(keys)
+    for _ in range(2000):
+        if expected and rng.random() < 0.5:
+            key = rng.choice(expected)
+            assert skip_list.remove(key) == bisect.bisect_left(expected, key)
+            expected.remove(key)
+        else:
+            key = (rng.randint(0, 20), rng.randint(0, 400))
+            assert skip_list.insert(key) == bisect.bisect_right(expected, key)
+            bisect.insort(expected, key)
+        start = rng.randint(0, len(expected))
+        assert list(skip_list.iterate(start, start + 5)) == expected[start:start + 5]
+    assert list(skip_list) == expected
+    assert len(skip_list) == len(expected)
+
+def test_skip_list_raises_key_error_for_missing_keys():
+    with pytest.raises(KeyError):
+        IndexableSkipList([1, 2, 3]).remove(4)
@@ -0,0 +1,135 @@
+import pytest
+
+import fake_google_backend
+import google_sheets_functions
+import sheets_mirror
+
+RATINGS_SPREADSHEET_ID = google_sheets_functions.RATINGS_SPREADSHEET_ID
+PRIZE_POINTS_SPREADSHEET_ID = google_sheets_functions.PRIZE_POINTS_SPREADSHEET_ID
+SHEET_NAME = 'Fall 2023'
+PRIZE_POINTS_SHEET_NAME = '2023-2024'
+ROSTER = [['Rank', 'Name', 'Current Rating'], ['1', 'Alice A', '1700'], ['2', 'Bob B', '1500'],
+          ['3', 'Cat C', '1200']]
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    backend = fake_google_backend.get_backend()
+    monkeypatch.setattr(backend, 'latency', 0)
+    monkeypatch.setattr(backend, 'error_rate', 0)
+    fake_google_backend.reset()
+    monkeypatch.setattr(sheets_mirror, 'mirror', sheets_mirror.SheetsMirror(':memory:'))
+    monkeypatch.setattr(google_sheets_functions, 'sheet_metadata_cache', google_sheets_functions.SheetMetadataCache())
+    backend.set_values(RATINGS_SPREADSHEET_ID, '{}!A1:C4'.format(SHEET_NAME), ROSTER)
+    return backend
+
+@pytest.fixture
+def service(backend):
+    service = google_sheets_functions.create_service()
+    google_sheets_functions.sync_mirror(service, SHEET_NAME, PRIZE_POINTS_SHEET_NAME)
+    return service
+
+def save_ratings(ratings):
+    league_roster = sheets_mirror.get_mirror().get_values(RATINGS_SPREADSHEET_ID, SHEET_NAME)
+    google_sheets_functions.save_ratings_changes(SHEET_NAME, league_roster, ratings)
+
+def get_sheet(backend):
+    return backend.get_sheet_values(RATINGS_SPREADSHEET_ID, SHEET_NAME)
+
+def run_main(argv):
+    with pytest.raises(SystemExit) as exit_info:
+        sheets_mirror.main(argv)
+    return exit_info.value.code
+
+def test_changes_wait_in_the_outbox_until_pushed(backend, service):
+    save_ratings({'Alice A': 1700, 'Bob B': 1530, 'Dan D': 1400})
+    mirror = sheets_mirror.get_mirror()
+    assert len(mirror.get_changes()) == 1
+    # the local copy has the change straight away, while the sheet doesn't until it's pushed
+    assert mirror.get_values(RATINGS_SPREADSHEET_ID, SHEET_NAME) == [['1', '2', '3', '4'],
+                                                                       ['Alice A', 'Bob B', 'Dan D', 'Cat C'],
+                                                                       ['1700', '1530', '1400', '1200']]
+    assert get_sheet(backend) == ROSTER
+
+    assert google_sheets_functions.push_changes(service) == 1
+    assert get_sheet(backend) == [ROSTER[0], ['1', 'Alice A', '1700'], ['2', 'Bob B', '1530'],
+                                  ['3', 'Dan D', '1400'], ['4', 'Cat C', '1200']]
+    assert mirror.get_changes() == []
+    assert mirror.get_values(RATINGS_SPREADSHEET_ID, SHEET_NAME) == \
+        google_sheets_functions.read_ratings_values(service, SHEET_NAME)
+
+def test_changes_for_the_same_sheet_are_pushed_together(backend, service):
+    save_ratings({'Bob B': 1530})
+    save_ratings({'Bob B': 1560, 'Cat C': 1250})
+    assert google_sheets_functions.push_changes(service) == 2
+    assert get_sheet(backend) == [ROSTER[0], ['1', 'Alice A', '1700'], ['2', 'Bob B', '1560'],
+                                  ['3', 'Cat C', '1250']]
+
+def test_a_player_changed_on_the_sheet_is_a_conflict(backend, service):
+    save_ratings({'Bob B': 1530})
+    backend.set_values(RATINGS_SPREADSHEET_ID, '{}!C3'.format(SHEET_NAME), [['1111']])
+
+    with pytest.raises(sheets_mirror.ConflictError):
+        google_sheets_functions.push_changes(service)
+    assert get_sheet(backend)[2] == ['2', 'Bob B', '1111']
+    changes = sheets_mirror.get_mirror().get_changes()
+    assert len(changes) == 1
+    assert 'Bob B' in changes[0]['conflict']
+    # the conflict is reported and the run fails until it's resolved
+    assert run_main([]) == 1
+
+def test_a_change_that_matches_the_sheet_is_not_a_conflict(backend, service):
+    save_ratings({'Bob B': 1530})
+    backend.set_values(RATINGS_SPREADSHEET_ID, '{}!C3'.format(SHEET_NAME), [['1530']])
+    assert google_sheets_functions.push_changes(service) == 1
+
+def test_force_pushes_over_a_conflict(backend, service):
+    save_ratings({'Bob B': 1530})
+    backend.set_values(RATINGS_SPREADSHEET_ID, '{}!C3'.format(SHEET_NAME), [['1111']])
+    with pytest.raises(sheets_mirror.ConflictError):
+        google_sheets_functions.push_changes(service)
+
+    # pushing again without --force still holds it back
+    assert run_main(['--push']) == 1
+    assert get_sheet(backend)[2] == ['2', 'Bob B', '1111']
+    assert run_main(['--push', '--force']) == 0
+    assert get_sheet(backend)[2] == ['2', 'Bob B', '1530']
+    assert sheets_mirror.get_mirror().get_changes() == []
+
+def test_discard_drops_a_conflict_and_keeps_the_sheet(backend, service):
+    save_ratings({'Bob B': 1530})
+    backend.set_values(RATINGS_SPREADSHEET_ID, '{}!C3'.format(SHEET_NAME), [['1111']])
+    with pytest.raises(sheets_mirror.ConflictError):
+        google_sheets_functions.push_changes(service)
+
+    assert run_main(['--discard']) == 0
+    mirror = sheets_mirror.get_mirror()
+    assert mirror.get_changes() == []
+    assert get_sheet(backend)[2] == ['2', 'Bob B', '1111']
+    # the local copy the change was applied to is dropped too, so the next sync reads the sheet again
+    assert mirror.get_values(RATINGS_SPREADSHEET_ID, SHEET_NAME) is None
+    google_sheets_functions.sync_mirror(service, SHEET_NAME, PRIZE_POINTS_SHEET_NAME)
+    assert mirror.get_values(RATINGS_SPREADSHEET_ID, SHEET_NAME)[2][1] == '1111'
+
+def test_prize_points_are_pushed_and_checked_for_conflicts(backend, service):
+    mirror = sheets_mirror.get_mirror()
+    table = google_sheets_functions.prize_points_module.PrizePointsTable.from_sheet_values(
+        mirror.get_values(PRIZE_POINTS_SPREADSHEET_ID, PRIZE_POINTS_SHEET_NAME))
+    google_sheets_functions.save_prize_points_changes(PRIZE_POINTS_SHEET_NAME, table, ['Alice A', 'Bob B'], '9-10-23',
+                                                      {'Alice A': 10, 'Bob B': 8})
+    assert google_sheets_functions.push_changes(service) == 1
+    values = backend.get_sheet_values(PRIZE_POINTS_SPREADSHEET_ID, PRIZE_POINTS_SHEET_NAME)
+    assert values[0][4] == '9-10-23'
+    assert [(row[0], row[4]) for row in values[1:]] == [('Alice A', '10'), ('Bob B', '8')]
+
+    # entering the same league again after somebody changed its points on the sheet is held back
+    table = google_sheets_functions.prize_points_module.PrizePointsTable.from_sheet_values(
+        mirror.get_values(PRIZE_POINTS_SPREADSHEET_ID, PRIZE_POINTS_SHEET_NAME))
+    google_sheets_functions.save_prize_points_changes(PRIZE_POINTS_SHEET_NAME, table, ['Alice A', 'Bob B'], '9-10-23',
+                                                      {'Alice A': 10, 'Bob B': 6})
+    backend.set_values(PRIZE_POINTS_SPREADSHEET_ID, '{}!E3'.format(PRIZE_POINTS_SHEET_NAME), [['7']])
+    with pytest.raises(sheets_mirror.ConflictError):
+        google_sheets_functions.push_changes(service)
+    assert run_main(['--push', '--force']) == 0
+    values = backend.get_sheet_values(PRIZE_POINTS_SPREADSHEET_ID, PRIZE_POINTS_SHEET_NAME)
+    assert [(row[0], row[4]) for row in values[1:]] == [('Alice A', '10'), ('Bob B', '6')]